@@ -2,12 +2,25 @@
 
 '''Classes to handle FastCap 2D files'''
 
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import shutil
+import tempfile
 import matplotlib.pyplot as plt
 from matplotlib.collections import LineCollection
 import numpy as np
 import subprocess
 import re
 
+FASTERCAP_EXE = os.environ.get(
+    'FASTERCAP_EXE',
+    r'C:\Program Files (x86)\FastFieldSolvers\FasterCap\FasterCap.exe')
+FASTERCAP_ARGS = '-a0.01'
+
+# Segment files by absolute path: (mtime, size), names, (N, 4) array
+_segment_cache = {}
+
 
 class Segment():
     def __init__(self, name: str, x1: float, y1: float, x2: float, y2: float):
@@ -55,9 +68,12 @@ class Conductor():
         return f'C {self.file} {format_permittivity(self.outperm)} {self.xoffset} {self.yoffset}{" +" if self.merge else ""}'
 
     def get_segments(self):
-        segments = Segment.read_file(self.file)
-        offset_segments(segments, self.xoffset, self.yoffset)
-        return segments
+        return array_to_segments(self.get_segment_array(),
+                                 get_segment_names(self.file))
+
+    def get_segment_array(self):
+        offset = (self.xoffset, self.yoffset) * 2
+        return get_segment_array(self.file) + offset
 
     @classmethod
     def make_conductor(cls, statement: str):
@@ -98,9 +114,12 @@ class Dielectric():
         return f'D {self.file} {format_permittivity(self.outperm)} {format_permittivity(self.inperm)} {self.xoffset} {self.yoffset} {self.xref} {self.yref}{" -" if self.ref_is_inperm else ""}'
 
     def get_segments(self):
-        segments = Segment.read_file(self.file)
-        offset_segments(segments, self.xoffset, self.yoffset)
-        return segments
+        return array_to_segments(self.get_segment_array(),
+                                 get_segment_names(self.file))
+
+    def get_segment_array(self):
+        offset = (self.xoffset, self.yoffset) * 2
+        return get_segment_array(self.file) + offset
 
     @classmethod
     def make_dielectric(cls, statement: str):
@@ -125,7 +144,8 @@ def read_fastcap2d_file(filename: str):
     elements = {}
     with open(filename, 'r') as fn:
         # Discard first line
-        for line in fn.readlines()[1:]:
+        next(fn, None)
+        for line in fn:
             if line.startswith('*') or line.isspace():
                 continue
             elif line.startswith('S'):
@@ -142,6 +162,55 @@ def read_fastcap2d_file(filename: str):
     return elements
 
 
+def _load_segment_file(filename: str):
+    '''Cache entry of a segment file, parsed again only when it changes'''
+    path = os.path.abspath(filename)
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    entry = _segment_cache.get(path)
+    if entry is None or entry[0] != stamp:
+        names = []
+        values = []
+        with open(path, 'r') as fn:
+            # Discard first line
+            next(fn, None)
+            for line in fn:
+                if line.startswith('S'):
+                    tokens = line.split()
+                    if len(tokens) < 6:
+                        raise ValueError(
+                            'Invalid statement; insufficient values')
+                    names.append(tokens[1])
+                    values.append(tokens[2:6])
+        array = np.array(values, dtype='float64').reshape(-1, 4)
+        array.flags.writeable = False
+        entry = (stamp, names, array)
+        _segment_cache[path] = entry
+    return entry
+
+
+def get_segment_array(filename: str) -> np.ndarray:
+    '''Segments of a file as a read only (N, 4) array of x1, y1, x2, y2.
+    Files are parsed once and shared until their modification time changes'''
+    return _load_segment_file(filename)[2]
+
+
+def get_segment_names(filename: str) -> list:
+    return _load_segment_file(filename)[1]
+
+
+def segment_array(segments) -> np.ndarray:
+    '''Convert a list of Segment to an (N, 4) array of x1, y1, x2, y2'''
+    if isinstance(segments, np.ndarray):
+        return segments.reshape(-1, 4)
+    return np.array([[s.x1, s.y1, s.x2, s.y2] for s in segments],
+                    dtype='float64').reshape(-1, 4)
+
+
+def array_to_segments(array: np.ndarray, names) -> list:
+    return [Segment(name, *row) for name, row in zip(names, array.tolist())]
+
+
 def parse_permittivity(text: str):
     '''FastCap format is 4.0-j3.016e6, Python needs 4.0-3.016e6j'''
     if 'j' in text:
@@ -207,14 +276,16 @@ def save_list_file(filename: str, elements, description: str = ''):
 
 
 def plot_segments(ax, segments, color='b', ls='solid'):
-    segs = np.array([[[s.x1, s.y1], [s.x2, s.y2]] for s in segments])
+    '''Plot a list of Segment or an (N, 4) array'''
+    segs = segment_array(segments).reshape(-1, 2, 2)
     lines = LineCollection(segs, colors=color, ls=ls)
     ax.add_collection(lines)
 
 
 def plot_label(ax, segments, text, color='b'):
-    x = min([min(s.x1, s.x2) for s in segments])
-    y = max([max(s.y1, s.y2) for s in segments])
+    segs = segment_array(segments)
+    x = segs[:, 0::2].min()
+    y = segs[:, 1::2].max()
     ax.text(x, y, text, color=color, ha='left', va='bottom')
 
 
@@ -222,7 +293,7 @@ def plot_conductors(ax, conductors, labels=True):
     cid = 1
     cid_sub = 'a'
     for conductor in conductors:
-        segments = conductor.get_segments()
+        segments = conductor.get_segment_array()
         text = f'C{cid}'
         if conductor.merge:
             # Split conductor, do not increment id, append a, b, c, etc.
@@ -245,7 +316,7 @@ def plot_conductors(ax, conductors, labels=True):
 
 def plot_dielectrics(ax, dielectrics, labels=True):
     for dielectric in dielectrics:
-        segments = dielectric.get_segments()
+        segments = dielectric.get_segment_array()
         plot_segments(ax, segments, color='r', ls='dotted')
         if labels:
             if dielectric.ref_is_inperm:
@@ -269,15 +340,23 @@ def plot_list_file(filename):
     return ax
 
 
-def run_fastercap(list_file: str,
-                  exe: str = r'C:\Program Files (x86)\FastFieldSolvers\FasterCap\FasterCap.exe'):
-    output = subprocess.run([exe, f'-b {list_file} -a0.01'],
+def run_fastercap(list_file: str, exe: str = None):
+    '''Run FasterCap on a list file and return the capacitance matrix.
+    The executable defaults to FASTERCAP_EXE, which may be set by the
+    environment variable of the same name'''
+    output = subprocess.run([exe or FASTERCAP_EXE,
+                             f'-b {list_file} {FASTERCAP_ARGS}'],
                             capture_output=True, text=True)
     if output.returncode != 0:
         raise RuntimeError(
             f'FasterCap exited with error code {output.returncode}')
-    last_iter = output.stdout.rfind('Iteration number #')
-    result = output.stdout[last_iter:]
+    return parse_fastercap_output(output.stdout)
+
+
+def parse_fastercap_output(stdout: str):
+    '''Capacitance matrix from the last iteration of FasterCap output'''
+    last_iter = stdout.rfind('Iteration number #')
+    result = stdout[last_iter:]
     dim = re.search(r"^Dimension (\d+) x (\d+)",
                     result, flags=re.MULTILINE)
     matrix_iter = re.finditer(r"^g(\d+)_\S+\s+(.+)",
@@ -292,6 +371,76 @@ def run_fastercap(list_file: str,
     return capacitance
 
 
+def list_file_hash(list_file: str, exe: str = None) -> str:
+    '''SHA-256 of a list file, the segment files it references, the solver
+    arguments and the solver executable, by its resolved path, size and
+    modification time, used as the key of the result cache'''
+    sha = hashlib.sha256(FASTERCAP_ARGS.encode())
+    exe = exe or FASTERCAP_EXE
+    exe = os.path.realpath(shutil.which(exe) or exe)
+    sha.update(exe.encode())
+    if os.path.exists(exe):
+        info = os.stat(exe)
+        sha.update(f'{info.st_size} {info.st_mtime_ns}'.encode())
+    with open(list_file, 'rb') as fn:
+        sha.update(fn.read())
+    elements = read_fastcap2d_file(list_file)
+    files = [e.file for e in elements.get('C', []) + elements.get('D', [])]
+    for file in dict.fromkeys(files):
+        sha.update(file.encode())
+        with open(file, 'rb') as fn:
+            sha.update(fn.read())
+    return sha.hexdigest()
+
+
+def run_fastercap_batch(list_files: list, exe: str = None,
+                        max_workers: int = None,
+                        cache_dir: str = None) -> list:
+    '''Run FasterCap on many list files, at most max_workers at a time
+    (default is the number of CPUs), returning a list of capacitance
+    matrices in the same order.
+
+    If cache_dir is given, results are cached there as <hash>.npy, keyed by
+    list_file_hash, so unchanged geometries are not solved again. Identical
+    geometries in a batch are solved once'''
+    keys = [list_file_hash(list_file, exe) for list_file in list_files]
+    results = {}
+    pending = {}
+    for list_file, key in zip(list_files, keys):
+        if key in results or key in pending:
+            continue
+        cache_file = cache_dir and os.path.join(cache_dir, key + '.npy')
+        if cache_file and os.path.exists(cache_file):
+            results[key] = np.load(cache_file)
+        else:
+            pending[key] = list_file
+    if pending:
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        # Threads are sufficient, each one waits on its own solver process
+        with ThreadPoolExecutor(max_workers or os.cpu_count()) as pool:
+            futures = {key: pool.submit(run_fastercap, list_file, exe)
+                       for key, list_file in pending.items()}
+            for key, future in futures.items():
+                results[key] = future.result()
+                if cache_dir:
+                    _save_cache(cache_dir, key, results[key])
+    return [results[key] for key in keys]
+
+
+def _save_cache(cache_dir: str, key: str, capacitance: np.ndarray):
+    '''Save a result to the cache via a temporary file, so an interrupted
+    run cannot leave a truncated <hash>.npy behind'''
+    fd, temp = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as fn:
+            np.save(fn, capacitance)
+        os.replace(temp, os.path.join(cache_dir, key + '.npy'))
+    except BaseException:
+        os.remove(temp)
+        raise
+
+
 if __name__ == '__main__':
     print('FastCap2d')
     seg = Segment.make_segment('S inner_shell 0.098768907 0.015642989  0.095105938 0.030900818 ')
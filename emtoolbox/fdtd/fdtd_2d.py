@@ -13,8 +13,17 @@ eps0 = 8.8541878176e-12
 
 
 class Grid2D:
-    """FDTD 2D Grid, TM Formulation"""
-    def __init__(self, cellsize_x, width, length):
+    """FDTD 2D Grid, TM Formulation
+
+    With periodic, the grid is one period of width along x, the fields
+    wrapping around with no PML along x. A Floquet phase, the phase delay
+    kx * width per period, makes the fields complex
+    """
+    def __init__(self, cellsize_x, width, length, periodic=False, phase=0.0):
+        if phase and not periodic:
+            raise Exception('Floquet phase requires a periodic grid')
+        self.periodic = periodic
+        self.phase = phase
         self.cellsize_x = cellsize_x
         self.cellsize_y = cellsize_x    # Square cells
         self.x = np.arange(0.0, width, self.cellsize_x)
@@ -24,13 +33,14 @@ class Grid2D:
         self.scattered_boundary = 7
         self.dt = min(self.cellsize_x, self.cellsize_y) / (2 * 3e8)
 
-        self.dz = np.zeros((self.ndx, self.ndy))
-        self.ez = np.zeros((self.ndx, self.ndy))
-        self.iz = np.zeros((self.ndx, self.ndy))
-        self.hx = np.zeros((self.ndx, self.ndy))
-        self.hy = np.zeros((self.ndx, self.ndy))
-        self.ihx = np.zeros((self.ndx, self.ndy))
-        self.ihy = np.zeros((self.ndx, self.ndy))
+        dtype = complex if phase else float
+        self.dz = np.zeros((self.ndx, self.ndy), dtype=dtype)
+        self.ez = np.zeros((self.ndx, self.ndy), dtype=dtype)
+        self.iz = np.zeros((self.ndx, self.ndy), dtype=dtype)
+        self.hx = np.zeros((self.ndx, self.ndy), dtype=dtype)
+        self.hy = np.zeros((self.ndx, self.ndy), dtype=dtype)
+        self.ihx = np.zeros((self.ndx, self.ndy), dtype=dtype)
+        self.ihy = np.zeros((self.ndx, self.ndy), dtype=dtype)
 
         self.ez_inc = np.zeros(self.ndy)
         self.hx_inc = np.zeros(self.ndy)
@@ -69,17 +79,19 @@ class Grid2D:
             xd = npml
             xxn = xnum / xd
             xn = 0.33 * (xxn ** 3)
-            self.gi2[n] = self.gi2[-1-n] = 1.0 / (1.0 + xn)
-            self.gi3[n] = self.gi3[-1-n] = (1.0 - xn) / (1.0 + xn)
+            if not self.periodic:
+                self.gi2[n] = self.gi2[-1-n] = 1.0 / (1.0 + xn)
+                self.gi3[n] = self.gi3[-1-n] = (1.0 - xn) / (1.0 + xn)
 
             self.gj2[n] = self.gj2[-1-n] = 1.0 / (1.0 + xn)
             self.gj3[n] = self.gj3[-1-n] = (1.0 - xn) / (1.0 + xn)
 
             xxn = (xnum - 0.5) / xd
             xn = 0.33 * (xxn ** 3)
-            self.fi1[n] = self.fi1[-2-n] = xn
-            self.fi2[n] = self.fi2[-2-n] = 1.0 / (1.0 + xn)
-            self.fi3[n] = self.fi3[-2-n] = (1.0 - xn) / (1.0 + xn)
+            if not self.periodic:
+                self.fi1[n] = self.fi1[-2-n] = xn
+                self.fi2[n] = self.fi2[-2-n] = 1.0 / (1.0 + xn)
+                self.fi3[n] = self.fi3[-2-n] = (1.0 - xn) / (1.0 + xn)
 
             self.fj1[n] = self.fj1[-2-n] = xn
             self.fj2[n] = self.fj2[-2-n] = 1.0 / (1.0 + xn)
@@ -89,35 +101,55 @@ class Grid2D:
         self.ga[P] = 1.0 / (er + (cond * self.dt / eps0))
         self.gb[P] = cond * self.dt / eps0
 
+    def neighbour(self, field, step):
+        """field at i + step for step 1 or -1, wrapping around along x,
+        past the last column with the Floquet phase delay and before the
+        first with the advance"""
+        result = np.roll(field, -step, axis=0)
+        if self.phase:
+            result[0 if step < 0 else -1] *= np.exp(-1j * step * self.phase)
+        return result
+
     def update_dz(self):
-        self.dz[1:, 1:] =   self.gi3[1:] * self.gj3[1:] * self.dz[1:, 1:] + \
-                            self.gi2[1:] * self.gj2[1:] * 0.5 * \
-                                (self.hy[1:, 1:] - self.hy[:-1, 1:] - \
-                                 self.hx[1:, 1:] + self.hx[1:, :-1])
+        i = slice(None) if self.periodic else slice(1, None)
+        gi3 = self.gi3[i, np.newaxis]
+        gi2 = self.gi2[i, np.newaxis]
+        hy_prev = self.neighbour(self.hy, -1)
+        self.dz[i, 1:] =    gi3 * self.gj3[1:] * self.dz[i, 1:] + \
+                            gi2 * self.gj2[1:] * 0.5 * \
+                                (self.hy[i, 1:] - hy_prev[i, 1:] - \
+                                 self.hx[i, 1:] + self.hx[i, :-1])
         n = self.scattered_boundary
-        self.dz[n:-n-1, n] += 0.5 * self.hx_inc[n-1]
-        self.dz[n:-n-1, -n-1] -= 0.5 * self.hx_inc[-n-2]
+        i = slice(None) if self.periodic else slice(n, -n-1)
+        self.dz[i, n] += 0.5 * self.hx_inc[n-1]
+        self.dz[i, -n-1] -= 0.5 * self.hx_inc[-n-2]
 
     def update_ez(self):
         self.ez = self.ga * (self.dz - self.iz)
         self.iz = self.iz + self.gb * self.ez
 
     def update_hx(self):
-        curl_e = self.ez[:-1, :-1] - self.ez[:-1, 1:]
-        self.ihx[:-1, :-1] = self.ihx[:-1, :-1] + curl_e
-        self.hx[:-1, :-1] = self.fj3[:-1] * self.hx[:-1, :-1] + \
-                            self.fj2[:-1] * \
-                                (0.5 * curl_e + self.fi1[:-1] * self.ihx[:-1, :-1])
+        i = slice(None) if self.periodic else slice(None, -1)
+        curl_e = self.ez[i, :-1] - self.ez[i, 1:]
+        self.ihx[i, :-1] = self.ihx[i, :-1] + curl_e
+        self.hx[i, :-1] =   self.fj3[:-1] * self.hx[i, :-1] + \
+                            self.fj2[:-1] * (0.5 * curl_e + \
+                                self.fi1[i, np.newaxis] * self.ihx[i, :-1])
         n = self.scattered_boundary
-        self.hx[n:-n-1, n-1] += 0.5 * self.ez_inc[n]
-        self.hx[n:-n-1, -n-1] -= 0.5 * self.ez_inc[-n-1]
+        i = slice(None) if self.periodic else slice(n, -n-1)
+        self.hx[i, n-1] += 0.5 * self.ez_inc[n]
+        self.hx[i, -n-1] -= 0.5 * self.ez_inc[-n-1]
 
     def update_hy(self):
-        curl_e = self.ez[:-1, :-1] - self.ez[1:, :-1]
-        self.ihy[:-1, :-1] = self.ihy[:-1, :-1] + curl_e
-        self.hy[:-1, :-1] = self.fi3[:-1] * self.hy[:-1, :-1] - \
-                            self.fi2[:-1] * \
-                                (0.5 * curl_e + self.fj1[:-1] * self.ihy[:-1, :-1])
+        i = slice(None) if self.periodic else slice(None, -1)
+        ez_next = self.neighbour(self.ez, 1)
+        curl_e = self.ez[i, :-1] - ez_next[i, :-1]
+        self.ihy[i, :-1] = self.ihy[i, :-1] + curl_e
+        self.hy[i, :-1] =   self.fi3[i, np.newaxis] * self.hy[i, :-1] - \
+                            self.fi2[i, np.newaxis] * \
+                                (0.5 * curl_e + self.fj1[:-1] * self.ihy[i, :-1])
+        if self.periodic:
+            return
         n = self.scattered_boundary
         self.hy[n-1, n:-n-1] -= 0.5 * self.ez_inc[n:-n-1]
         self.hy[-n-2, n:-n-1] += 0.5 * self.ez_inc[n:-n-1]
@@ -134,7 +166,7 @@ class Grid2D:
         frame_ids = np.linspace(0, len(self.t) - 1,
                                 int(n_frames), dtype='int64')
         for probe in self.probes:
-            probe.data = np.zeros(len(self.t))
+            probe.data = np.zeros(len(self.t), dtype=self.ez.dtype)
 
         abc_left = [0, 0]
         abc_right = [0, 0]
@@ -186,6 +218,8 @@ class Grid2D:
 
     def add_plane_source(self, source):
         # Propagating in y-direction
+        if self.phase:
+            raise Exception('Plane sources require a zero Floquet phase')
         source.idx = np.searchsorted(self.y, source.position)
         self.plane_sources.append(source)
 
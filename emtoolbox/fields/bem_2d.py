@@ -0,0 +1,424 @@
+#!/usr/bin/python3
+
+'''Two-dimensional boundary element method for capacitance extraction.
+
+Consumes the same conductor and dielectric descriptions as FastCap 2D,
+see emtoolbox.external.fastcap2d. The surfaces are discretized into the
+straight panels given by the segment files, with a constant total
+(free plus polarization) charge density on each panel.
+
+Conductor panels enforce the conductor potential at the panel midpoint.
+Dielectric panels enforce continuity of the normal electric flux density.
+The potential at infinity is left floating, with a zero net charge
+constraint, so the result is the Maxwell capacitance matrix per unit length
+with zero row sums, as reported by FasterCap.
+'''
+
+import functools
+import numpy as np
+from scipy.special import xlogy
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import LinearOperator, gmres
+import emtoolbox.external.fastcap2d as fc
+try:
+    from emtoolbox.utils.constants import EPS0
+except ImportError:
+    EPS0 = 8.854e-12
+
+
+class Panels():
+    '''Flat arrays describing every panel of a 2D geometry'''
+    def __init__(self, conductors: list, dielectrics: list = ()):
+        segs = []
+        self.conductor = []     # Conductor id, -1 for dielectric panels
+        self.outperm = []       # Permittivity around conductor panels
+        self.perm_pos = []      # Permittivity on the normal side
+        self.perm_neg = []      # Permittivity opposite the normal side
+        cid = 0
+        for conductor in conductors:
+            segments = conductor.get_segment_array()
+            segs.append(segments)
+            n = len(segments)
+            self.conductor.extend([cid] * n)
+            self.outperm.extend([conductor.outperm] * n)
+            self.perm_pos.extend([conductor.outperm] * n)
+            self.perm_neg.extend([conductor.outperm] * n)
+            if not conductor.merge:
+                cid += 1
+        if len(conductors) > 0 and conductors[-1].merge:
+            cid += 1  # Dangling merge, close the last conductor
+        self.n_conductors = cid
+        for dielectric in dielectrics:
+            segments = dielectric.get_segment_array()
+            segs.append(segments)
+            n = len(segments)
+            # The reference point lies on the outperm side, unless flagged
+            mid = 0.5 * (segments[:, 0:2] + segments[:, 2:4])
+            normal = segment_normals(segments)
+            ref = np.array([dielectric.xref, dielectric.yref])
+            ref_side = np.sum((ref - mid) * normal, axis=1) > 0
+            if dielectric.ref_is_inperm:
+                ref_perm, other_perm = dielectric.inperm, dielectric.outperm
+            else:
+                ref_perm, other_perm = dielectric.outperm, dielectric.inperm
+            self.conductor.extend([-1] * n)
+            self.outperm.extend([0.0] * n)
+            self.perm_pos.extend(np.where(ref_side, ref_perm, other_perm))
+            self.perm_neg.extend(np.where(ref_side, other_perm, ref_perm))
+        if cid == 0:
+            raise ValueError('Geometry has no conductors')
+        segments = np.concatenate(segs)
+        self.start = segments[:, 0:2]
+        self.end = segments[:, 2:4]
+        self.mid = 0.5 * (self.start + self.end)
+        self.length = np.hypot(*(self.end - self.start).T)
+        if np.any(self.length == 0):
+            raise ValueError('Geometry has zero length segments')
+        self.tangent = (self.end - self.start) / self.length[:, np.newaxis]
+        self.normal = segment_normals(segments)
+        self.conductor = np.array(self.conductor)
+        self.outperm = np.array(self.outperm)
+        self.perm_pos = np.array(self.perm_pos)
+        self.perm_neg = np.array(self.perm_neg)
+        # Length scale of the log kernel, above the logarithmic capacity
+        # of the geometry keeps the unbordered panel matrix nonsingular
+        extent = np.ptp(segments.reshape(-1, 2), axis=0).max()
+        self.scale = 2 * extent if extent > 0 else 1.0
+
+    def __len__(self):
+        return len(self.length)
+
+    @property
+    def is_conductor(self):
+        return self.conductor >= 0
+
+
+def segment_normals(segments: np.ndarray) -> np.ndarray:
+    '''Unit normals, the segment direction rotated clockwise'''
+    d = segments[:, 2:4] - segments[:, 0:2]
+    n = np.stack((d[:, 1], -d[:, 0]), axis=1)
+    return n / np.hypot(n[:, 0], n[:, 1])[:, np.newaxis]
+
+
+def _local_coordinates(panels, rows, cols):
+    '''Collocation points of rows in the frame of each panel of cols.
+    Returns u (along tangent, from panel start) and v (along normal)'''
+    d = panels.mid[rows, np.newaxis, :] - panels.start[np.newaxis, cols, :]
+    u = np.einsum('ijk,jk->ij', d, panels.tangent[cols])
+    v = np.einsum('ijk,jk->ij', d, panels.normal[cols])
+    return u, v
+
+
+def _log_integral(u, v, length):
+    '''Integral of -ln(r) over a panel of the given length'''
+    def primitive(w):
+        # Integral of ln(sqrt(w^2 + v^2)) dw
+        return (0.5 * xlogy(w, w**2 + v**2) - w +
+                np.abs(v) * np.arctan2(w, np.abs(v)))
+    return primitive(u - length) - primitive(u)
+
+
+@functools.lru_cache()
+def _gauss_legendre(order: int):
+    return np.polynomial.legendre.leggauss(order)
+
+
+def _flux_integral(panels, rows, cols, order=4):
+    '''Flux through each panel of rows due to a unit charge density on each
+    panel of cols, through Gauss-Legendre quadrature over the source panel.
+    The flux of a line charge through a panel is the angle it subtends.'''
+    xg, wg = _gauss_legendre(order)
+    start = panels.start[rows, np.newaxis, :]
+    tangent = panels.tangent[rows]
+    normal = panels.normal[rows]
+    length = panels.length[rows, np.newaxis]
+    flux = 0.0
+    for x, w in zip(xg, wg):
+        offset = 0.5 * x * panels.length[cols, np.newaxis]
+        src = panels.mid[cols] + offset * panels.tangent[cols]
+        d = src[np.newaxis, :, :] - start
+        u = np.einsum('ijk,ik->ij', d, tangent)
+        v = np.einsum('ijk,ik->ij', d, normal)
+        angle = np.arctan2(length * v, u * (u - length) + v**2)
+        flux = flux - 0.5 * w * panels.length[np.newaxis, cols] * angle
+    return flux
+
+
+def panel_matrix(panels: Panels, rows=None, cols=None) -> np.ndarray:
+    '''Block of the panel interaction matrix.
+
+    Unknowns are the panel charge densities normalized by 2 pi EPS0.
+    Conductor rows give the potential at the panel midpoint, relative to
+    a point at distance panels.scale from a unit charge, dielectric rows
+    give the jump of normal flux density averaged over the panel,
+    which must vanish'''
+    rows = np.arange(len(panels)) if rows is None else np.asarray(rows)
+    cols = np.arange(len(panels)) if cols is None else np.asarray(cols)
+    is_cond = panels.is_conductor[rows]
+    A = np.empty((len(rows), len(cols)),
+                 dtype=np.result_type(panels.perm_pos, float))
+    if np.any(is_cond):
+        u, v = _local_coordinates(panels, rows[is_cond], cols)
+        length = panels.length[np.newaxis, cols]
+        A[is_cond] = (_log_integral(u, v, length) +
+                      length * np.log(panels.scale))
+    is_diel = ~is_cond
+    if np.any(is_diel):
+        r = rows[is_diel]
+        # Normal field averaged over the observation panel
+        en = _flux_integral(panels, r, cols) / panels.length[r, np.newaxis]
+        # Principal value; the self panel contributes only the jump term
+        self_term = r[:, np.newaxis] == cols[np.newaxis, :]
+        en[self_term] = 0.0
+        e_pos = panels.perm_pos[r][:, np.newaxis]
+        e_neg = panels.perm_neg[r][:, np.newaxis]
+        A[is_diel] = ((e_pos - e_neg) * en +
+                      (e_pos + e_neg) * np.pi * self_term)
+    return A
+
+
+def system_matrix(panels: Panels) -> np.ndarray:
+    '''Panel matrix bordered by the floating reference potential
+    and the zero net charge constraint'''
+    N = len(panels)
+    A = np.zeros((N + 1, N + 1), dtype=np.result_type(panels.perm_pos, float))
+    A[:N, :N] = panel_matrix(panels)
+    A[:N, N] = -1.0 * panels.is_conductor
+    A[N, :N] = panels.length
+    return A
+
+
+def system_rhs(panels: Panels) -> np.ndarray:
+    '''Right hand sides, one column per conductor excited at 1 V'''
+    N = len(panels)
+    rhs = np.zeros((N + 1, panels.n_conductors))
+    cond = panels.is_conductor
+    rhs[np.flatnonzero(cond), panels.conductor[cond]] = 1.0
+    return rhs
+
+
+def charge_to_capacitance(panels: Panels, q: np.ndarray) -> np.ndarray:
+    '''Sum free charge on each conductor, one column per excitation'''
+    cond = panels.is_conductor
+    free = (panels.outperm[cond] * panels.length[cond])[:, np.newaxis] * q[cond]
+    C = np.zeros((panels.n_conductors, q.shape[1]), dtype=free.dtype)
+    np.add.at(C, panels.conductor[cond], free)
+    return 2 * np.pi * EPS0 * C
+
+
+class _Cluster():
+    '''Binary tree of panels, split along the longest bounding box side'''
+    def __init__(self, panels: Panels, index: np.ndarray, leaf_size: int):
+        self.index = index
+        ends = np.concatenate((panels.start[index], panels.end[index]))
+        self.lo = ends.min(axis=0)
+        self.hi = ends.max(axis=0)
+        self.diameter = np.hypot(*(self.hi - self.lo))
+        self.children = []
+        if len(index) > leaf_size:
+            axis = np.argmax(self.hi - self.lo)
+            order = np.argsort(panels.mid[index, axis], kind='stable')
+            half = len(index) // 2
+            self.children = [_Cluster(panels, index[order[:half]], leaf_size),
+                             _Cluster(panels, index[order[half:]], leaf_size)]
+
+    def distance_to(self, other) -> float:
+        gap = np.maximum(0.0, np.maximum(self.lo - other.hi, other.lo - self.hi))
+        return np.hypot(*gap)
+
+
+def aca(panels: Panels, rows: np.ndarray, cols: np.ndarray,
+        tol: float = 1e-6, max_rank: int = None):
+    '''Adaptive cross approximation with partial pivoting.
+    Returns U, V with panel_matrix(panels, rows, cols) ~ U @ V,
+    or None if the block is not of low rank'''
+    m, n = len(rows), len(cols)
+    max_rank = max_rank or min(m, n) // 2
+    dtype = np.result_type(panels.perm_pos, float)
+    U = np.zeros((m, max_rank), dtype=dtype)
+    V = np.zeros((max_rank, n), dtype=dtype)
+    unused = np.ones(m, dtype=bool)
+    norm2 = 0.0
+    i = 0
+    for k in range(max_rank):
+        unused[i] = False
+        row = panel_matrix(panels, rows[i:i+1], cols)[0] - U[i, :k] @ V[:k]
+        j = np.argmax(np.abs(row))
+        if row[j] == 0:
+            if not np.any(unused):
+                return U[:, :k], V[:k]
+            i = np.flatnonzero(unused)[0]
+            continue
+        V[k] = row / row[j]
+        U[:, k] = panel_matrix(panels, rows, cols[j:j+1])[:, 0] - U[:, :k] @ V[:k, j]
+        uv = np.linalg.norm(U[:, k]) * np.linalg.norm(V[k])
+        norm2 += (uv**2 + 2 * np.sum(np.real(
+            (U[:, :k].conj().T @ U[:, k]) * (V[:k].conj() @ V[k]))))
+        if uv <= tol * np.sqrt(abs(norm2)) or not np.any(unused):
+            return U[:, :k+1], V[:k+1]
+        i = np.flatnonzero(unused)[np.argmax(np.abs(U[unused, k]))]
+    return None
+
+
+def _truncate(block: np.ndarray, tol: float):
+    '''Truncated SVD U @ V of a block, or None if it does not save storage'''
+    U, S, V = np.linalg.svd(block, full_matrices=False)
+    k = np.count_nonzero(S > tol * S[0]) if S[0] > 0 else 0
+    if k * sum(block.shape) >= block.size:
+        return None
+    return U[:, :k] * S[:k], V[:k]
+
+
+class HMatrix():
+    '''Hierarchical matrix approximation of the panel matrix.
+
+    Blocks between well separated clusters are compressed to low rank,
+    with a relative accuracy of tol; the rest are stored dense.
+    Blocks with more than aca_size entries use ACA, smaller ones are
+    evaluated and truncated by SVD. Storage and the cost of a product
+    grow as N log N.
+
+    The blocks are gathered into sparse matrices, near + U @ V, so that
+    products run in compiled code'''
+    def __init__(self, panels: Panels, leaf_size: int = 32,
+                 eta: float = 1.0, tol: float = 1e-8, aca_size: int = 16384,
+                 precond_size: int = 256):
+        self.shape = (len(panels), len(panels))
+        self.dtype = np.result_type(panels.perm_pos, float)
+        near = ([], [], [])
+        diagonal = ([], [], [])
+        u_data = ([], [], [])
+        v_data = ([], [], [])
+        rank = 0
+        root = _Cluster(panels, np.arange(len(panels)), leaf_size)
+        stack = [(root, root)]
+        while stack:
+            r, c = stack.pop()
+            block = None
+            if min(r.diameter, c.diameter) <= eta * r.distance_to(c):
+                if len(r.index) * len(c.index) > aca_size:
+                    uv = aca(panels, r.index, c.index, tol=tol)
+                else:
+                    block = panel_matrix(panels, r.index, c.index)
+                    uv = _truncate(block, tol)
+                if uv is not None:
+                    U, V = uv
+                    k = np.arange(rank, rank + U.shape[1])
+                    _append_block(u_data, r.index, k, U)
+                    _append_block(v_data, k, c.index, V)
+                    rank += U.shape[1]
+                    continue
+            if r.children and c.children:
+                stack.extend((rc, cc) for rc in r.children for cc in c.children)
+            elif r.children:
+                stack.extend((rc, c) for rc in r.children)
+            elif c.children:
+                stack.extend((r, cc) for cc in c.children)
+            else:
+                if block is None:
+                    block = panel_matrix(panels, r.index, c.index)
+                _append_block(near, r.index, c.index, block)
+        # Invert the diagonal blocks of the largest clusters within
+        # precond_size, these hold each wire with its near neighbours
+        stack = [root]
+        while stack:
+            r = stack.pop()
+            if len(r.index) > precond_size and r.children:
+                stack.extend(r.children)
+            else:
+                block = panel_matrix(panels, r.index, r.index)
+                _append_block(diagonal, r.index, r.index, np.linalg.inv(block))
+        self.near = _sparse(near, self.shape, self.dtype)
+        self.U = _sparse(u_data, (self.shape[0], rank), self.dtype)
+        self.V = _sparse(v_data, (rank, self.shape[1]), self.dtype)
+        self.block_inverse = _sparse(diagonal, self.shape, self.dtype)
+
+    @property
+    def size(self) -> int:
+        '''Number of stored matrix entries'''
+        return self.near.nnz + self.U.nnz + self.V.nnz
+
+    def matvec(self, x: np.ndarray) -> np.ndarray:
+        return self.near @ x + self.U @ (self.V @ x)
+
+    def preconditioner(self) -> LinearOperator:
+        '''Block Jacobi preconditioner from the dense diagonal blocks'''
+        return LinearOperator(self.shape, matvec=self.block_inverse.dot,
+                              dtype=self.dtype)
+
+    def solve(self, b: np.ndarray, tol: float = 1e-8, M=None) -> np.ndarray:
+        '''Solve with restarted GMRES, one column of b at a time'''
+        A = LinearOperator(self.shape, matvec=self.matvec, dtype=self.dtype)
+        M = self.preconditioner() if M is None else M
+        x = np.zeros(b.shape, dtype=np.result_type(self.dtype, b))
+        for k in range(b.shape[1]):
+            try:
+                x[:, k], info = gmres(A, b[:, k], rtol=tol, atol=0.0,
+                                      M=M, restart=200, maxiter=50)
+            except TypeError:  # Older scipy
+                x[:, k], info = gmres(A, b[:, k], tol=tol, atol=0.0,
+                                      M=M, restart=200, maxiter=50)
+            if info != 0:
+                raise RuntimeError(f'GMRES did not converge ({info})')
+        return x
+
+
+def _append_block(coo, rows, cols, block):
+    r, c = np.meshgrid(rows, cols, indexing='ij')
+    coo[0].append(r.ravel())
+    coo[1].append(c.ravel())
+    coo[2].append(block.ravel())
+
+
+def _sparse(coo, shape, dtype):
+    if len(coo[0]) == 0:
+        return csr_matrix(shape, dtype=dtype)
+    rows, cols, data = (np.concatenate(x) for x in coo)
+    return csr_matrix((data, (rows, cols)), shape=shape, dtype=dtype)
+
+
+def capacitance(conductors: list, dielectrics: list = (),
+                method: str = None, hmatrix_params: dict = None) -> np.ndarray:
+    '''Capacitance matrix per unit length (F/m) of the conductors.
+
+    Conductors flagged with merge are joined with the following conductor,
+    as in FastCap list files. Units of the segment files are meters.
+    The method is 'dense' (default) for a direct solve or 'hmatrix' for
+    ACA compression with GMRES, configured through hmatrix_params
+    (leaf_size, eta, tol, solver tol as gmres_tol).'''
+    panels = Panels(conductors, dielectrics)
+    if method is None or method.lower() == 'dense':
+        q = np.linalg.solve(system_matrix(panels), system_rhs(panels))
+        return charge_to_capacitance(panels, q[:-1])
+    elif method.lower() == 'hmatrix':
+        params = dict(hmatrix_params or {})
+        gmres_tol = params.pop('gmres_tol', 1e-8)
+        H = HMatrix(panels, **params)
+        # Unit potential on each conductor, then the floating reference
+        # potential from the zero net charge constraint
+        rhs = system_rhs(panels)[:-1]
+        ref = 1.0 * panels.is_conductor[:, np.newaxis]
+        q = H.solve(np.hstack((rhs, ref)), tol=gmres_tol)
+        q, q_ref = q[:, :-1], q[:, -1:]
+        v_ref = -(panels.length @ q) / (panels.length @ q_ref)
+        return charge_to_capacitance(panels, q + q_ref * v_ref)
+    else:
+        raise Exception(f'Invalid method specified: {method}')
+
+
+def solve_list_file(list_file: str, **kwargs) -> np.ndarray:
+    '''Capacitance matrix of a FastCap 2D list file, see run_fastercap
+    Keyword arguments are passed to capacitance'''
+    elements = fc.read_fastcap2d_file(list_file)
+    return capacitance(elements.get('C', []), elements.get('D', []), **kwargs)
+
+
+if __name__ == '__main__':
+    ri, ro = 1e-3, 3e-3
+    fc.save_segments('bem_inner.txt', fc.generate_arc_segments(ri, 0, 360, N=65))
+    fc.save_segments('bem_outer.txt', fc.generate_arc_segments(ro, 0, 360, N=65))
+    C = capacitance([fc.Conductor('bem_inner.txt', 1.0, 0, 0),
+                     fc.Conductor('bem_outer.txt', 1.0, 0, 0)])
+    print('BEM (pF/m):')
+    print(C * 1e12)
+    print('Analytical (pF/m):', 2 * np.pi * EPS0 / np.log(ro / ri) * 1e12)
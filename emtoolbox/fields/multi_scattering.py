@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+
+'''Scattering of a plane wave by many parallel cylinders.
+
+Each cylinder scatters sum_n b_n H_n(k rho) exp(j n phi) about its own
+centre. The field exciting a cylinder is the incident wave plus the waves
+scattered by all others, translated to its centre with Graf's addition
+theorem, and its T-matrix relates the two (Foldy-Lax):
+
+    b_i = T_i (p_i + sum_j G_ij b_j)
+
+The wave is polarized in Z and incident along angle theta from the x axis,
+theta = 0 matches scattering.py'''
+
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib as mpl
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse.linalg import LinearOperator, gmres
+from scipy.special import jv, hankel2
+from emtoolbox.fields.scattering import (truncation_order,
+                                         conducting_coefficients,
+                                         dielectric_coefficients,
+                                         plot_cyl_wave)
+
+
+class Cylinder():
+    '''Cylinder at x, y, conducting if er is None'''
+    def __init__(self, x: float, y: float, radius: float, er=None,
+                 ur: float = 1.0):
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.er = er
+        self.ur = ur
+
+    def __repr__(self):
+        kind = 'conducting' if self.er is None else f'er={self.er}'
+        return f'Cylinder({self.x}, {self.y}, {self.radius}, {kind})'
+
+    @property
+    def conducting(self) -> bool:
+        return self.er is None
+
+    def wavenumber(self, k: float):
+        return k if self.conducting else k * np.sqrt(self.er * self.ur)
+
+    def t_matrix(self, k: float, N: int):
+        '''Diagonal T-matrix and internal field coefficients for orders
+        -N..N, per unit exciting coefficient'''
+        n = np.arange(N + 1)
+        if self.conducting:
+            an = conducting_coefficients(k, self.radius, N)
+            cn = np.zeros_like(an)
+        else:
+            an, cn = dielectric_coefficients(k, self.radius, self.er,
+                                             self.ur, N)
+        # Coefficients are symmetric in n, remove the incident j^-n
+        t = an / (1.j)**-n
+        c = cn / (1.j)**-n
+        return np.concatenate((t[:0:-1], t)), np.concatenate((c[:0:-1], c))
+
+
+def _hankel_orders(N: int, x: np.ndarray) -> np.ndarray:
+    '''hankel2 of orders 0..N, shape (N + 1,) + x.shape, by upward
+    recurrence'''
+    H = np.empty((N + 1,) + x.shape, dtype=complex)
+    H[0] = hankel2(0, x)
+    if N > 0:
+        H[1] = hankel2(1, x)
+    for n in range(1, N):
+        H[n + 1] = 2 * n / x * H[n] - H[n - 1]
+    return H
+
+
+def _signed_orders(B: np.ndarray, N: int) -> np.ndarray:
+    '''Extend orders 0..N to -N..N with B_{-n} = (-1)^n B_n'''
+    sign = (-1.0)**np.arange(N, 0, -1)
+    sign = sign.reshape((N,) + (1,) * (B.ndim - 1))
+    return np.concatenate((sign * B[N:0:-1], B[:N + 1]))
+
+
+class MultipleScattering():
+    '''Coupled system of a set of cylinders at one wavelength.
+
+    The system (I - T G) b = T p, diagonally scaled, is assembled once
+    and, for the dense method, LU factorized once; solve then handles any
+    number of incidence angles as a batch of right hand sides. The
+    'gmres' method keeps the same matrix and solves each angle iteratively'''
+    def __init__(self, cylinders: list, wavelength: float, N: int = None,
+                 method: str = 'dense'):
+        if len(cylinders) == 0:
+            raise ValueError('No cylinders specified')
+        self.cylinders = cylinders
+        self.k = 2 * np.pi / wavelength
+        self.centre = np.array([[c.x, c.y] for c in cylinders])
+        self.radius = np.array([c.radius for c in cylinders])
+        if N is None:
+            N = truncation_order(max(abs(c.wavenumber(self.k)) * c.radius
+                                     for c in cylinders))
+        self.N = N
+        self.n = np.arange(-N, N + 1)
+        tc = [c.t_matrix(self.k, N) for c in cylinders]
+        self.T = np.array([t for t, _ in tc])
+        self.C = np.array([c for _, c in tc])
+        self.method = method
+        # G[i, m, j, n] = H_{n-m}(k d_ij) exp(j (n-m) theta_ij), translating
+        # outgoing order n about j into regular order m about i
+        M = len(cylinders)
+        d = self.centre[:, np.newaxis, :] - self.centre[np.newaxis, :, :]
+        dist = np.hypot(d[..., 0], d[..., 1])
+        overlap = dist < self.radius + self.radius[:, np.newaxis]
+        np.fill_diagonal(overlap, False)
+        if np.any(overlap):
+            raise ValueError('Cylinders overlap')
+        np.fill_diagonal(dist, 1.0)
+        H = _signed_orders(_hankel_orders(2 * N, self.k * dist), 2 * N)
+        q = np.arange(-2 * N, 2 * N + 1)[:, np.newaxis, np.newaxis]
+        H *= np.exp(1.j * q * np.arctan2(d[..., 1], d[..., 0]))
+        H[:, np.arange(M), np.arange(M)] = 0.0
+        q = self.n[np.newaxis, :] - self.n[:, np.newaxis] + 2 * N
+        self.G = H[q].transpose(2, 0, 3, 1).reshape(M * len(self.n), -1)
+        # Unknowns scaled by |H_n(k a)|, the size of each outgoing wave at
+        # its surface, keeps the system well conditioned for large N
+        ka = self.k * self.radius[:, np.newaxis]
+        self.scale = np.abs(hankel2(self.n, ka)).ravel()
+        ST = self.scale * self.T.ravel()
+        self.A = (np.eye(len(self.G))
+                  - ST[:, np.newaxis] * self.G / self.scale[np.newaxis, :])
+        if method == 'dense':
+            self.lu = lu_factor(self.A)
+        elif method != 'gmres':
+            raise Exception(f'Invalid method specified: {method}')
+
+    def incident_coefficients(self, angles, E0=1.0) -> np.ndarray:
+        '''Regular wave coefficients of plane waves about each centre,
+        shape (cylinders * orders, angles)'''
+        angles = np.atleast_1d(angles)
+        direction = np.stack((np.cos(angles), np.sin(angles)))
+        phase = np.exp(-1.j * self.k * self.centre @ direction)
+        p = (E0 * (1.j)**-self.n[:, np.newaxis]
+             * np.exp(-1.j * self.n[:, np.newaxis] * angles))
+        return (phase[:, np.newaxis, :] * p[np.newaxis, :, :]).reshape(
+            -1, len(angles))
+
+    def solve(self, angles, E0=1.0, tol=1e-10) -> np.ndarray:
+        '''Scattered coefficients b, shape (cylinders * orders, angles)'''
+        p = self.incident_coefficients(angles, E0)
+        rhs = (self.scale * self.T.ravel())[:, np.newaxis] * p
+        if self.method == 'dense':
+            return lu_solve(self.lu, rhs) / self.scale[:, np.newaxis]
+        A = LinearOperator(self.A.shape, matvec=lambda x: self.A @ x,
+                           dtype=complex)
+        b = np.empty_like(rhs)
+        for k in range(rhs.shape[1]):
+            try:
+                b[:, k], info = gmres(A, rhs[:, k], rtol=tol, atol=0.0,
+                                      restart=200)
+            except TypeError:   # scipy < 1.12
+                b[:, k], info = gmres(A, rhs[:, k], tol=tol, atol=0.0,
+                                      restart=200)
+            if info != 0:
+                raise RuntimeError(f'GMRES did not converge: {info}')
+        return b / self.scale[:, np.newaxis]
+
+    def field(self, X, Y, angles, E0=1.0) -> np.ndarray:
+        '''Incident, scattered and total field at points X, Y for each
+        incidence angle, the last axis. The total field is the internal
+        field inside dielectric cylinders and zero inside conductors'''
+        X, Y = np.broadcast_arrays(np.asarray(X, dtype=float),
+                                   np.asarray(Y, dtype=float))
+        angles = np.atleast_1d(angles)
+        b = self.solve(angles, E0)
+        M, L = len(self.cylinders), len(self.n)
+        direction = np.stack((np.cos(angles), np.sin(angles)))
+        Ei = E0 * np.exp(-1.j * self.k * np.stack((X, Y), axis=-1) @ direction)
+        Es = np.zeros_like(Ei)
+        Et = np.zeros_like(Ei)
+        exciting = (self.incident_coefficients(angles, E0)
+                    + self.G @ b).reshape(M, L, -1)
+        b = b.reshape(M, L, -1)
+        inside_any = np.zeros(X.shape, dtype=bool)
+        for i, cyl in enumerate(self.cylinders):
+            dx, dy = X - cyl.x, Y - cyl.y
+            rho = np.hypot(dx, dy)
+            inside = rho < cyl.radius
+            inside_any |= inside
+            rotation = np.exp(1.j * self.n[:, np.newaxis]
+                              * np.arctan2(dy, dx).ravel())
+            out = ~inside.ravel()
+            H = _hankel_orders(self.N, self.k * rho.ravel()[out])
+            H = _signed_orders(H, self.N)
+            Es.reshape(-1, len(angles))[out] += np.einsum(
+                'np,na->pa', H * rotation[:, out], b[i])
+            if not cyl.conducting and inside.any():
+                kd = cyl.wavenumber(self.k)
+                J = jv(self.n[:, np.newaxis], kd * rho.ravel()[~out])
+                Et.reshape(-1, len(angles))[~out] = np.einsum(
+                    'np,na->pa', J * rotation[:, ~out],
+                    self.C[i][:, np.newaxis] * exciting[i])
+        Et[~inside_any] = Ei[~inside_any] + Es[~inside_any]
+        return Ei, Es, Et
+
+    def far_field(self, phi, angles, E0=1.0) -> np.ndarray:
+        '''Scattered far field pattern F, Es ~ F sqrt(2j / (pi k rho))
+        exp(-j k rho), shape (len(phi), angles)'''
+        phi = np.atleast_1d(phi)
+        M, L = len(self.cylinders), len(self.n)
+        b = self.solve(angles, E0).reshape(M, L, -1)
+        direction = np.stack((np.cos(phi), np.sin(phi)))
+        phase = np.exp(1.j * self.k * self.centre @ direction)
+        modes = (1.j)**self.n[:, np.newaxis] * np.exp(
+            1.j * self.n[:, np.newaxis] * phi)
+        return np.einsum('mp,np,mna->pa', phase, modes, b)
+
+    def echo_width(self, phi, angles, E0=1.0) -> np.ndarray:
+        '''Bistatic echo width (2D radar cross section) in metres'''
+        return 4 / self.k * np.abs(self.far_field(phi, angles, E0) / E0)**2
+
+
+if __name__ == '__main__':
+    wavelength = 1.0
+    # Ring of conducting wires around a dielectric rod
+    cylinders = [Cylinder(0.0, 0.0, 0.5, er=4.0)]
+    for a in np.linspace(0, 2 * np.pi, 24, endpoint=False):
+        cylinders.append(Cylinder(1.5 * np.cos(a), 1.5 * np.sin(a), 0.05))
+    system = MultipleScattering(cylinders, wavelength)
+    x = np.linspace(-4, 4, 201)
+    X, Y = np.meshgrid(x, x)
+    angles = np.deg2rad([0, 45])
+    Ei, Es, Et = system.field(X, Y, angles)
+
+    fig, axs = plt.subplots(nrows=2, ncols=3)
+    fig.suptitle('Scattering by Multiple Cylinders')
+    norm = mpl.colors.Normalize(vmin=-2, vmax=2)
+    for row, angle in enumerate(angles):
+        plot_cyl_wave(axs[row, 0], X, Y, Ei[..., row], 'Incident', norm=norm)
+        plot_cyl_wave(axs[row, 1], X, Y, Es[..., row], 'Scattered', norm=norm)
+        plot_cyl_wave(axs[row, 2], X, Y, Et[..., row], 'Total', norm=norm)
+
+    phi = np.linspace(0, 2 * np.pi, 361)
+    fig, ax = plt.subplots()
+    ax.plot(np.rad2deg(phi), 10 * np.log10(system.echo_width(phi, angles)))
+    ax.set_xlabel('Angle (deg)')
+    ax.set_ylabel('Echo width (dB m)')
+    ax.legend([f'{np.rad2deg(a):.0f} deg' for a in angles])
+    plt.show()
@@ -0,0 +1,400 @@
+#!/usr/bin/python3
+
+'''Fast solvers for the finite difference Poisson equation of poisson_fdm.
+
+With uniform permittivity on a rectangle the discrete Laplacian is
+diagonalized by sine transforms along Dirichlet axes and cosine transforms
+along axes with a symmetry (Neumann) plane at index 0, giving a direct
+O(N log N) solution. The same solve preconditions conjugate gradients for
+grids with fixed potential nodes and varying permittivity.
+
+The operator is written over the grid edges, each with a weight from the
+permittivity of the cells around it, so it is symmetric positive definite
+once the fixed nodes are eliminated. Edges in a symmetry plane carry half
+weight, as the plane only bounds half of their cells.
+
+The conjugate gradient solver is matrix-free: the operator, dot products
+and updates are numba kernels over grid-sized arrays, parallel over the
+first axis. 2D grids are handled as 3D grids with one plane'''
+
+import numpy as np
+from numba import njit, prange
+from scipy.fft import dst, idst, dct, idct
+
+
+def unknown_slices(shape, sym):
+    '''Slices of the nodes solved for on a rectangle, all but the boundary
+    except for symmetry planes at index 0'''
+    return tuple(slice(0 if s else 1, n - 1) for n, s in zip(shape, sym))
+
+
+def _eigenvalues(m, neumann):
+    k = np.arange(m)
+    if neumann:
+        return 2 - 2 * np.cos(np.pi * (k + 0.5) / m)
+    return 2 - 2 * np.cos(np.pi * (k + 1) / (m + 1))
+
+
+def symmetry_scale(shape, sym=None):
+    '''One at each node, halved in each symmetry plane it lies in, the
+    scale of the rows of the symmetric operator'''
+    sym = (False,) * len(shape) if sym is None else tuple(sym)
+    half = np.ones(shape)
+    for axis, s in enumerate(sym):
+        if s:
+            index = [slice(None)] * len(shape)
+            index[axis] = 0
+            half[tuple(index)] *= 0.5
+    return half
+
+
+def dst_solve(f, sym):
+    '''Solve the unit spacing Laplacian, sum over axes of 2 u_i - u_i-1 -
+    u_i+1, for the unknown block u with zero boundaries. Along axes in
+    sym, u_-1 = u_1 (a mirror at index 0). Leading axes of f beyond those
+    of sym hold a batch of blocks transformed together'''
+    u = np.asarray(f, dtype=float)
+    eig = 0
+    for axis, neumann in enumerate(sym, start=-len(sym)):
+        if neumann:
+            u = idct(u, type=2, axis=axis)
+        else:
+            u = idst(u, type=1, axis=axis)
+        shape = [1] * u.ndim
+        shape[axis] = u.shape[axis]
+        eig = eig + _eigenvalues(u.shape[axis], neumann).reshape(shape)
+    u = u / eig
+    for axis, neumann in enumerate(sym, start=-len(sym)):
+        if neumann:
+            u = dct(u, type=2, axis=axis)
+        else:
+            u = dst(u, type=1, axis=axis)
+    return u
+
+
+def fast_poisson(V, sym=None, rhs=None):
+    '''Direct solution of the uniform permittivity Poisson equation on a
+    rectangle, in place. V holds the boundary potentials and rhs, if
+    given, the source of each node times the grid spacing squared. Leading
+    axes of V and rhs beyond those of sym hold a batch of problems'''
+    sym = (False,) * V.ndim if sym is None else tuple(sym)
+    ndim = len(sym)
+    block = (Ellipsis,) + unknown_slices(V.shape[-ndim:], sym)
+    f = np.zeros(V[block].shape)
+    if rhs is not None:
+        f += rhs[block]
+    for axis, neumann in enumerate(sym, start=-ndim):
+        for end in ((-1,) if neumann else (0, -1)):
+            # Dirichlet neighbours of the first and last unknowns
+            face = list(block)
+            face[axis] = end
+            target = [Ellipsis] + [slice(None)] * ndim
+            target[axis] = end
+            f[tuple(target)] += V[tuple(face)]
+    V[block] = dst_solve(f, sym)
+    return V
+
+
+def face_weights(shape, dielectric=None, sym=None):
+    '''Weight of each edge of the grid along each axis, the mean
+    permittivity of the cells around it, halved in symmetry planes.
+    Returns one array per axis, shape one less along that axis'''
+    ndim = len(shape)
+    sym = (False,) * ndim if sym is None else tuple(sym)
+    weights = []
+    for axis in range(ndim):
+        wshape = tuple(n - 1 if a == axis else n for a, n in enumerate(shape))
+        if dielectric is None:
+            w = np.ones(wshape)
+        else:
+            # Cells either side of the edge in each other direction
+            pad = [(1, 1) if a != axis else (0, 0) for a in range(ndim)]
+            er = np.pad(np.asarray(dielectric, dtype=float), pad, mode='edge')
+            w = er
+            for a in range(ndim):
+                if a != axis:
+                    w = 0.5 * (w.take(range(w.shape[a] - 1), axis=a)
+                               + w.take(range(1, w.shape[a]), axis=a))
+        for a in range(ndim):
+            if a != axis and sym[a]:
+                index = [slice(None)] * ndim
+                index[a] = 0
+                w[tuple(index)] *= 0.5
+        weights.append(w)
+    return weights
+
+
+def apply_operator(V, weights):
+    '''Net weighted flux out of each node, sum over edges of w (V_p - V_q)'''
+    out = np.zeros_like(V)
+    for axis, w in enumerate(weights):
+        lo = [slice(None)] * V.ndim
+        hi = [slice(None)] * V.ndim
+        lo[axis] = slice(None, -1)
+        hi[axis] = slice(1, None)
+        flux = w * (V[tuple(lo)] - V[tuple(hi)])
+        out[tuple(lo)] += flux
+        out[tuple(hi)] -= flux
+    return out
+
+
+def free_nodes(shape, labels=None, fixed=None, sym=None):
+    '''Mask of the nodes solved for, those of unknown_slices that are not
+    fixed by the labels, see poisson_fdm.boundary_labels'''
+    sym = (False,) * len(shape) if sym is None else tuple(sym)
+    free = np.zeros(shape, dtype=bool)
+    free[unknown_slices(shape, sym)] = True
+    if labels is not None:
+        free &= ~((labels >= 0) & fixed[labels])
+    return free
+
+
+def _as_3d(a):
+    return a.reshape(a.shape + (1,) * (3 - a.ndim))
+
+
+def _weights_3d(weights):
+    '''Edge weights of a 2D grid as those of a one plane 3D grid'''
+    if len(weights) == 3:
+        return weights
+    wx, wy = (_as_3d(w) for w in weights)
+    return wx, wy, np.zeros(wx.shape[:2] + (0,))
+
+
+@njit(parallel=True)
+def _apply(x, wx, wy, wz, free, out):
+    '''out = A x at the free nodes, zero elsewhere'''
+    nx, ny, nz = x.shape
+    for i in prange(nx):
+        for j in range(ny):
+            for k in range(nz):
+                if not free[i, j, k]:
+                    out[i, j, k] = 0.0
+                    continue
+                p = x[i, j, k]
+                s = 0.0
+                if i > 0:
+                    s += wx[i-1, j, k] * (p - x[i-1, j, k])
+                if i < nx-1:
+                    s += wx[i, j, k] * (p - x[i+1, j, k])
+                if j > 0:
+                    s += wy[i, j-1, k] * (p - x[i, j-1, k])
+                if j < ny-1:
+                    s += wy[i, j, k] * (p - x[i, j+1, k])
+                if k > 0:
+                    s += wz[i, j, k-1] * (p - x[i, j, k-1])
+                if k < nz-1:
+                    s += wz[i, j, k] * (p - x[i, j, k+1])
+                out[i, j, k] = s
+
+
+@njit(parallel=True)
+def _diagonal(wx, wy, wz, free, out):
+    '''Diagonal of A at the free nodes, one elsewhere'''
+    nx, ny, nz = out.shape
+    for i in prange(nx):
+        for j in range(ny):
+            for k in range(nz):
+                s = 0.0
+                if i > 0:
+                    s += wx[i-1, j, k]
+                if i < nx-1:
+                    s += wx[i, j, k]
+                if j > 0:
+                    s += wy[i, j-1, k]
+                if j < ny-1:
+                    s += wy[i, j, k]
+                if k > 0:
+                    s += wz[i, j, k-1]
+                if k < nz-1:
+                    s += wz[i, j, k]
+                out[i, j, k] = s if free[i, j, k] else 1.0
+
+
+@njit(parallel=True)
+def _dot(a, b):
+    a = a.reshape(-1)
+    b = b.reshape(-1)
+    s = 0.0
+    for n in prange(a.size):
+        s += a[n] * b[n]
+    return s
+
+
+@njit(parallel=True)
+def _axpy(alpha, x, y):
+    '''y += alpha x'''
+    x = x.reshape(-1)
+    y = y.reshape(-1)
+    for n in prange(y.size):
+        y[n] += alpha * x[n]
+
+
+@njit(parallel=True)
+def _xpay(x, beta, y):
+    '''y = x + beta y'''
+    x = x.reshape(-1)
+    y = y.reshape(-1)
+    for n in prange(y.size):
+        y[n] = x[n] + beta * y[n]
+
+
+@njit(parallel=True)
+def _jacobi(r, diag, z):
+    r = r.reshape(-1)
+    diag = diag.reshape(-1)
+    z = z.reshape(-1)
+    for n in prange(z.size):
+        z[n] = r[n] / diag[n]
+
+
+@njit()
+def _ssor(r, wx, wy, wz, free, diag, omega, z):
+    '''Symmetric SOR preconditioner, a forward then a backward sweep in
+    lexicographic order'''
+    nx, ny, nz = r.shape
+    z[:] = 0.0
+    for i in range(nx):
+        for j in range(ny):
+            for k in range(nz):
+                if free[i, j, k]:
+                    s = r[i, j, k]
+                    if i > 0:
+                        s += omega * wx[i-1, j, k] * z[i-1, j, k]
+                    if j > 0:
+                        s += omega * wy[i, j-1, k] * z[i, j-1, k]
+                    if k > 0:
+                        s += omega * wz[i, j, k-1] * z[i, j, k-1]
+                    z[i, j, k] = s / diag[i, j, k]
+    for i in range(nx-1, -1, -1):
+        for j in range(ny-1, -1, -1):
+            for k in range(nz-1, -1, -1):
+                if free[i, j, k]:
+                    s = diag[i, j, k] * z[i, j, k]
+                    if i < nx-1:
+                        s += omega * wx[i, j, k] * z[i+1, j, k]
+                    if j < ny-1:
+                        s += omega * wy[i, j, k] * z[i, j+1, k]
+                    if k < nz-1:
+                        s += omega * wz[i, j, k] * z[i, j, k+1]
+                    z[i, j, k] = s / diag[i, j, k]
+    z *= omega * (2 - omega)
+
+
+def dst_preconditioner(free, sym=None, scale=1.0):
+    '''Preconditioner for the free nodes, the fast solution of the uniform
+    operator on the whole rectangle with permittivity scale. Returns a
+    function of the residual r and the output z, both grid sized'''
+    shape = free.shape
+    sym = (False,) * len(shape) if sym is None else tuple(sym)
+    block = unknown_slices(shape, sym)
+    half = symmetry_scale(shape, sym)[block]
+    inner = free[block]
+
+    def solve(r, z):
+        z[...] = 0.0
+        z[block] = np.where(inner, dst_solve(r[block] / half, sym) / scale, 0)
+    return solve
+
+
+def chebyshev_preconditioner(weights, free, diag, degree=4, ratio=30.0):
+    '''Fixed degree Chebyshev polynomial in the Jacobi scaled operator,
+    whose eigenvalues are at most 2, tuned to the interval [2 / ratio, 2]'''
+    wx, wy, wz = weights
+    upper = 2.0
+    lower = upper / ratio
+    theta = 0.5 * (upper + lower)
+    delta = 0.5 * (upper - lower)
+    sigma = theta / delta
+    d = np.zeros(free.shape)
+    res = np.zeros(free.shape)
+
+    def solve(r, z):
+        _jacobi(r, diag, d)
+        d[...] /= theta
+        z[...] = d
+        rho = 1 / sigma
+        for _ in range(degree - 1):
+            _apply(z, wx, wy, wz, free, res)
+            _xpay(r, -1.0, res)
+            rho_new = 1 / (2 * sigma - rho)
+            _jacobi(res, diag, res)
+            _xpay(res, rho * delta / 2, d)
+            d[...] *= 2 * rho_new / delta
+            _axpy(1.0, d, z)
+            rho = rho_new
+    return solve
+
+
+def pcg(V, free, weights, precond='jacobi', conv=1e-5, Nmax=1e5, rhs=None,
+        sym=None, scale=1.0, omega=1.0, degree=4):
+    '''Matrix-free preconditioned conjugate gradients for the free nodes of
+    V, in place, the others holding fixed potentials. precond is 'jacobi',
+    'ssor', 'chebyshev' or 'dst', see dst_preconditioner for sym and
+    scale. Stops when the residual norm relative to that of the right
+    hand side is below conv. Returns V and the relative residual of
+    each iteration. With a leading axis of V, and of rhs if given, over a
+    batch of problems, the preconditioner is set up once and a list of
+    the residuals of each is returned'''
+    shape = free.shape
+    free3 = _as_3d(free)
+    wx, wy, wz = _weights_3d(weights)
+    diag = np.empty(free3.shape)
+    _diagonal(wx, wy, wz, free3, diag)
+    if precond == 'jacobi':
+        def M(r, z):
+            _jacobi(r, diag, z)
+    elif precond == 'ssor':
+        def M(r, z):
+            _ssor(r, wx, wy, wz, free3, diag, omega, z)
+    elif precond == 'chebyshev':
+        M = chebyshev_preconditioner((wx, wy, wz), free3, diag, degree)
+    elif precond == 'dst':
+        solve = dst_preconditioner(free, sym, scale)
+
+        def M(r, z):
+            solve(r.reshape(shape), z.reshape(shape))
+    else:
+        raise Exception(f'Invalid preconditioner specified: {precond}')
+    if V.ndim > free.ndim:
+        histories = [_pcg(_as_3d(V[k]), free3, (wx, wy, wz), M, conv, Nmax,
+                          None if rhs is None else _as_3d(rhs[k]))
+                     for k in range(len(V))]
+        return V, histories
+    return V, _pcg(_as_3d(V), free3, (wx, wy, wz), M, conv, Nmax,
+                   None if rhs is None else _as_3d(rhs))
+
+
+def _pcg(x, free3, weights, M, conv, Nmax, rhs):
+    '''Conjugate gradient iteration of pcg for one 3D x, in place'''
+    wx, wy, wz = weights
+    # Right hand side from the fixed nodes, then the initial residual
+    r = np.where(free3, 0.0, x)
+    Ap = np.empty(x.shape)
+    _apply(r, wx, wy, wz, free3, Ap)
+    r[...] = 0.0
+    _axpy(-1.0, Ap, r)
+    if rhs is not None:
+        _axpy(1.0, np.where(free3, rhs, 0.0), r)
+    bnorm = np.sqrt(_dot(r, r)) or 1.0
+    _apply(x, wx, wy, wz, free3, Ap)
+    r[...] = 0.0 if rhs is None else np.where(free3, rhs, 0.0)
+    _axpy(-1.0, Ap, r)
+    z = np.empty(x.shape)
+    M(r, z)
+    p = z.copy()
+    rz = _dot(r, z)
+    history = [np.sqrt(_dot(r, r)) / bnorm]
+    for n in range(int(Nmax)):
+        if history[-1] < conv:
+            break
+        _apply(p, wx, wy, wz, free3, Ap)
+        alpha = rz / _dot(p, Ap)
+        _axpy(alpha, p, x)
+        _axpy(-alpha, Ap, r)
+        history.append(np.sqrt(_dot(r, r)) / bnorm)
+        M(r, z)
+        rz_new = _dot(r, z)
+        _xpay(z, rz_new / rz, p)
+        rz = rz_new
+    return np.array(history)
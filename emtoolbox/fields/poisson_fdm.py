@@ -2,10 +2,14 @@
 
 '''Poisson's finite difference method'''
 
+import itertools
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib as mpl
-from numba import jit
+from numba import jit, prange
+from emtoolbox.fields.poisson_fast import (fast_poisson, face_weights,
+                                          free_nodes, pcg, symmetry_scale,
+                                          unknown_slices)
 try:
     from emtoolbox.utils.constants import EPS0
 except ImportError:
@@ -39,71 +43,644 @@ def check_arrays_3d(X, Y, Z):
     # TODO check array spacing
 
 
+def grid_shape(*axes):
+    '''Shape of the grid given by ij indexed meshgrids or by its 1D axes.
+    The solvers only read the number of points, the spacing is uniform'''
+    if all(np.ndim(a) == 1 for a in axes):
+        if len(axes) > 1:
+            steps = [abs(a[1] - a[0]) for a in axes]
+            if max(steps) - min(steps) > 1e-6:
+                raise Exception('Axes must have the same spacing')
+        return tuple(len(a) for a in axes)
+    if len(axes) == 2:
+        check_arrays_2d(*axes)
+    elif len(axes) == 3:
+        check_arrays_3d(*axes)
+    return axes[0].shape
+
+
+def check_dielectric(shape, er):
+    if er is not None and er.shape != tuple(n - 1 for n in shape):
+        raise Exception('Grid shape must be one larger than er')
+
+
+def check_charge(shape, charge):
+    '''Charge as an array, and whether it is a stack of charge
+    distributions along a leading axis'''
+    if charge is None:
+        return None, False
+    charge = np.asarray(charge, dtype=float)
+    if (charge.shape[charge.ndim - len(shape):] != tuple(shape)
+            or charge.ndim > len(shape) + 1):
+        raise Exception('Charge shape must match the grid')
+    return charge, charge.ndim > len(shape)
+
+
+def node_permittivity(shape, dielectric=None, periodic=None):
+    '''Mean permittivity of the cells around each node, those beyond the
+    grid mirrored, or wrapped around along periodic axes'''
+    if dielectric is None:
+        return np.ones(shape)
+    ndim = len(shape)
+    periodic = (False,) * ndim if periodic is None else periodic
+    er = np.asarray(dielectric, dtype=float)
+    for a in range(ndim):
+        pad = [(0, 0)] * ndim
+        pad[a] = (1, 1)
+        er = np.pad(er, pad, mode='wrap' if periodic[a] else 'edge')
+        er = 0.5 * (er.take(range(shape[a]), axis=a)
+                    + er.take(range(1, shape[a] + 1), axis=a))
+    return er
+
+
+def charge_source(shape, charge, h, dielectric=None, periodic=None):
+    '''Source term of the SOR stencil of each node, h^2 charge over the sum
+    of the stencil weights, 2 ndim times node_permittivity. Returns one
+    per charge distribution, zero at the nodes repeating others along
+    periodic axes, or a single empty one without charge'''
+    ndim = len(shape)
+    if charge is None:
+        return np.zeros((1,) + (0,) * ndim)
+    charge = np.reshape(charge, (-1,) + tuple(shape))
+    source = h**2 * charge / (2 * ndim * node_permittivity(shape, dielectric,
+                                                           periodic))
+    for a in range(ndim):
+        if periodic is not None and periodic[a]:
+            index = [slice(None)] * (ndim + 1)
+            index[a + 1] = -1
+            source[tuple(index)] = 0.0
+    return source
+
+
+def grid_axes(*axes):
+    '''1D axes of a grid given by ij indexed meshgrids or by its axes'''
+    ndim = len(axes)
+    return tuple(np.asarray(a) if np.ndim(a) == 1 else np.asarray(a)[
+        tuple(slice(None) if b == n else 0 for b in range(ndim))]
+        for n, a in enumerate(axes))
+
+
+def open_boundary(axes, labels, fixed, has_bc, sym, order, center=None,
+                  dielectric=None):
+    '''Asymptotic (Robin) boundary condition for the edge nodes of the grid
+    with 1D axes, for a potential decaying as 1 / r^order about center,
+    by default the middle of the grid: dV/dn = -order (r.n / r^2) V.
+    Each free edge node takes the Laplacian stencil with a ghost node
+    beyond the edge set by the condition, the edges at index 0 of the
+    axes in sym being symmetry planes. The faces are weighted by the
+    dielectric of the cells around them, those beyond the edge mirrored.
+    Returns the flat indices of the nodes and those of their 2 ndim
+    neighbours, with weights, for _update_nodes. Empty arrays if order
+    is 0'''
+    ndim = len(axes)
+    shape = tuple(len(a) for a in axes)
+    if not order:
+        return (np.zeros(0, dtype=np.int64),
+                np.zeros((0, 2 * ndim), dtype=np.int64),
+                np.zeros((0, 2 * ndim)))
+    h = abs(axes[0][1] - axes[0][0])
+    if center is None:
+        center = [0.5 * (a[0] + a[-1]) for a in axes]
+    edge = np.zeros(shape, dtype=bool)
+    for a in range(ndim):
+        index = [slice(None)] * ndim
+        index[a] = -1
+        edge[tuple(index)] = True
+        if not sym[a]:
+            index[a] = 0
+            edge[tuple(index)] = True
+    if has_bc:
+        edge &= ~((labels >= 0) & fixed[labels])
+    nodes = np.nonzero(edge)
+    d = [axes[a][nodes[a]] - center[a] for a in range(ndim)]
+    r2 = sum(da**2 for da in d)
+    if np.any(r2 == 0):
+        raise Exception('Open boundary center must not be on the edge')
+    neighbours = np.empty((len(nodes[0]), 2 * ndim), dtype=np.int64)
+    weights = np.zeros((len(nodes[0]), 2 * ndim))
+    if dielectric is None:
+        weights[:] = 1.0
+    else:
+        # Each face takes the cells around the node on its side
+        for offset in itertools.product((-1, 0), repeat=ndim):
+            cell = tuple(np.clip(nodes[b] + offset[b], 0, shape[b] - 2)
+                         for b in range(ndim))
+            for a in range(ndim):
+                weights[:, 2 * a + offset[a] + 1] += dielectric[cell]
+    total = weights.sum(axis=1)
+    for a in range(ndim):
+        i = nodes[a]
+        n = shape[a]
+        lower = np.where(i == 0, 1, i - 1)
+        upper = np.where(i == n - 1, n - 2, i + 1)
+        neighbours[:, 2 * a] = np.ravel_multi_index(
+            nodes[:a] + (lower,) + nodes[a + 1:], shape)
+        neighbours[:, 2 * a + 1] = np.ravel_multi_index(
+            nodes[:a] + (upper,) + nodes[a + 1:], shape)
+        # Ghost node V_in + 2 h dV/dn, with the outward normal along a,
+        # so V_in - 2 h order (r.n / r^2) V through the face beyond
+        outward = np.where(i == n - 1, 1.0, np.where(sym[a], 0.0, -1.0))
+        outward[(i > 0) & (i < n - 1)] = 0.0
+        face = np.where(i == n - 1, weights[:, 2 * a + 1], weights[:, 2 * a])
+        total += face * 2 * h * order * outward * d[a] / r2
+    weights /= total[:, np.newaxis]
+    return np.ravel_multi_index(nodes, shape), neighbours, weights
+
+
+def check_periodic(periodic, sym):
+    '''Flags of the periodic axes, named in periodic as in 'xy', which
+    cannot also be symmetry planes'''
+    names = 'xyz'[:len(sym)]
+    if any(a not in names for a in periodic):
+        raise Exception(f'Invalid periodic axes specified: {periodic}')
+    flags = tuple(a in periodic for a in names)
+    if any(p and s for p, s in zip(flags, sym)):
+        raise Exception('Axes cannot be both periodic and symmetry planes')
+    return flags
+
+
+def _wrap(i, n, periodic, cell=False):
+    '''Node, or cell, indices i along an axis of n nodes, those before
+    index 0 wrapped around the period if periodic, else mirrored about
+    the symmetry plane'''
+    if periodic:
+        return i % (n - 1)
+    return np.where(i < 0, -i - 1 if cell else -i, i)
+
+
+def periodic_boundary(shape, labels, fixed, has_bc, sym, periodic,
+                      dielectric=None):
+    '''Periodic boundary along the axes flagged in periodic, the grid
+    spanning one period so the nodes at index -1 repeat those at index 0.
+    The free nodes at index 0, other than on the edges of the remaining
+    axes unless symmetry planes, take the stencil wrapping around to
+    index -2. The nodes at index -1 are then copied from them. Returns
+    the flat indices of the nodes, their 2 ndim neighbours and weights
+    for _update_nodes, as open_boundary'''
+    ndim = len(shape)
+    solved = np.zeros(shape, dtype=bool)
+    copied = np.zeros(shape, dtype=bool)
+    for a in range(ndim):
+        index = [slice(None)] * ndim
+        if periodic[a]:
+            index[a] = 0
+            solved[tuple(index)] = True
+            index[a] = -1
+            copied[tuple(index)] = True
+    for a in range(ndim):
+        index = [slice(None)] * ndim
+        if not periodic[a]:
+            index[a] = -1
+            solved[tuple(index)] = False
+            if not sym[a]:
+                index[a] = 0
+                solved[tuple(index)] = False
+    solved &= ~copied
+    if has_bc:
+        free = ~((labels >= 0) & fixed[labels])
+        solved &= free
+        copied &= free
+    nodes = np.nonzero(solved)
+    neighbours = np.empty((len(nodes[0]), 2 * ndim), dtype=np.int64)
+    weights = np.zeros((len(nodes[0]), 2 * ndim))
+    for a in range(ndim):
+        for side, step in enumerate((-1, 1)):
+            node = list(nodes)
+            node[a] = _wrap(nodes[a] + step, shape[a], periodic[a])
+            neighbours[:, 2 * a + side] = np.ravel_multi_index(node, shape)
+    if dielectric is None:
+        weights[:] = 1.0
+    else:
+        # Each face takes the cells around the node on its side
+        for offset in itertools.product((-1, 0), repeat=ndim):
+            cell = tuple(_wrap(nodes[b] + offset[b], shape[b], periodic[b],
+                               cell=True) for b in range(ndim))
+            for a in range(ndim):
+                weights[:, 2 * a + offset[a] + 1] += dielectric[cell]
+    weights /= weights.sum(axis=1)[:, np.newaxis]
+    copies = np.nonzero(copied)
+    image = tuple(np.where(copies[a] == shape[a] - 1, 0, copies[a])
+                  if periodic[a] else copies[a] for a in range(ndim))
+    image = np.ravel_multi_index(image, shape)
+    return (np.concatenate((np.ravel_multi_index(nodes, shape),
+                            np.ravel_multi_index(copies, shape))),
+            np.concatenate((neighbours, np.repeat(image[:, np.newaxis],
+                                                  2 * ndim, axis=1))),
+            np.concatenate((weights, np.full((len(image), 2 * ndim),
+                                             1 / (2 * ndim)))))
+
+
 @jit(nopython=True)
+def _update_nodes(Vf, index, neighbours, weights, Sf):
+    '''Gauss-Seidel update of the flat V at index from weighted neighbours,
+    plus the flat source term Sf if not empty'''
+    for m in range(len(index)):
+        total = 0.0
+        for k in range(neighbours.shape[1]):
+            total += weights[m, k] * Vf[neighbours[m, k]]
+        if Sf.size > 0:
+            total += Sf[index[m]]
+        Vf[index[m]] = total
+
+
+def coarse_grid(axes, dielectric=None, bc=None):
+    '''Axes, dielectric and bc on every other node of the grid, for the
+    nested iteration starting guess. Each coarse cell takes the mean
+    dielectric of the four (or eight) cells it covers'''
+    shape = grid_shape(*axes)
+    if any((n - 1) % 2 or n < 5 for n in shape):
+        raise Exception('Nested iteration needs an odd number of at least '
+                        '5 points along each axis')
+    ndim = len(shape)
+    step = (slice(None, None, 2),) * ndim
+    axes = tuple(np.asarray(a)[step[:np.ndim(a)]] for a in axes)
+    if dielectric is not None:
+        er = np.asarray(dielectric)
+        er = er.reshape([m for n in er.shape for m in (n // 2, 2)])
+        dielectric = er.mean(axis=tuple(range(1, 2 * ndim, 2)))
+    if bc is not None:
+        labels, values = bc
+        if np.ndim(values) > 1:
+            values = np.asarray(values)[step]
+        bc = (np.asarray(labels)[step], values)
+    return axes, dielectric, bc
+
+
+def prolong(V, ndim=None):
+    '''Linear interpolation of V onto the grid with a node added between
+    each pair, the reverse of taking every other node, along the last
+    ndim axes, all by default'''
+    ndim = V.ndim if ndim is None else ndim
+    for axis in range(V.ndim - ndim, V.ndim):
+        n = V.shape[axis]
+        shape = list(V.shape)
+        shape[axis] = 2 * n - 1
+        fine = np.empty(shape)
+        even = [slice(None)] * V.ndim
+        odd = [slice(None)] * V.ndim
+        even[axis] = slice(None, None, 2)
+        odd[axis] = slice(1, None, 2)
+        fine[tuple(even)] = V
+        fine[tuple(odd)] = 0.5 * (V.take(range(n - 1), axis=axis)
+                                  + V.take(range(1, n), axis=axis))
+        V = fine
+    return V
+
+
+def initial_guess(V, initial, sym):
+    '''Start from initial at the nodes solved for, those of
+    poisson_fast.unknown_slices, before the bc are applied'''
+    if np.shape(initial) != V.shape:
+        raise Exception('Initial guess shape must match the grid')
+    block = unknown_slices(V.shape, sym)
+    V[block] = np.asarray(initial)[block]
+
+
+def batch_start(V, count, initial, sym):
+    '''count copies of the starting V, for a stack of charge distributions,
+    each from initial if given, itself either a stack or shared'''
+    V = np.repeat(V[np.newaxis], count, axis=0)
+    if initial is not None:
+        initial = np.asarray(initial)
+        for k in range(count):
+            initial_guess(V[k], initial[k] if initial.ndim == V.ndim
+                          else initial, sym)
+    return V
+
+
+@jit(nopython=True)
+def _apply_labels(V, labels, table):
+    Vf = V.reshape(-1)
+    lf = labels.reshape(-1)
+    for n in range(lf.size):
+        if lf[n] >= 0 and not np.isnan(table[lf[n]]):
+            Vf[n] = table[lf[n]]
+
+
+@jit(nopython=True)
+def _free(fixed, label):
+    return label < 0 or not fixed[label]
+
+
+def boundary_labels(bc, V):
+    '''Fixed potential boundary as node labels and a table of which labels
+    are fixed, with the fixed potentials applied to V.
+    bc is either (bool array, value array) matching V, where V[bool] = value,
+    or (label array, voltage table), where V = table[label] unless the label
+    is negative or the voltage is NaN. A label array of a small integer type
+    avoids the full size bool and float64 arrays'''
+    if bc is None:
+        # Explicit to prompt numba type
+        return np.zeros((1,) * V.ndim, dtype=np.uint8), np.array([False])
+    labels, values = bc
+    labels = np.asarray(labels)
+    if labels.shape != V.shape:
+        raise Exception('Boundary condition shape must match the grid')
+    if labels.dtype == bool or np.ndim(values) > 1:
+        labels = labels.astype(bool, copy=False)
+        V[labels] = np.asarray(values)[labels]
+        return labels.view(np.uint8), np.array([False, True])
+    table = np.asarray(values, dtype=float)
+    labels = np.ascontiguousarray(labels)
+    _apply_labels(V, labels, table)
+    return labels, ~np.isnan(table)
+
+
+def check_sor(sor):
+    '''Relaxation factor for the SOR solvers, 0 for 'auto' '''
+    if isinstance(sor, str):
+        if sor != 'auto':
+            raise Exception(f'Invalid sor specified: {sor}')
+        return 0.0
+    if not 0 < sor < 2:
+        raise Exception('sor must be between 0 and 2')
+    return float(sor)
+
+
+def check_interval(check):
+    '''Iterations between convergence checks for the SOR solvers'''
+    if not isinstance(check, (int, np.integer)) or check < 1:
+        raise Exception('check must be an integer of at least 1')
+    return int(check)
+
+
+@jit(nopython=True)
+def _relaxation(omega, rho2):
+    '''Next Chebyshev relaxation factor given the squared Jacobi spectral
+    radius rho2, rising from 1 to the optimum 2 / (1 + sqrt(1 - rho2))'''
+    return 1 / (1 - 0.25 * rho2 * omega)
+
+
+@jit(nopython=True)
+def _spectral_estimate(rho2, omega, ratio, ratio_last):
+    '''Squared Jacobi spectral radius from the error contraction ratio
+    of an SOR iteration with factor omega below the optimum. The ratio
+    must have settled since the last one and be clear of omega - 1, the
+    ratio at the optimum. Estimates only ever rise, as early ratios are
+    dominated by fast modes'''
+    if (0 < ratio < 1 and abs(ratio - ratio_last) < 0.05 * (1 - ratio)
+            and ratio > (omega - 1)**0.75):
+        estimate = (ratio + omega - 1)**2 / (ratio * omega**2)
+        if rho2 < estimate < 1:
+            return estimate
+    return rho2
+
+
+@jit(nopython=True)
+def _red_black(index, coef, shape):
+    '''Active nodes reordered with those of even index sum first, and the
+    number of them. Neither colour's stencil touches its own colour'''
+    parity = np.zeros(len(index), dtype=np.int64)
+    for m in range(len(index)):
+        n = index[m]
+        for axis in range(len(shape) - 1, -1, -1):
+            parity[m] += n % shape[axis]
+            n //= shape[axis]
+        parity[m] %= 2
+    order = np.argsort(parity, kind='mergesort')
+    if coef.shape[0] > 0:
+        coef = coef[order]
+    return index[order], coef, len(index) - parity.sum()
+
+
+def check_method(method, precond='dst'):
+    if method not in ('sor', 'dst', 'cg'):
+        raise Exception(f'Invalid method specified: {method}')
+    if precond not in ('dst', 'jacobi', 'ssor', 'chebyshev'):
+        raise Exception(f'Invalid preconditioner specified: {precond}')
+
+
+def check_edges(method, open_bc, periodic):
+    if (open_bc or any(periodic)) and method != 'sor':
+        raise Exception('Open and periodic boundaries require the sor method')
+    if open_bc and any(periodic):
+        raise Exception('Open boundaries cannot be combined with periodic axes')
+
+
+def fixed_edges(V, periodic, values):
+    '''Reapply the (low, high) edge potentials of the axes that are not
+    periodic, so they take the corners of the periodic ones'''
+    if not any(periodic):
+        return
+    for a, (low, high) in enumerate(values):
+        if not periodic[a]:
+            index = [slice(None)] * V.ndim
+            index[a] = 0
+            V[tuple(index)] = low
+            index[a] = -1
+            V[tuple(index)] = high
+
+
+def _poisson_fast(V, dielectric, bc, labels, fixed, sym, method, precond,
+                  conv, Nmax, charge=None, h=1.0):
+    '''Direct or preconditioned conjugate gradient solution of the stack
+    of grids V, one per charge distribution, see poisson_fast'''
+    shape = V.shape[1:]
+    scale = 1.0 if dielectric is None else np.mean(dielectric)
+    rhs = None if charge is None else h**2 * np.reshape(charge, V.shape)
+    if method == 'dst':
+        if bc is not None or (dielectric is not None and np.ptp(dielectric) > 0):
+            raise Exception('Method dst requires a uniform dielectric and no bc')
+        return fast_poisson(V, sym, None if rhs is None else rhs / scale)
+    free = free_nodes(shape, None if bc is None else labels, fixed, sym)
+    weights = face_weights(shape, dielectric, sym)
+    if rhs is not None:
+        # Rows in symmetry planes are halved in the symmetric operator
+        rhs = rhs * symmetry_scale(shape, sym)
+    V, histories = pcg(V, free, weights, precond, conv, Nmax, rhs=rhs,
+                       sym=sym, scale=scale)
+    for history in histories:
+        print(f'{len(shape)}D CG Error', history[-1], 'after',
+              len(history) - 1, 'iterations')
+    return V
+
+
 def poisson_1d(X: np.ndarray, /, v_left: float = 0, v_right: float = 0,
                dielectric: np.ndarray = None, charge: np.ndarray = None,
                bc: list = None, sor=1.8,
-               conv: float = 1e-5, Nmax: int = 1e5):
+               conv: float = 1e-5, Nmax: int = 1e5, method: str = 'direct',
+               check: int = 1):
     '''One-dimension Poisson equation with fixed potential boundaries.
-    Normalized charge density ps/eps can be provided via the charge argument
+    Normalized charge density ps/eps0 at each node can be provided via the
+    charge argument, or a stack of K of them of shape (K, len(X)).
     Dielectric is an array of relative permittivity, located at half-grid points
         x0    x1    x2  ...  xn
            e0    e1  ...  en-1   [one less point]
     Boundary condition is to be provided as a (bool array, value array) matching X
-    Where the condition is X[bool] = value'''
-    check_arrays_1d(X, dielectric)
-    if charge is not None:
-        raise Exception('Charge is currently not supported')
-    # TODO enforce array types
-    V = np.zeros_like(X, dtype='float64')
-    V[0] = v_left
-    V[-1] = v_right
-    V[1:-1] = 0.5 * (v_left + v_right)  # Initial seed
-    nx = len(X)
-    if bc is None:
-        # Explicit to prompt numba type
-        bc_bool = np.array([False])
-        bc_val = np.array([0.0])
+    Where the condition is X[bool] = value, or as labels, see boundary_labels
+    The 'direct' method solves the tridiagonal system exactly, 'sor' iterates
+    with sor, conv and Nmax, see poisson_2d for sor='auto' and check.
+    A dielectric of shape (K, len(X) - 1), or a stack of charge, solves K
+    profiles at once, returning V of shape (K, len(X)), with v_left and
+    v_right scalars or of length K. With a shared dielectric the direct
+    method factorizes the system once for all K'''
+    if method not in ('direct', 'sor'):
+        raise Exception(f'Invalid method specified: {method}')
+    sor = check_sor(sor)
+    check = check_interval(check)
+    charge, charge_batch = check_charge(np.shape(X), charge)
+    er_batch = dielectric is not None and np.ndim(dielectric) == 2
+    if er_batch and charge_batch and len(dielectric) != len(charge):
+        raise Exception('Dielectric and charge stacks must be the same size')
+    count = (len(dielectric) if er_batch
+             else len(charge) if charge_batch else 1)
+    V = np.zeros((count, len(X)), dtype='float64')
+    if er_batch:
+        check_arrays_1d(X, dielectric[0])
     else:
-        bc_bool, bc_val = bc
-        for i in range(nx):
-            if bc_bool[i]:
-                V[i] = bc_val[i]
+        check_arrays_1d(X, dielectric)
+        if dielectric is not None:
+            dielectric = dielectric[np.newaxis, :]
+    if charge is None:
+        rhs = np.zeros((count, 0))
+    else:
+        h = X[1] - X[0]
+        rhs = np.ascontiguousarray(
+            np.broadcast_to(h**2 * charge, (count, len(X))))
+    V[:, 0] = v_left
+    V[:, -1] = v_right
+    V[:, 1:-1] = 0.5 * (V[:, :1] + V[:, -1:])  # Initial seed
+    labels, fixed = boundary_labels(bc, V[0])
+    if bc is not None:
+        held = (labels >= 0) & fixed[labels]
+        V[:, held] = V[0, held]
+    if method == 'direct':
+        _tridiagonal_1d(V, dielectric, labels, fixed, bc is not None, rhs)
+    else:
+        for k in range(len(V)):
+            _poisson_1d(V[k], None if dielectric is None
+                        else dielectric[k if er_batch else 0],
+                        labels, fixed, bc is not None, rhs[k], sor, conv,
+                        Nmax, check)
+    return V if er_batch or charge_batch else V[0]
+
+
+@jit(nopython=True)
+def _tridiagonal_1d(V, dielectric, labels, fixed, has_bc, rhs):
+    '''Exact solution of each row of V by the Thomas algorithm, the end
+    and fixed nodes holding their potentials, with the h^2 charge of each
+    row in rhs if not empty. The factorization is shared by the rows
+    unless the dielectric has one per row'''
+    nx = V.shape[1]
+    a = np.zeros(nx)
+    c = np.zeros(nx)
+    m = np.ones(nx)
+    d = np.empty(nx)
+    for k in range(V.shape[0]):
+        if k == 0 or (dielectric is not None and dielectric.shape[0] > 1):
+            for i in range(1, nx):
+                if i == nx-1 or (has_bc and not _free(fixed, labels[i])):
+                    a[i], b, cu = 0.0, 1.0, 0.0
+                elif dielectric is None:
+                    a[i], b, cu = -1.0, 2.0, -1.0
+                else:
+                    er1 = dielectric[k, i-1]
+                    er2 = dielectric[k, i]
+                    a[i], b, cu = -er1, er1 + er2, -er2
+                m[i] = b - a[i] * c[i-1]
+                c[i] = cu / m[i]
+        d[0] = V[k, 0]
+        for i in range(1, nx):
+            if i == nx-1 or (has_bc and not _free(fixed, labels[i])):
+                source = V[k, i]
+            elif rhs.shape[1] > 0:
+                source = rhs[k, i]
+            else:
+                source = 0.0
+            d[i] = (source - a[i] * d[i-1]) / m[i]
+        V[k, nx-1] = d[nx-1]
+        for i in range(nx-2, -1, -1):
+            V[k, i] = d[i] - c[i] * V[k, i+1]
+    return V
+
+
+@jit(nopython=True)
+def _poisson_1d(V, dielectric, labels, fixed, has_bc, rhs, sor, conv, Nmax,
+                check):
+    nx = len(V)
+    omega = 1.0 if sor == 0 else sor
+    rho2 = 0.0
+    Verr = 0.0
+    ratio = 0.0
     for n in range(int(Nmax)):
-        Vsum = 0
-        Verr = 0
+        Verr_last = Verr
+        Vsum = 0.0
+        Verr = 0.0
         for i in range(1, nx-1):
             V_old = V[i]
-            if not bc or not bc_bool[i]:
+            if not has_bc or _free(fixed, labels[i]):
+                source = rhs[i] if rhs.size > 0 else 0.0
                 if dielectric is None:
-                    R = 0.5 * (V[i+1] + V[i-1]) - V_old
+                    R = 0.5 * (V[i+1] + V[i-1] + source) - V_old
                 else:
                     er1 = dielectric[i-1]
                     er2 = dielectric[i]
-                    R = (er2 * V[i+1] + er1 * V[i-1]) / (er1 + er2) - V_old
-                V[i] = R * sor + V_old
+                    R = ((er2 * V[i+1] + er1 * V[i-1] + source) / (er1 + er2)
+                         - V_old)
+                V[i] = R * omega + V_old
                 Verr += abs(R)
                 Vsum += abs(V[i])
-        if Vsum > 0 and Verr / Vsum < conv:
+        omega_next = omega if sor > 0 else _relaxation(omega, rho2)
+        done, rho2, ratio = _converged(n, Verr, Vsum, Verr_last, ratio, sor,
+                                       omega, omega_next, rho2, conv, Nmax,
+                                       check)
+        omega = omega_next
+        if done:
             break
     print('1D Error', Verr / Vsum, 'after', n+1, 'iterations')
     return V
 
 
-@jit(nopython=True)
 def poisson_2d(X: np.ndarray, Y: np.ndarray, /,
                v_left: float = 0, v_right: float = 0,
                v_top: float = 0, v_bottom: float = 0,
                dielectric: np.ndarray = None, charge: np.ndarray = None,
                bc: list = None, sor=1.8, xsym: bool = False, ysym: bool = False,
-               conv: float = 1e-5, Nmax: int = 1e5):
+               conv: float = 1e-5, Nmax: int = 1e5, method: str = 'sor',
+               precond: str = 'dst', check: int = 1,
+               initial: np.ndarray = None, nested: int = 0,
+               open_bc: int = 0, center: tuple = None, periodic: str = ''):
     '''Two-dimension Poisson equation with fixed potential boundaries.
-    Normalized charge density ps/eps can be provided via the charge argument'''
-    check_arrays_2d(X, Y, dielectric)
-    if charge is not None:
-        raise Exception('Charge is currently not supported')
-    # TODO enforce array types
-    V = np.zeros_like(X, dtype='float64')
+    Normalized charge density ps/eps0 at each node can be provided via the
+    charge argument, or a stack of K of them along a leading axis, solved
+    with the setup of the method shared, returning V of shape (K, nx, ny).
+    X and Y are ij indexed meshgrids or the 1D axes of the grid, see
+    boundary_labels for the forms of bc. The method is 'sor', 'dst' for a
+    direct solution with uniform dielectric and no bc, or 'cg', matrix-free
+    conjugate gradients with the precond 'dst' (the direct solution),
+    'jacobi', 'ssor' or 'chebyshev', see poisson_fast.pcg.
+    SOR with sor='auto' sweeps in red-black order with Chebyshev relaxation
+    factors, from the Jacobi spectral radius estimated from the observed
+    error contraction. Convergence is checked every check iterations.
+    The iteration starts from initial, a prior V such as the solution
+    before a small change of geometry, or with nested > 0 from the
+    solution on every other node (found the same way with nested - 1),
+    interpolated, see coarse_grid. Otherwise it starts from the mean
+    boundary potential. With open_bc > 0 the edges, other than symmetry
+    planes, are open rather than held at v_left etc, see open_boundary,
+    for a potential decaying as 1 / r^open_bc about center: 1 for a 2D
+    dipole such as a wire pair, or a 3D monopole, 2 for a 3D dipole.
+    The axes named in periodic, as in 'x', are periodic with the grid
+    spanning one period, see periodic_boundary, for a unit cell of a
+    repeating structure such as a ribbon cable'''
+    check_method(method, precond)
+    per = check_periodic(periodic, (xsym, ysym))
+    check_edges(method, open_bc, per)
+    shape = grid_shape(X, Y)
+    check_dielectric(shape, dielectric)
+    charge, batch = check_charge(shape, charge)
+    if nested > 0 and initial is None and method != 'dst':
+        axes, er, cbc = coarse_grid((X, Y), dielectric, bc)
+        initial = prolong(poisson_2d(
+            *axes, v_left=v_left, v_right=v_right, v_top=v_top,
+            v_bottom=v_bottom, dielectric=er,
+            charge=None if charge is None else charge[..., ::2, ::2],
+            bc=cbc, sor=sor, xsym=xsym, ysym=ysym, conv=conv, Nmax=Nmax,
+            method=method, precond=precond, check=check, nested=nested - 1,
+            open_bc=open_bc, center=center, periodic=periodic), ndim=2)
+    sor = check_sor(sor)
+    check = check_interval(check)
+    V = np.zeros(shape, dtype='float64')
     V[0, :] = v_left
     V[-1, :] = v_right
     V[:, -1] = v_top
@@ -113,56 +690,178 @@ def poisson_2d(X: np.ndarray, Y: np.ndarray, /,
     V[0, -1] = 0.5 * (v_top + v_left)
     V[-1, -1] = 0.5 * (v_top + v_right)
     V[1:-1, 1:-1] = 0.25 * (v_bottom + v_right + v_top + v_left)
-    nx = X.shape[0]
-    ny = X.shape[1]
-    if bc is None:
-        # Explicit to prompt numba type
-        bc_bool = np.array([[False]])
-        bc_val = np.array([[0.0]])
+    fixed_edges(V, per, ((v_left, v_right), (v_bottom, v_top)))
+    V = batch_start(V, len(charge) if batch else 1, initial, (xsym, ysym))
+    for Vk in V:
+        # Same labels for each, with the fixed potentials applied to it
+        labels, fixed = boundary_labels(bc, Vk)
+    x = grid_axes(X, Y)[0]
+    h = abs(x[1] - x[0])
+    if method != 'sor':
+        V = _poisson_fast(V, dielectric, bc, labels, fixed, (xsym, ysym),
+                          method, precond, conv, Nmax, charge, h)
+        return V if batch else V[0]
+    if any(per):
+        edges = periodic_boundary(shape, labels, fixed, bc is not None,
+                                  (xsym, ysym), per, dielectric)
     else:
-        bc_bool, bc_val = bc
-        for j in range(ny):
-            for i in range(nx):
-                if bc_bool[i, j]:
-                    V[i, j] = bc_val[i, j]
+        edges = open_boundary(grid_axes(X, Y), labels, fixed, bc is not None,
+                              (xsym, ysym), open_bc, center, dielectric)
+    # The active nodes and their ordering are shared by the whole stack
+    index, offsets, coef = _active_2d(V[0], dielectric, labels, fixed,
+                                      bc is not None)
+    split = 0
+    if sor == 0:
+        index, coef, split = _red_black(index, coef, shape)
+    sources = charge_source(shape, charge, h, dielectric, per)
+    for Vk, source in zip(V, itertools.cycle(sources)):
+        _poisson_2d(Vk, source, index, split, offsets, coef, labels, fixed,
+                    bc is not None, sor, xsym, ysym, conv, Nmax, check,
+                    *edges)
+    return V if batch else V[0]
+
+
+@jit(nopython=True)
+def _active_2d(V, dielectric, labels, fixed, has_bc):
+    '''Flat indices of the free interior nodes, in sweep order, and their
+    stencil coefficients to the west, north, east and south neighbours,
+    empty without a dielectric as they are all 0.25'''
+    nx = V.shape[0]
+    ny = V.shape[1]
+    count = 0
+    for j in range(1, ny-1):
+        for i in range(1, nx-1):
+            if not has_bc or _free(fixed, labels[i, j]):
+                count += 1
+    index = np.empty(count, dtype=np.int64)
+    coef = np.empty((count if dielectric is not None else 0, 4))
+    m = 0
+    for j in range(1, ny-1):
+        for i in range(1, nx-1):
+            if not has_bc or _free(fixed, labels[i, j]):
+                index[m] = i * ny + j
+                if dielectric is not None:
+                    er_nw = dielectric[i-1, j]
+                    er_ne = dielectric[i, j]
+                    er_sw = dielectric[i-1, j-1]
+                    er_se = dielectric[i, j-1]
+                    total = 2 * (er_nw + er_ne + er_sw + er_se)
+                    coef[m, 0] = (er_sw + er_nw) / total
+                    coef[m, 1] = (er_nw + er_ne) / total
+                    coef[m, 2] = (er_ne + er_se) / total
+                    coef[m, 3] = (er_se + er_sw) / total
+                m += 1
+    offsets = np.array([-ny, 1, ny, -1])
+    return index, offsets, coef
+
+
+@jit(nopython=True)
+def _sweep(Vf, index, offsets, coef, Sf, sor, measure=True):
+    '''One SOR sweep over the active nodes of the flattened V, with the
+    flat source term Sf if not empty, returning the sum of the residuals
+    and of the potentials if measure'''
+    Verr = 0.0
+    Vsum = 0.0
+    weight = 1 / len(offsets)
+    for m in range(len(index)):
+        n = index[m]
+        V_old = Vf[n]
+        R = 0.0
+        if coef.shape[0] == 0:
+            for k in range(len(offsets)):
+                R += Vf[n + offsets[k]]
+            R = R * weight - V_old
+        else:
+            for k in range(len(offsets)):
+                R += coef[m, k] * Vf[n + offsets[k]]
+            R = R - V_old
+        if Sf.size > 0:
+            R += Sf[n]
+        Vf[n] = R * sor + V_old
+        if measure:
+            Verr += abs(R)
+            Vsum += abs(Vf[n])
+    return Verr, Vsum
+
+
+@jit(nopython=True)
+def _iterate(Vf, index, split, offsets, coef, Sf, sor, omega, rho2,
+             measure):
+    '''One iteration at the fixed factor sor, or if sor is 0 a red-black
+    iteration of the nodes before then after split with Chebyshev factors
+    from omega. Returns the residual and potential sums and next omega'''
+    if sor > 0:
+        Verr, Vsum = _sweep(Vf, index, offsets, coef, Sf, sor, measure)
+        return Verr, Vsum, sor
+    Verr, Vsum = _sweep(Vf, index[:split], offsets, coef[:split], Sf, omega,
+                        measure)
+    omega = _relaxation(omega, rho2)
+    Verr2, Vsum2 = _sweep(Vf, index[split:], offsets, coef[split:], Sf,
+                          omega, measure)
+    return Verr + Verr2, Vsum + Vsum2, _relaxation(omega, rho2)
+
+
+@jit(nopython=True)
+def _converged(n, Verr, Vsum, Verr_last, ratio, sor, omega, omega_next,
+               rho2, conv, Nmax, check):
+    '''Convergence test every check iterations. For sor 'auto' also the
+    contraction ratio over the last two iterations, both measured, and
+    from it the spectral radius estimate if omega has settled. Returns
+    whether converged, the estimate and the ratio'''
+    done = False
+    if (n + 1) % check == 0 or n == Nmax - 1:
+        done = Vsum > 0 and Verr / Vsum < conv
+        if sor == 0 and Verr_last > 0:
+            ratio_last = ratio
+            ratio = Verr / Verr_last
+            if abs(omega_next - omega) < 1e-3 * (2 - omega):
+                rho2 = _spectral_estimate(rho2, omega, ratio, ratio_last)
+    return done, rho2, ratio
+
+
+@jit(nopython=True)
+def _poisson_2d(V, source, index, split, offsets, coef, labels, fixed,
+                has_bc, sor, xsym, ysym, conv, Nmax, check, edge_index,
+                edge_neighbours, edge_weights):
+    '''SOR iteration of V over the active nodes of _active_2d, in the order
+    of _red_black if sor is 0, with the source term of charge_source'''
+    nx = V.shape[0]
+    ny = V.shape[1]
+    Vf = V.reshape(-1)
+    Sf = source.reshape(-1)
+    omega = 1.0
+    rho2 = 0.0
+    Verr = 0.0
+    ratio = 0.0
     for n in range(int(Nmax)):
-        Vsum = 0
-        Verr = 0
         if xsym:
             for j in range(1, ny-1):
-                if not bc or not bc_bool[0, j]:
+                if not has_bc or _free(fixed, labels[0, j]):
                     V[0, j] = 0.25 * (V[0, j+1] + V[0, j-1] + 2*V[1, j])
+                    if Sf.size > 0:
+                        V[0, j] += source[0, j]
         if ysym:
             for i in range(1, nx-1):
-                if not bc or not bc_bool[i, 0]:
+                if not has_bc or _free(fixed, labels[i, 0]):
                     V[i, 0] = 0.25 * (V[i+1, 0] + V[i-1, 0] + 2*V[i, 1])
-        for j in range(1, ny-1):
-            for i in range(1, nx-1):
-                V_old = V[i, j]
-                if not bc or not bc_bool[i, j]:
-                    if dielectric is None:
-                        R = 0.25 * (V[i+1, j] + V[i-1, j] +
-                                    V[i, j+1] + V[i, j-1]) - V_old
-                    else:
-                        er_nw = dielectric[i-1, j]
-                        er_ne = dielectric[i, j]
-                        er_sw = dielectric[i-1, j-1]
-                        er_se = dielectric[i, j-1]
-                        R = (((er_sw + er_nw) * V[i-1, j] +
-                              (er_nw + er_ne) * V[i, j+1] +
-                              (er_ne + er_se) * V[i+1, j] +
-                              (er_se + er_sw) * V[i, j-1]) /
-                             (2 * (er_nw + er_ne + er_sw + er_se))) - V_old
-                    V[i, j] = R * sor + V_old
-                    Verr += abs(R)
-                    Vsum += abs(V[i, j])
-        if Vsum > 0 and Verr / Vsum < conv:
+                    if Sf.size > 0:
+                        V[i, 0] += source[i, 0]
+        _update_nodes(Vf, edge_index, edge_neighbours, edge_weights, Sf)
+        Verr_last = Verr
+        measure = ((n + 1) % check == 0 or (n + 2) % check == 0
+                   or n == Nmax - 1)
+        Verr, Vsum, omega_next = _iterate(Vf, index, split, offsets, coef,
+                                          Sf, sor, omega, rho2, measure)
+        done, rho2, ratio = _converged(n, Verr, Vsum, Verr_last, ratio, sor,
+                                       omega, omega_next, rho2, conv, Nmax,
+                                       check)
+        omega = omega_next
+        if done:
             break
     print('2D Error', Verr / Vsum, 'after', n+1, 'iterations')
     return V
 
 
-@jit(nopython=True)
 def poisson_3d(X: np.ndarray, Y: np.ndarray, Z: np.ndarray, /,
                v_left: float = 0, v_right: float = 0,
                v_top: float = 0, v_bottom: float = 0,
@@ -170,14 +869,39 @@ def poisson_3d(X: np.ndarray, Y: np.ndarray, Z: np.ndarray, /,
                dielectric: np.ndarray = None, charge: np.ndarray = None,
                bc: list = None, sor: float = 1.8,
                xsym: bool = False, ysym: bool = False, zsym: bool = False,
-               conv: float = 1e-5, Nmax: int = 1e5):
+               conv: float = 1e-5, Nmax: int = 1e5, method: str = 'sor',
+               precond: str = 'dst', check: int = 1,
+               initial: np.ndarray = None, nested: int = 0,
+               tiled: bool = False, tile: int = 16,
+               open_bc: int = 0, center: tuple = None, periodic: str = ''):
     '''Three-dimension Poisson equation with fixed potential boundaries.
-    Normalized charge density ps/eps can be provided via the charge argument'''
-    check_arrays_3d(X, Y, Z)
-    if charge is not None:
-        raise Exception('Charge is currently not supported')
-    # TODO enforce array types
-    V = np.zeros_like(X, dtype='float64')
+    Normalized charge density ps/eps0 at each node can be provided via the
+    charge argument, or a stack of K of them, see poisson_2d.
+    X, Y and Z are ij indexed meshgrids or the 1D axes of the grid, see
+    boundary_labels for the forms of bc and poisson_2d for the methods, sor,
+    check, initial, nested, open_bc, center and periodic. SOR with tiled
+    sweeps in red-black order over blocks of tile rows, in parallel on the
+    numba threads, with the convergence rate of the lexicographic sweep
+    and no per node arrays'''
+    check_method(method, precond)
+    per = check_periodic(periodic, (xsym, ysym, zsym))
+    check_edges(method, open_bc, per)
+    shape = grid_shape(X, Y, Z)
+    check_dielectric(shape, dielectric)
+    charge, batch = check_charge(shape, charge)
+    if nested > 0 and initial is None and method != 'dst':
+        axes, er, cbc = coarse_grid((X, Y, Z), dielectric, bc)
+        initial = prolong(poisson_3d(
+            *axes, v_left=v_left, v_right=v_right, v_top=v_top,
+            v_bottom=v_bottom, v_front=v_front, v_back=v_back, dielectric=er,
+            charge=None if charge is None else charge[..., ::2, ::2, ::2],
+            bc=cbc, sor=sor, xsym=xsym, ysym=ysym, zsym=zsym, conv=conv,
+            Nmax=Nmax, method=method, precond=precond, check=check,
+            nested=nested - 1, tiled=tiled, tile=tile, open_bc=open_bc,
+            center=center, periodic=periodic), ndim=3)
+    sor = check_sor(sor)
+    check = check_interval(check)
+    V = np.zeros(shape, dtype='float64')
     V[0, :, :] = v_back
     V[-1, :, :] = v_front
     V[:, 0, :] = v_left
@@ -193,72 +917,399 @@ def poisson_3d(X: np.ndarray, Y: np.ndarray, Z: np.ndarray, /,
     V[0, -1, -1] = 1/3 * (v_top + v_right + v_back)
     V[-1, -1, -1] = 1/3 * (v_top + v_right + v_front)
     V[1:-1, 1:-1, 1:-1] = 1/6 * (v_bottom + v_right + v_top + v_left + v_front + v_back)
-    nx = X.shape[0]
-    ny = X.shape[1]
-    nz = X.shape[2]
-    if bc is None:
-        # Explicit to prompt numba type
-        bc_bool = np.array([[[False]]])
-        bc_val = np.array([[[0.0]]])
+    fixed_edges(V, per, ((v_back, v_front), (v_left, v_right),
+                         (v_bottom, v_top)))
+    V = batch_start(V, len(charge) if batch else 1, initial,
+                    (xsym, ysym, zsym))
+    for Vk in V:
+        # Same labels for each, with the fixed potentials applied to it
+        labels, fixed = boundary_labels(bc, Vk)
+    x = grid_axes(X, Y, Z)[0]
+    h = abs(x[1] - x[0])
+    if method != 'sor':
+        V = _poisson_fast(V, dielectric, bc, labels, fixed,
+                          (xsym, ysym, zsym), method, precond, conv, Nmax,
+                          charge, h)
+        return V if batch else V[0]
+    if any(per):
+        edges = periodic_boundary(shape, labels, fixed, bc is not None,
+                                  (xsym, ysym, zsym), per, dielectric)
     else:
-        bc_bool, bc_val = bc
-        for k in range(nz):
-            for j in range(ny):
-                for i in range(nx):
-                    if bc_bool[i, j, k]:
-                        V[i, j, k] = bc_val[i, j, k]
-    for n in range(int(Nmax)):
-        Vsum = 0
-        Verr = 0
-        if xsym:
-            for k in range(1, nz-1):
-                for j in range(1, ny-1):
-                    if not bc or not bc_bool[0, j, k]:
-                        V[0, j, k] = 1/6 * (V[0, j+1, k] + V[0, j-1, k] + V[0, j, k+1] + V[0, j, k-1] + 2*V[1, j, k])
-        if ysym:
-            for k in range(1, nz-1):
-                for i in range(1, nx-1):
-                    if not bc or not bc_bool[i, 0, k]:
-                        V[i, 0, k] = 1/6 * (V[i+1, 0, k] + V[i-1, 0, k] + V[i, 0, k+1] + V[i, 0, k-1] + 2*V[i, 1, k])
-        if zsym:
-            for j in range(1, ny-1):
-                for i in range(1, nx-1):
-                    if not bc or not bc_bool[i, j, 0]:
-                        V[i, j, 0] = 1/6 * (V[i+1, j, 0] + V[i-1, j, 0] + V[i, j+1, 0] + V[i, j-1, 0] + 2*V[i, j, 1])
+        edges = open_boundary(grid_axes(X, Y, Z), labels, fixed,
+                              bc is not None, (xsym, ysym, zsym), open_bc,
+                              center, dielectric)
+    sources = charge_source(shape, charge, h, dielectric, per)
+    if tiled:
+        for Vk, source in zip(V, itertools.cycle(sources)):
+            _poisson_3d_tiled(Vk, source, dielectric, labels, fixed,
+                              bc is not None, sor, xsym, ysym, zsym, conv,
+                              Nmax, check, tile, *edges)
+        return V if batch else V[0]
+    # The active nodes and their ordering are shared by the whole stack
+    index, offsets, coef = _active_3d(V[0], dielectric, labels, fixed,
+                                      bc is not None)
+    split = 0
+    if sor == 0:
+        index, coef, split = _red_black(index, coef, shape)
+    for Vk, source in zip(V, itertools.cycle(sources)):
+        _poisson_3d(Vk, source, index, split, offsets, coef, labels, fixed,
+                    bc is not None, sor, xsym, ysym, zsym, conv, Nmax, check,
+                    *edges)
+    return V if batch else V[0]
+
+
+@jit(nopython=True)
+def _active_3d(V, dielectric, labels, fixed, has_bc):
+    '''Flat indices of the free interior nodes, in sweep order, and their
+    stencil coefficients to the neighbours at i-1, i+1, j-1, j+1, k-1 and
+    k+1, empty without a dielectric as they are all 1/6'''
+    nx = V.shape[0]
+    ny = V.shape[1]
+    nz = V.shape[2]
+    count = 0
+    for k in range(1, nz-1):
+        for j in range(1, ny-1):
+            for i in range(1, nx-1):
+                if not has_bc or _free(fixed, labels[i, j, k]):
+                    count += 1
+    index = np.empty(count, dtype=np.int64)
+    coef = np.empty((count if dielectric is not None else 0, 6))
+    m = 0
+    for k in range(1, nz-1):
+        for j in range(1, ny-1):
+            for i in range(1, nx-1):
+                if not has_bc or _free(fixed, labels[i, j, k]):
+                    index[m] = (i * ny + j) * nz + k
+                    if dielectric is not None:
+                        er_brb = dielectric[i-1, j, k-1]
+                        er_frb = dielectric[i, j, k-1]
+                        er_blb = dielectric[i-1, j-1, k-1]
+                        er_flb = dielectric[i, j-1, k-1]
+                        er_brt = dielectric[i-1, j, k]
+                        er_frt = dielectric[i, j, k]
+                        er_blt = dielectric[i-1, j-1, k]
+                        er_flt = dielectric[i, j-1, k]
+                        total = 3 * (er_brb + er_frb + er_blb + er_flb +
+                                     er_brt + er_frt + er_blt + er_flt)
+                        coef[m, 0] = (er_brb + er_blb + er_brt + er_blt) / total
+                        coef[m, 1] = (er_frb + er_flb + er_frt + er_flt) / total
+                        coef[m, 2] = (er_blb + er_flb + er_blt + er_flt) / total
+                        coef[m, 3] = (er_brb + er_frb + er_brt + er_frt) / total
+                        coef[m, 4] = (er_brb + er_frb + er_blb + er_flb) / total
+                        coef[m, 5] = (er_brt + er_frt + er_blt + er_flt) / total
+                    m += 1
+    offsets = np.array([-ny * nz, ny * nz, -nz, nz, -1, 1])
+    return index, offsets, coef
+
+
+@jit(nopython=True)
+def _symmetry_3d(V, source, labels, fixed, has_bc, xsym, ysym, zsym):
+    '''Update the free nodes of the symmetry planes at index 0, with the
+    source term if not empty'''
+    nx = V.shape[0]
+    ny = V.shape[1]
+    nz = V.shape[2]
+    charged = source.size > 0
+    if xsym:
         for k in range(1, nz-1):
             for j in range(1, ny-1):
-                for i in range(1, nx-1):
-                    V_old = V[i, j, k]
-                    if not bc or not bc_bool[i, j, k]:
-                        if dielectric is None:
-                            R = (V[i+1, j, k] + V[i-1, j, k] +
-                                 V[i, j+1, k] + V[i, j-1, k] +
-                                 V[i, j, k+1] + V[i, j, k-1]) / 6 - V_old
-                        else:
-                            er_brb = dielectric[i-1, j, k-1]
-                            er_frb = dielectric[i, j, k-1]
-                            er_blb = dielectric[i-1, j-1, k-1]
-                            er_flb = dielectric[i, j-1, k-1]
-                            er_brt = dielectric[i-1, j, k]
-                            er_frt = dielectric[i, j, k]
-                            er_blt = dielectric[i-1, j-1, k]
-                            er_flt = dielectric[i, j-1, k]
-                            R = (((er_brb + er_blb + er_brt + er_blt) * V[i-1, j, k] +
-                                (er_frb + er_flb + er_frt + er_flt) * V[i+1, j, k] +
-                                (er_blb + er_flb + er_blt + er_flt) * V[i, j-1, k] +
-                                (er_brb + er_frb + er_brt + er_frt) * V[i, j+1, k] +
-                                (er_brb + er_frb + er_blb + er_flb) * V[i, j, k-1] +
-                                (er_brt + er_frt + er_blt + er_flt) * V[i, j, k+1]) /
-                                (3 * (er_brb + er_frb + er_blb + er_flb + er_brt + er_frt + er_blt + er_flt))) - V_old
-                        V[i, j, k] = R * sor + V_old
-                        Verr += abs(R)
-                        Vsum += abs(V[i, j, k])
-        if Vsum > 0 and Verr / Vsum < conv:
+                if not has_bc or _free(fixed, labels[0, j, k]):
+                    V[0, j, k] = 1/6 * (V[0, j+1, k] + V[0, j-1, k] + V[0, j, k+1] + V[0, j, k-1] + 2*V[1, j, k])
+                    if charged:
+                        V[0, j, k] += source[0, j, k]
+    if ysym:
+        for k in range(1, nz-1):
+            for i in range(1, nx-1):
+                if not has_bc or _free(fixed, labels[i, 0, k]):
+                    V[i, 0, k] = 1/6 * (V[i+1, 0, k] + V[i-1, 0, k] + V[i, 0, k+1] + V[i, 0, k-1] + 2*V[i, 1, k])
+                    if charged:
+                        V[i, 0, k] += source[i, 0, k]
+    if zsym:
+        for j in range(1, ny-1):
+            for i in range(1, nx-1):
+                if not has_bc or _free(fixed, labels[i, j, 0]):
+                    V[i, j, 0] = 1/6 * (V[i+1, j, 0] + V[i-1, j, 0] + V[i, j+1, 0] + V[i, j-1, 0] + 2*V[i, j, 1])
+                    if charged:
+                        V[i, j, 0] += source[i, j, 0]
+
+
+@jit(nopython=True, parallel=True)
+def _colour_sweep_3d(V, source, dielectric, labels, fixed, has_bc, sor,
+                     colour, measure, tile):
+    '''SOR sweep over the free interior nodes with i + j + k of the parity
+    colour, which only neighbour nodes of the other colour, so tiles of
+    tile rows of an i plane are updated in parallel in any order. Along
+    the rows, k is contiguous in memory. Coefficients are found from the
+    dielectric as needed rather than stored. The source term, if not
+    empty, is added. Returns the sums of the residuals and of the
+    potentials if measure'''
+    nx = V.shape[0]
+    ny = V.shape[1]
+    nz = V.shape[2]
+    nj = (ny - 3) // tile + 1
+    Verr = 0.0
+    Vsum = 0.0
+    for t in prange((nx - 2) * nj):
+        i = 1 + t // nj
+        j0 = 1 + (t % nj) * tile
+        for j in range(j0, min(j0 + tile, ny - 1)):
+            for k in range(1 + (i + j + 1 + colour) % 2, nz - 1, 2):
+                if has_bc and not _free(fixed, labels[i, j, k]):
+                    continue
+                V_old = V[i, j, k]
+                if dielectric is None:
+                    R = 1/6 * (V[i-1, j, k] + V[i+1, j, k] + V[i, j-1, k] +
+                               V[i, j+1, k] + V[i, j, k-1] + V[i, j, k+1])
+                else:
+                    er_brb = dielectric[i-1, j, k-1]
+                    er_frb = dielectric[i, j, k-1]
+                    er_blb = dielectric[i-1, j-1, k-1]
+                    er_flb = dielectric[i, j-1, k-1]
+                    er_brt = dielectric[i-1, j, k]
+                    er_frt = dielectric[i, j, k]
+                    er_blt = dielectric[i-1, j-1, k]
+                    er_flt = dielectric[i, j-1, k]
+                    total = 3 * (er_brb + er_frb + er_blb + er_flb +
+                                 er_brt + er_frt + er_blt + er_flt)
+                    R = ((er_brb + er_blb + er_brt + er_blt) * V[i-1, j, k] +
+                         (er_frb + er_flb + er_frt + er_flt) * V[i+1, j, k] +
+                         (er_blb + er_flb + er_blt + er_flt) * V[i, j-1, k] +
+                         (er_brb + er_frb + er_brt + er_frt) * V[i, j+1, k] +
+                         (er_brb + er_frb + er_blb + er_flb) * V[i, j, k-1] +
+                         (er_brt + er_frt + er_blt + er_flt) * V[i, j, k+1]
+                         ) / total
+                if source.size > 0:
+                    R += source[i, j, k]
+                R = R - V_old
+                V[i, j, k] = R * sor + V_old
+                if measure:
+                    Verr += abs(R)
+                    Vsum += abs(V[i, j, k])
+    return Verr, Vsum
+
+
+@jit(nopython=True)
+def _poisson_3d_tiled(V, source, dielectric, labels, fixed, has_bc, sor,
+                      xsym, ysym, zsym, conv, Nmax, check, tile, edge_index,
+                      edge_neighbours, edge_weights):
+    '''Red-black counterpart of _poisson_3d over tiles of the grid in
+    parallel, see _colour_sweep_3d'''
+    omega = 1.0 if sor == 0 else sor
+    rho2 = 0.0
+    Verr = 0.0
+    ratio = 0.0
+    Vf = V.reshape(-1)
+    Sf = source.reshape(-1)
+    for n in range(int(Nmax)):
+        _symmetry_3d(V, source, labels, fixed, has_bc, xsym, ysym, zsym)
+        _update_nodes(Vf, edge_index, edge_neighbours, edge_weights, Sf)
+        Verr_last = Verr
+        measure = ((n + 1) % check == 0 or (n + 2) % check == 0
+                   or n == Nmax - 1)
+        Verr, Vsum = _colour_sweep_3d(V, source, dielectric, labels, fixed,
+                                      has_bc, omega, 0, measure, tile)
+        omega_half = omega if sor > 0 else _relaxation(omega, rho2)
+        Verr2, Vsum2 = _colour_sweep_3d(V, source, dielectric, labels, fixed,
+                                        has_bc, omega_half, 1, measure, tile)
+        Verr += Verr2
+        Vsum += Vsum2
+        omega_next = omega if sor > 0 else _relaxation(omega_half, rho2)
+        done, rho2, ratio = _converged(n, Verr, Vsum, Verr_last, ratio, sor,
+                                       omega, omega_next, rho2, conv, Nmax,
+                                       check)
+        omega = omega_next
+        if done:
             break
     print('3D Error', Verr / Vsum, 'after', n+1, 'iterations')
     return V
 
 
+@jit(nopython=True)
+def _poisson_3d(V, source, index, split, offsets, coef, labels, fixed,
+                has_bc, sor, xsym, ysym, zsym, conv, Nmax, check, edge_index,
+                edge_neighbours, edge_weights):
+    '''SOR iteration of V over the active nodes of _active_3d, see
+    _poisson_2d'''
+    Vf = V.reshape(-1)
+    Sf = source.reshape(-1)
+    omega = 1.0
+    rho2 = 0.0
+    Verr = 0.0
+    ratio = 0.0
+    for n in range(int(Nmax)):
+        _symmetry_3d(V, source, labels, fixed, has_bc, xsym, ysym, zsym)
+        _update_nodes(Vf, edge_index, edge_neighbours, edge_weights, Sf)
+        Verr_last = Verr
+        measure = ((n + 1) % check == 0 or (n + 2) % check == 0
+                   or n == Nmax - 1)
+        Verr, Vsum, omega_next = _iterate(Vf, index, split, offsets, coef,
+                                          Sf, sor, omega, rho2, measure)
+        done, rho2, ratio = _converged(n, Verr, Vsum, Verr_last, ratio, sor,
+                                       omega, omega_next, rho2, conv, Nmax,
+                                       check)
+        omega = omega_next
+        if done:
+            break
+    print('3D Error', Verr / Vsum, 'after', n+1, 'iterations')
+    return V
+
+
+def axi_coefficients(r: np.ndarray, nz: int, dielectric: np.ndarray = None,
+                     zsym: bool = False):
+    '''Flux coefficients of each node of an axisymmetric r-z grid to its
+    neighbours at i-1, i+1, j-1 and j+1, the face area of its control
+    volume over 2 pi h^2 times the face permittivity, with r the radial
+    axis in units of the spacing h. A node at r = 0 is on the axis, with
+    no inner face and a control volume of radius 1/2. With zsym the
+    plane j = 0 is a symmetry plane, its j-1 neighbour mirrored to j+1'''
+    nr = len(r)
+    if dielectric is None:
+        dielectric = np.ones((nr - 1, nz - 1))
+    # Cells (i-1, j-1), (i-1, j), (i, j-1) and (i, j) around each node,
+    # edge padded so that those beyond the grid are its mirror images
+    er = np.pad(np.asarray(dielectric, dtype=float), 1, mode='edge')
+    er_ll = er[:-1, :-1]
+    er_lu = er[:-1, 1:]
+    er_rl = er[1:, :-1]
+    er_ru = er[1:, 1:]
+    ri = np.asarray(r, dtype=float)[:, np.newaxis]
+    axis = ri <= 0
+    inner = np.where(axis, 0.0, 0.5 * ri - 0.125)
+    outer = 0.5 * ri + 0.125
+    coef = np.empty((nr, nz, 4))
+    coef[..., 0] = np.where(axis, 0.0, (ri - 0.5) * 0.5 * (er_ll + er_lu))
+    coef[..., 1] = (ri + 0.5) * 0.5 * (er_rl + er_ru)
+    coef[..., 2] = inner * er_ll + outer * er_rl
+    coef[..., 3] = inner * er_lu + outer * er_ru
+    if zsym:
+        coef[:, 0, 3] += coef[:, 0, 2]
+        coef[:, 0, 2] = 0.0
+    return coef
+
+
+def axi_source(r: np.ndarray, coef: np.ndarray, charge: np.ndarray,
+               h: float):
+    '''Source term of the stencil of each node of an r-z grid, h^2 charge
+    times its control volume over 2 pi h^3, r for a ring and 1/8 on the
+    axis, over the sum of its coefficients, see axi_coefficients. Returns
+    one per charge distribution, or a single empty one without charge'''
+    if charge is None:
+        return np.zeros((1, 0, 0))
+    volume = np.where(r <= 0, 0.125, r)[:, np.newaxis]
+    total = coef.sum(axis=-1)
+    return (h**2 * np.reshape(charge, (-1,) + total.shape) * volume
+            / np.where(total > 0, total, 1.0))
+
+
+@jit(nopython=True)
+def _active_axi(V, coef, labels, fixed, has_bc, axis, zsym):
+    '''Flat indices of the free nodes of an r-z grid, in sweep order, and
+    their normalized coefficients, see axi_coefficients'''
+    nr = V.shape[0]
+    nz = V.shape[1]
+    i0 = 0 if axis else 1
+    j0 = 0 if zsym else 1
+    count = 0
+    for j in range(j0, nz-1):
+        for i in range(i0, nr-1):
+            if not has_bc or _free(fixed, labels[i, j]):
+                count += 1
+    index = np.empty(count, dtype=np.int64)
+    norm = np.empty((count, 4))
+    m = 0
+    for j in range(j0, nz-1):
+        for i in range(i0, nr-1):
+            if not has_bc or _free(fixed, labels[i, j]):
+                index[m] = i * nz + j
+                total = coef[i, j].sum()
+                for k in range(4):
+                    norm[m, k] = coef[i, j, k] / total
+                m += 1
+    offsets = np.array([-nz, nz, -1, 1])
+    return index, offsets, norm
+
+
+@jit(nopython=True)
+def _poisson_axi(V, source, index, split, offsets, norm, sor, conv, Nmax,
+                 check):
+    # Axis and symmetry plane nodes have zero coefficients to their missing
+    # neighbours, so the reads that wrap around the flat V have no effect
+    Vf = V.reshape(-1)
+    Sf = source.reshape(-1)
+    omega = 1.0
+    rho2 = 0.0
+    Verr = 0.0
+    ratio = 0.0
+    for n in range(int(Nmax)):
+        Verr_last = Verr
+        measure = ((n + 1) % check == 0 or (n + 2) % check == 0
+                   or n == Nmax - 1)
+        Verr, Vsum, omega_next = _iterate(Vf, index, split, offsets, norm,
+                                          Sf, sor, omega, rho2, measure)
+        done, rho2, ratio = _converged(n, Verr, Vsum, Verr_last, ratio, sor,
+                                       omega, omega_next, rho2, conv, Nmax,
+                                       check)
+        omega = omega_next
+        if done:
+            break
+    print('Axisymmetric Error', Verr / Vsum, 'after', n+1, 'iterations')
+    return V
+
+
+def poisson_axi(R: np.ndarray, Z: np.ndarray, /,
+                v_left: float = 0, v_right: float = 0,
+                v_top: float = 0, v_bottom: float = 0,
+                dielectric: np.ndarray = None, charge: np.ndarray = None,
+                bc: list = None, sor=1.8, zsym: bool = False,
+                conv: float = 1e-5, Nmax: int = 1e5, check: int = 1,
+                initial: np.ndarray = None):
+    '''Axisymmetric Poisson equation in cylindrical coordinates r, z, with
+    fixed potential boundaries, for structures with rotational symmetry.
+    R and Z are ij indexed meshgrids or the 1D axes of the grid, with R
+    from 0, the axis, which has no boundary and ignores v_left, or from
+    a positive radius where v_left is held. The stencil is that of the
+    ring shaped control volume of each node, see axi_coefficients. See
+    poisson_2d for the other arguments, with zsym a symmetry plane at the
+    first z and charge ps/eps0 at each node, or a stack of them'''
+    shape = grid_shape(R, Z)
+    check_dielectric(shape, dielectric)
+    charge, batch = check_charge(shape, charge)
+    r = R if np.ndim(R) == 1 else R[:, 0]
+    if r[0] < 0:
+        raise Exception('Radius must not be negative')
+    h = r[1] - r[0]
+    axis = r[0] == 0
+    sor = check_sor(sor)
+    check = check_interval(check)
+    V = np.zeros(shape, dtype='float64')
+    V[0, :] = v_left
+    V[-1, :] = v_right
+    V[:, -1] = v_top
+    V[:, 0] = v_bottom
+    V[0, 0] = 0.5 * (v_bottom + v_left)
+    V[-1, 0] = 0.5 * (v_bottom + v_right)
+    V[0, -1] = 0.5 * (v_top + v_left)
+    V[-1, -1] = 0.5 * (v_top + v_right)
+    V[1:-1, 1:-1] = 0.25 * (v_bottom + v_right + v_top + v_left)
+    if axis:
+        V[0, 1:-1] = V[1, 1:-1]
+    V = batch_start(V, len(charge) if batch else 1, initial, (axis, zsym))
+    for Vk in V:
+        # Same labels for each, with the fixed potentials applied to it
+        labels, fixed = boundary_labels(bc, Vk)
+    coef = axi_coefficients(r / h, shape[1], dielectric, zsym)
+    index, offsets, norm = _active_axi(V[0], coef, labels, fixed,
+                                       bc is not None, axis, zsym)
+    split = 0
+    if sor == 0:
+        index, norm, split = _red_black(index, norm, shape)
+    sources = axi_source(r / h, coef, charge, h)
+    for Vk, source in zip(V, itertools.cycle(sources)):
+        _poisson_axi(Vk, source, index, split, offsets, norm, sor, conv,
+                     Nmax, check)
+    return V if batch else V[0]
+
+
 def gauss_1d(X: np.ndarray, V: np.ndarray, er: np.ndarray, i: int):
     '''One-dimensional Gauss' law, returning enclosed charge
     Evaluated at array index i
@@ -304,6 +1355,34 @@ def gauss_2d(X: np.ndarray, Y: np.ndarray, V: np.ndarray, er: np.ndarray,
     return EPS0 * qe
 
 
+def gauss_axi(R: np.ndarray, Z: np.ndarray, V: np.ndarray, er: np.ndarray,
+              ri1: int, ri2: int, zi1: int, zi2: int, zsym: bool = False):
+    '''Axisymmetric Gauss' law, returning the charge enclosed by the control
+    volumes of nodes ri1 to ri2 and zi1 to zi2 of poisson_axi, the net
+    flux out of its faces with the solver's coefficients. A ri1 of 0 on
+    the axis has no inner face. With zsym and zi1 of 0 the mirror image
+    below the symmetry plane is included
+    Note: charge polarity is positive for V decreasing away from it'''
+    r = R if np.ndim(R) == 1 else R[:, 0]
+    z = Z if np.ndim(Z) == 1 else Z[0, :]
+    h = r[1] - r[0]
+    coef = axi_coefficients(r / h, len(z), er)
+    rows = np.arange(ri1, ri2 + 1)
+    cols = np.arange(zi1, zi2 + 1)
+    # Radial faces in the symmetry plane have half their height above it
+    height = np.where((cols == 0) & zsym, 0.5, 1.0)
+    flux = np.sum(height * coef[ri2, cols, 1] * (V[ri2, cols] - V[ri2 + 1, cols]))
+    if r[ri1] > 0:
+        flux += np.sum(height * coef[ri1, cols, 0] *
+                       (V[ri1, cols] - V[ri1 - 1, cols]))
+    flux += np.sum(coef[rows, zi2, 3] * (V[rows, zi2] - V[rows, zi2 + 1]))
+    if zsym and zi1 == 0:
+        flux *= 2
+    else:
+        flux += np.sum(coef[rows, zi1, 2] * (V[rows, zi1] - V[rows, zi1 - 1]))
+    return 2 * np.pi * EPS0 * h * flux
+
+
 def trough_analytical(X: np.ndarray, Y: np.ndarray,
                       v_left: float = 0, v_right: float = 0,
                       v_top: float = 0, v_bottom: float = 0):
@@ -360,8 +1439,7 @@ def example_parallel_plates():
     erb = np.select([X[:-1] < 2e-3, X[:-1] < 3e-3, X[:-1] < 4e-3],
                     [er2, er1, er2])
 
-    V1 = poisson_1d(X, dielectric=era, **bc)
-    V2 = poisson_1d(X, dielectric=erb, **bc)
+    V1, V2 = poisson_1d(X, dielectric=np.stack((era, erb)), **bc)
 
     _, ax = plt.subplots()
     ax.plot(X, V1, label='2-layer')
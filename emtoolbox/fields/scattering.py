@@ -3,57 +3,206 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib as mpl
-import scipy
-from scipy.special import jv, jvp, hankel2
+from scipy.interpolate import RegularGridInterpolator
+from scipy.special import jv, jvp, hankel2, h2vp
+
+
+def truncation_order(kr_max: float) -> int:
+    '''Number of modes for the series to converge up to kr_max (Wiscombe)'''
+    return int(np.ceil(kr_max + 4 * np.cbrt(kr_max) + 2))
+
+
+def _mode_sum(coef, kind, kR, phi):
+    '''Sum of coef[n] * B_n(kR) * exp(j n phi) for n in -N..N, where coef
+    has the orders 0..N and B is jv for kind 'j' or hankel2 for 'h2'.
+
+    The modes of a wave incident along x are symmetric,
+    (-1)^n coef[-n] B_{-n} = coef[n] B_n, so the negative orders are folded
+    in as cos(n phi). The orders are generated by recurrence,
+    B_{n-1} + B_{n+1} = 2n / x B_n, downward for jv and upward for
+    hankel2 where each direction is stable. The downward recurrence
+    of each point starts where jv is still representable, the orders
+    above are negligible'''
+    N = len(coef) - 1
+    weight = np.where(np.arange(N + 1) == 0, 1, 2) * coef
+    total = np.zeros(kR.shape, dtype=complex)
+    if kind == 'j':
+        origin = kR == 0
+        x = np.where(origin, 1.0, kR)
+        start = np.minimum(N, np.ceil(abs(x) + 8 * np.cbrt(abs(x)) + 20))
+        b_next = np.zeros(x.shape, dtype=np.result_type(x, float))
+        b = np.zeros_like(b_next)
+        for n in range(N, -1, -1):
+            seed = start == n
+            if seed.any():
+                b_next[seed], b[seed] = jv(n + 1, x[seed]), jv(n, x[seed])
+            total += weight[n] * b * np.cos(n * phi)
+            b_next, b = b, 2 * n / x * b - b_next
+        total[origin] = weight[0]
+    else:
+        b_prev, b = hankel2(-1, kR), hankel2(0, kR)
+        for n in range(N + 1):
+            total += weight[n] * b * np.cos(n * phi)
+            b_prev, b = b, 2 * n / kR * b - b_prev
+    return total
+
+
+def _grid(R, phi):
+    R, phi = np.broadcast_arrays(np.asarray(R, dtype=float),
+                                 np.asarray(phi, dtype=float))
+    return R, phi, np.zeros(R.shape, dtype=complex)
+
+
+def conducting_coefficients(k, radius, N):
+    '''Scattered mode coefficients of a conducting cylinder, orders 0..N,
+    for a unit wave incident along x'''
+    n = np.arange(N + 1)
+    return -(1.j)**-n * jv(n, k*radius) / hankel2(n, k*radius)
+
+
+def dielectric_coefficients(k, a, er, ur, N):
+    '''Scattered and internal mode coefficients of a dielectric cylinder'''
+    kd = k * np.sqrt(ur * er)
+    n = np.arange(N + 1)
+    hn2 = hankel2(n, k*a)
+    hn2p = h2vp(n, k*a)
+
+    an_n = np.sqrt(ur) * jvp(n, k*a) * jv(n, kd*a) - np.sqrt(er) * jv(n, k*a) * jvp(n, kd*a)
+    an_d = np.sqrt(ur) * hn2p * jv(n, kd*a) - np.sqrt(er) * hn2 * jvp(n, kd * a)
+    an = -(1.j)**-n * an_n / an_d
 
-N0 = 40
+    cn_n = 2 * np.sqrt(ur)
+    cn = (1.j)**-(n+1) / (np.pi * k * a) * cn_n / an_d
+    return an, cn
 
 
-def cyl_wave(R, phi, wavelength, E0=1.0, N=N0):
-    '''Cylindrical wave polarized in Z-direction'''
-    Ez = 0
+def cyl_wave(R, phi, wavelength, E0=1.0, N=None):
+    '''Cylindrical wave polarized in Z-direction, the number of modes
+    N is chosen from the largest kR if not given'''
+    R, phi, Ez = _grid(R, phi)
     k = 2 * np.pi / wavelength
-    for n in range(-N, N):
-        Ez += E0 * (1.j)**-n * jv(n, k*R) * np.exp(1.j*n*phi)
+    if N is None:
+        N = truncation_order(k * R.max(initial=0))
+    n = np.arange(N + 1)
+    Ez.flat = _mode_sum(E0 * (1.j)**-n, 'j', k * R.ravel(), phi.ravel())
     return Ez
 
 
-def scatter_conducting_cylinder(R, phi, wavelength, radius, E0=1.0, N=N0):
-    '''Scattered field from a conducting cylinder'''
-    Ez = 0
+def scatter_conducting_cylinder(R, phi, wavelength, radius, E0=1.0, N=None):
+    '''Scattered field from a conducting cylinder, zero inside'''
+    R, phi, Ez = _grid(R, phi)
     k = 2 * np.pi / wavelength
-    for n in range(-N, N):
-        an = -(1.j)**-n * jv(n, k*radius) / hankel2(n, k*radius)
-        Ez += E0 * an * hankel2(n, k*R) * np.exp(1.j*n*phi)
-    Ez[R < radius] = 0
+    if N is None:
+        N = truncation_order(k * radius)
+    an = conducting_coefficients(k, radius, N)
+    out = R >= radius
+    Ez[out] = _mode_sum(E0 * an, 'h2', k * R[out], phi[out])
     return Ez
 
 
-def scatter_dielectric_cylinder(R, phi, wavelength, radius, er=1.0, ur=1.0, E0=1.0, N=N0):
-    '''Scattered field from a dielectric cylinder'''
-    Ezs = 0
-    Ezint = 0
+def scatter_dielectric_cylinder(R, phi, wavelength, radius, er=1.0, ur=1.0, E0=1.0, N=None):
+    '''Scattered field from a dielectric cylinder.
+    Returns the internal field and the scattered field with the internal
+    field inside the cylinder. The internal field is zero outside, where
+    R >= radius, rather than the interior series continued there, which
+    has no physical meaning and is not converged for the order chosen'''
+    R, phi, Ezs = _grid(R, phi)
+    Ezint = np.zeros_like(Ezs)
     k = 2 * np.pi / wavelength
     kd = k * np.sqrt(ur * er)
     a = radius
-    for n in range(-N, N):
-        hn2 = hankel2(n, k*a)
-        dr = 0.001 * k*a
-        hn2p = (hankel2(n, k*a + dr) - hankel2(n, k*a - dr)) / (2 * dr)
-
-        an_n = np.sqrt(ur) * jvp(n, k*a) * jv(n, kd*a) - np.sqrt(er) * jv(n, k*a) * jvp(n, kd*a)
-        an_d = np.sqrt(ur) * hn2p * jv(n, kd*a) - np.sqrt(er) * hn2 * jvp(n, kd * a)
-        an = -(1.j)**-n * an_n / an_d
-        Ezs += E0 * an * hankel2(n, k*R) * np.exp(1.j*n*phi)
-
-        cn_n = 2 * np.sqrt(ur)
-        cn_d = np.sqrt(ur) * hn2p * jv(n, kd*a) - np.sqrt(er) * hn2 * jvp(n, kd*a)
-        cn = (1.j)**-(n+1) / (np.pi * k * a) * cn_n / cn_d
-        Ezint += E0 * cn * jv(n, kd*R) * np.exp(1.j*n*phi)
-    Ezs[R < a] = Ezint[R < a]
+    if N is None:
+        N = truncation_order(max(k, abs(kd)) * a)
+    an, cn = dielectric_coefficients(k, a, er, ur, N)
+    inside = R < a
+    Ezs[~inside] = _mode_sum(E0 * an, 'h2', k * R[~inside], phi[~inside])
+    Ezint[inside] = _mode_sum(E0 * cn, 'j', kd * R[inside], phi[inside])
+    Ezs[inside] = Ezint[inside]
     return Ezint, Ezs
 
 
+def polar_angles(n_phi: int) -> np.ndarray:
+    '''Azimuth samples of the polar grid, 2 pi p / n_phi'''
+    return 2 * np.pi * np.arange(n_phi) / n_phi
+
+
+def _polar_sum(coef, B, n_phi):
+    '''Mode series on rings, sum of coef[n] * B[n, ring] * exp(j n phi) for
+    n in -N..N at phi = polar_angles(n_phi), by an inverse FFT per ring.
+    As in _mode_sum the negative orders mirror the positive ones. Orders
+    above n_phi / 2 are folded onto the FFT bins, which is exact at the
+    sample angles'''
+    N = len(coef) - 1
+    n = np.arange(-N, N + 1)
+    terms = coef[:, np.newaxis] * B
+    spectrum = np.zeros((B.shape[1], n_phi), dtype=complex)
+    np.add.at(spectrum.T, n % n_phi, terms[abs(n)])
+    return n_phi * np.fft.ifft(spectrum, axis=1)
+
+
+def cyl_wave_polar(r, n_phi, wavelength, E0=1.0, N=None):
+    '''Cylindrical wave on a polar grid of radii r and n_phi angles,
+    returns an array of shape (len(r), n_phi), see polar_angles'''
+    r = np.asarray(r, dtype=float)
+    k = 2 * np.pi / wavelength
+    if N is None:
+        N = truncation_order(k * r.max(initial=0))
+    n = np.arange(N + 1)
+    B = jv(n[:, np.newaxis], k * r[np.newaxis, :])
+    return _polar_sum(E0 * (1.j)**-n, B, n_phi)
+
+
+def scatter_conducting_cylinder_polar(r, n_phi, wavelength, radius, E0=1.0,
+                                      N=None):
+    '''Scattered field from a conducting cylinder on a polar grid'''
+    r = np.asarray(r, dtype=float)
+    k = 2 * np.pi / wavelength
+    if N is None:
+        N = truncation_order(k * radius)
+    n = np.arange(N + 1)
+    out = r >= radius
+    B = np.zeros((N + 1, len(r)), dtype=complex)
+    B[:, out] = hankel2(n[:, np.newaxis], k * r[np.newaxis, out])
+    return _polar_sum(E0 * conducting_coefficients(k, radius, N), B, n_phi)
+
+
+def scatter_dielectric_cylinder_polar(r, n_phi, wavelength, radius, er=1.0,
+                                      ur=1.0, E0=1.0, N=None):
+    '''Scattered field from a dielectric cylinder on a polar grid,
+    returns the internal and scattered fields as scatter_dielectric_cylinder'''
+    r = np.asarray(r, dtype=float)
+    k = 2 * np.pi / wavelength
+    kd = k * np.sqrt(ur * er)
+    if N is None:
+        N = truncation_order(max(k, abs(kd)) * radius)
+    an, cn = dielectric_coefficients(k, radius, er, ur, N)
+    n = np.arange(N + 1)[:, np.newaxis]
+    inside = r < radius
+    Bs = np.zeros((N + 1, len(r)), dtype=complex)
+    Bs[:, ~inside] = hankel2(n, k * r[~inside])
+    Bint = np.zeros((N + 1, len(r)), dtype=complex)
+    Bint[:, inside] = jv(n, kd * r[inside])
+    Ezint = _polar_sum(E0 * cn, Bint, n_phi)
+    Ezs = _polar_sum(E0 * an, Bs, n_phi)
+    Ezs[inside] = Ezint[inside]
+    return Ezint, Ezs
+
+
+def polar_to_cartesian(r, Ez, X, Y):
+    '''Linear interpolation of a polar grid field Ez, shape (len(r), n_phi),
+    to points X, Y; zero outside the range of r. A jump in the field,
+    as at the surface of a dielectric cylinder, is spread over one ring'''
+    r = np.asarray(r, dtype=float)
+    n_phi = Ez.shape[1]
+    phi = np.append(polar_angles(n_phi), 2 * np.pi)
+    values = np.concatenate((Ez, Ez[:, :1]), axis=1)
+    interp = RegularGridInterpolator((r, phi), values, bounds_error=False,
+                                     fill_value=0.0)
+    R = np.hypot(X, Y)
+    phi = np.mod(np.arctan2(Y, X), 2 * np.pi)
+    return interp((R, phi))
+
+
 def plot_cyl_wave(ax, X, Y, Ez, title=None, norm=None):
     p = ax.pcolor(X, Y, np.real(Ez), shading='auto', norm=norm)
     ax.set_title(title)
@@ -39,12 +39,23 @@ class Geometry():
         else:
             return 0.5*(x[1:] + x[:-1])
 
-    def mask(self, grid):
-        x = 0.5 * (grid[1:] + grid[:-1])
-        mask = np.zeros_like(x)
-        for i, xi in enumerate(x):
-            mask[i] = self.hit(xi)
-        return mask
+    def labels(self, grid, nodes=False):
+        '''Index of the child at each cell centre, or grid point if nodes,
+        -1 where there is none. Children are painted in order, each only
+        over its extent, so later children cover earlier ones. The grid
+        may be ascending or descending'''
+        grid, fx = ascending(grid)
+        x = grid if nodes else 0.5 * (grid[1:] + grid[:-1])
+        result = np.full(len(x), -1)
+        for index, child in enumerate(self.children):
+            sx, hit = child.raster(x)
+            result[sx][hit] = index
+        return np.ascontiguousarray(result[fx])
+
+    def mask(self, grid, nodes=False):
+        labels = self.labels(grid, nodes)
+        positive = np.array([c.positive for c in self.children] + [False])
+        return positive[labels].astype(float)
 
     def child_at(self, x):
         for child in reversed(self.children):
@@ -52,12 +63,25 @@ class Geometry():
                 return child
         return None
 
-    def select(self, param, grid):
-        x = 0.5 * (grid[1:] + grid[:-1])
-        result = np.zeros_like(x)
-        for i, xi in enumerate(x):
-            result[i] = self.child_at(xi).params.get(param, 0)
-        return result
+    def select(self, param, grid, nodes=False):
+        '''Parameter of the child at each cell, 0 where it is not defined'''
+        labels = self.labels(grid, nodes)
+        values = np.array([c.params.get(param, 0) for c in self.children]
+                          + [0])
+        return values[labels]
+
+
+def ascending(points):
+    '''Points in ascending order and the slice, reversing them or not,
+    that maps results on them back to the given order. Raises unless the
+    points are strictly monotonic'''
+    points = np.asarray(points)
+    step = np.diff(points)
+    if np.all(step > 0):
+        return points, slice(None)
+    if np.all(step < 0):
+        return points[::-1], slice(None, None, -1)
+    raise Exception('Grid points must be strictly monotonic')
 
 
 class Shape():
@@ -69,6 +93,11 @@ class Shape():
     def hit(self, x) -> bool:
         return False
 
+    def raster(self, x):
+        '''Slice of sorted coordinates x covering the shape and the hits
+        within it, evaluated by hit at every point'''
+        return slice(None), np.vectorize(self.hit, otypes=[bool])(x)
+
 
 class Rect(Shape):
     def __init__(self, left: float, width: float):
@@ -84,6 +113,11 @@ class Rect(Shape):
     def hit(self, x) -> bool:
         return x >= self.left and x <= self.right
 
+    def raster(self, x):
+        sx = slice(np.searchsorted(x, self.left, 'left'),
+                   np.searchsorted(x, self.right, 'right'))
+        return sx, np.ones(len(x[sx]), dtype=bool)
+
 
 if __name__ == '__main__':
     rectp = Rect(0.0, 4.0)
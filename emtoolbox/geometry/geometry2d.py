@@ -11,15 +11,25 @@ import matplotlib.pyplot as plt
 class Geometry():
     def __init__(self):
         self.children = []
+        self._index = None
 
     def add_child(self, new_child):
         self.children.append(new_child)
+        self._index = None
+
+    def index(self):
+        '''Bin index of the children, built on first use after a child is
+        added. Call reindex if children are moved afterwards'''
+        if self._index is None:
+            self._index = BinIndex(self.children)
+        return self._index
+
+    def reindex(self):
+        self._index = None
 
     def hit(self, x, y):
-        for child in reversed(self.children):
-            if child.hit(x, y):
-                return child.positive
-        return False
+        child = self.child_at(x, y)
+        return child is not None and child.positive
 
     def bounds(self):
         if len(self.children) == 0:
@@ -44,31 +54,156 @@ class Geometry():
         else:
             return np.meshgrid(0.5*(x[1:] + x[:-1]), 0.5*(y[1:] + y[:-1]), indexing='ij')
 
-    def mask(self, grid_x, grid_y):
+    def labels(self, grid_x, grid_y, nodes=False):
+        '''Index of the child at each cell centre, or grid point if nodes,
+        -1 where there is none. Children are painted in order, each only
+        over its bounding box, so later children cover earlier ones. The
+        axes of the grid may be ascending or descending'''
         assert grid_x.shape == grid_y.shape
-        x = 0.5 * (grid_x[1:, 0] + grid_x[:-1, 0])
-        y = 0.5 * (grid_y[0, 1:] + grid_y[0, :-1])
-        result = np.zeros((len(x), len(y)))
-        for i, xi in enumerate(x):
-            for j, yi in enumerate(y):
-                result[i, j] = self.hit(xi, yi)
-        return result
+        x, fx = ascending(grid_x[:, 0])
+        y, fy = ascending(grid_y[0, :])
+        if not nodes:
+            x = 0.5 * (x[1:] + x[:-1])
+            y = 0.5 * (y[1:] + y[:-1])
+        result = np.full((len(x), len(y)), -1)
+        for index, child in enumerate(self.children):
+            sx, sy, hit = child.raster(x, y)
+            result[sx, sy][hit] = index
+        return np.ascontiguousarray(result[fx, fy])
+
+    def mask(self, grid_x, grid_y, nodes=False):
+        labels = self.labels(grid_x, grid_y, nodes)
+        positive = np.array([c.positive for c in self.children] + [False])
+        return positive[labels].astype(float)
 
     def child_at(self, x, y):
-        for child in reversed(self.children):
-            if child.hit(x, y):
-                return child
+        '''Last added child containing x, y, None if there is none'''
+        if len(self.children) == 0:
+            return None
+        for index in self.index().candidates(x, y):
+            if self.children[index].hit(x, y):
+                return self.children[index]
         return None
 
-    def select(self, param, grid_x, grid_y):
+    def select(self, param, grid_x, grid_y, nodes=False):
+        '''Parameter of the child at each cell, 0 where it is not defined'''
+        labels = self.labels(grid_x, grid_y, nodes)
+        values = np.array([c.params.get(param, 0) for c in self.children]
+                          + [0])
+        return values[labels]
+
+    def _blend(self, values, grid_x, grid_y, nodes, background):
+        '''Paint values of the children weighted by the fraction of each
+        cell they cover, later children over earlier ones'''
         assert grid_x.shape == grid_y.shape
-        x = 0.5 * (grid_x[1:, 0] + grid_x[:-1, 0])
-        y = 0.5 * (grid_y[0, 1:] + grid_y[0, :-1])
-        result = np.zeros((len(x), len(y)))
-        for i, xi in enumerate(x):
-            for j, yi in enumerate(y):
-                result[i, j] = self.child_at(xi, yi).params.get(param, 0)
-        return result
+        xe, fx = ascending(cell_edges(grid_x[:, 0], nodes))
+        ye, fy = ascending(cell_edges(grid_y[0, :], nodes))
+        result = np.full((len(xe) - 1, len(ye) - 1), background,
+                         dtype=np.result_type(background, *values, float))
+        for value, child in zip(values, self.children):
+            sx, sy, frac = child.coverage(xe, ye)
+            result[sx, sy] += frac * (value - result[sx, sy])
+        return np.ascontiguousarray(result[fx, fy])
+
+    def coverage(self, grid_x, grid_y, nodes=False):
+        '''Fraction of each cell inside the geometry, partial volume
+        counterpart of mask'''
+        values = [1.0 if c.positive else 0.0 for c in self.children]
+        return self._blend(values, grid_x, grid_y, nodes, 0.0)
+
+    def average(self, param, grid_x, grid_y, nodes=False, background=0.0,
+                mean='arithmetic'):
+        '''Area weighted average of a parameter over each cell, partial
+        volume counterpart of select. Cells are between grid points, as
+        the poisson_2d dielectric, or centred on them if nodes, as the
+        Grid2D materials. The harmonic mean suits a permittivity with the
+        field normal to the interface, the arithmetic mean one with the
+        field along it'''
+        values = [c.params.get(param, 0) for c in self.children]
+        if mean == 'arithmetic':
+            return self._blend(values, grid_x, grid_y, nodes, background)
+        elif mean == 'harmonic':
+            if background == 0 or 0 in values:
+                raise ValueError(f'Harmonic mean of {param} with zero values')
+            inverse = [1 / v for v in values]
+            return 1 / self._blend(inverse, grid_x, grid_y, nodes,
+                                   1 / background)
+        raise Exception(f'Invalid mean specified: {mean}')
+
+
+class BinIndex():
+    '''Uniform grid of bins over the bounds of a set of shapes, each bin
+    listing the shapes whose bounding box overlaps it, last added first.
+    A point query then only tests the shapes of one bin. The default of
+    about one bin per shape suits shapes of similar size'''
+    def __init__(self, children, bins: int = None):
+        if len(children) == 0:
+            raise Exception('Geometry has no children')
+        boxes = np.array([[c.left, c.right, c.bottom, c.top]
+                          for c in children], dtype=float)
+        if bins is None:
+            bins = int(np.ceil(np.sqrt(len(children))))
+        self.bins = bins
+        self.left, self.bottom = boxes[:, 0].min(), boxes[:, 2].min()
+        self.right, self.top = boxes[:, 1].max(), boxes[:, 3].max()
+        self.dx = (self.right - self.left) / bins or 1.0
+        self.dy = (self.top - self.bottom) / bins or 1.0
+        ix = self._bin(boxes[:, :2], self.left, self.dx)
+        iy = self._bin(boxes[:, 2:], self.bottom, self.dy)
+        self.table = [[[] for _ in range(bins)] for _ in range(bins)]
+        for index in range(len(children) - 1, -1, -1):
+            for i in range(ix[index, 0], ix[index, 1] + 1):
+                for j in range(iy[index, 0], iy[index, 1] + 1):
+                    self.table[i][j].append(index)
+
+    def _bin(self, u, start, step):
+        return np.clip(np.floor((u - start) / step).astype(int),
+                       0, self.bins - 1)
+
+    def candidates(self, x, y) -> list:
+        '''Indices of the shapes that may contain x, y, last added first'''
+        if not (self.left <= x <= self.right and self.bottom <= y <= self.top):
+            return []
+        i = self._bin(x, self.left, self.dx)
+        j = self._bin(y, self.bottom, self.dy)
+        return self.table[i][j]
+
+
+def cell_edges(points, nodes=False):
+    '''Cell edges along one axis: the points themselves, or if nodes the
+    midpoints between them, extended by half a cell at either end'''
+    if not nodes:
+        return points
+    mid = 0.5 * (points[1:] + points[:-1])
+    return np.concatenate(([1.5 * points[0] - 0.5 * points[1]], mid,
+                           [1.5 * points[-1] - 0.5 * points[-2]]))
+
+
+def ascending(points):
+    '''Points in ascending order and the slice, reversing them or not,
+    that maps results on them back to the given order. Raises unless the
+    points are strictly monotonic'''
+    points = np.asarray(points)
+    step = np.diff(points)
+    if np.all(step > 0):
+        return points, slice(None)
+    if np.all(step < 0):
+        return points[::-1], slice(None, None, -1)
+    raise Exception('Grid points must be strictly monotonic')
+
+
+def _disk_quadrant(x, y, radius):
+    '''Signed area of a disk at the origin within the rectangle from the
+    origin to x, y'''
+    ax = np.minimum(np.abs(x), radius)
+    ay = np.minimum(np.abs(y), radius)
+    xc = np.minimum(ax, np.sqrt(radius**2 - ay**2))
+
+    def primitive(u):
+        return 0.5 * (u * np.sqrt(radius**2 - u**2)
+                      + radius**2 * np.arcsin(u / radius))
+    area = ay * xc + primitive(ax) - primitive(xc)
+    return np.sign(x) * np.sign(y) * area
 
 
 class Shape():
@@ -80,6 +215,41 @@ class Shape():
     def hit(self, x, y) -> bool:
         return False
 
+    def raster(self, x, y):
+        '''Slices of sorted coordinates x, y covering the shape and the hits
+        within them, evaluated by hit at every point'''
+        hit = np.vectorize(self.hit, otypes=[bool])
+        X, Y = np.meshgrid(x, y, indexing='ij')
+        return slice(None), slice(None), hit(X, Y)
+
+    def coverage(self, xe, ye, samples=8):
+        '''Slices of the cells between sorted edges xe, ye covering the
+        shape and the fraction of each cell covered, by supersampling hit
+        with samples x samples points per cell'''
+        u = (np.arange(samples) + 0.5) / samples
+        x = (xe[:-1, np.newaxis] + np.diff(xe)[:, np.newaxis] * u).ravel()
+        y = (ye[:-1, np.newaxis] + np.diff(ye)[:, np.newaxis] * u).ravel()
+        hit = np.vectorize(self.hit, otypes=[bool])
+        X, Y = np.meshgrid(x, y, indexing='ij')
+        frac = hit(X, Y).reshape(len(xe) - 1, samples, len(ye) - 1, samples)
+        return slice(None), slice(None), frac.mean(axis=(1, 3))
+
+    def cell_slices(self, xe, ye):
+        '''Slices of the cells between sorted edges xe, ye that overlap the
+        bounding box'''
+        def cells(e, a, b):
+            return slice(max(np.searchsorted(e, a, 'right') - 1, 0),
+                         min(np.searchsorted(e, b, 'left'), len(e) - 1))
+        return cells(xe, self.left, self.right), cells(ye, self.bottom, self.top)
+
+    def bounding_slices(self, x, y):
+        '''Slices of sorted coordinates x, y within the bounding box'''
+        sx = slice(np.searchsorted(x, self.left, 'left'),
+                   np.searchsorted(x, self.right, 'right'))
+        sy = slice(np.searchsorted(y, self.bottom, 'left'),
+                   np.searchsorted(y, self.top, 'right'))
+        return sx, sy
+
 
 class Rect(Shape):
     def __init__(self, left: float, width: float, top: float, height: float):
@@ -103,6 +273,21 @@ class Rect(Shape):
         in_y = y >= self.bottom and y <= self.top
         return in_x and in_y
 
+    def raster(self, x, y):
+        sx, sy = self.bounding_slices(x, y)
+        return sx, sy, np.ones((len(x[sx]), len(y[sy])), dtype=bool)
+
+    def coverage(self, xe, ye):
+        sx, sy = self.cell_slices(xe, ye)
+
+        def overlap(e, a, b):
+            lo = np.maximum(e[:-1], a)
+            hi = np.minimum(e[1:], b)
+            return np.clip(hi - lo, 0, None) / np.diff(e)
+        fx = overlap(xe[sx.start:sx.stop + 1], self.left, self.right)
+        fy = overlap(ye[sy.start:sy.stop + 1], self.bottom, self.top)
+        return sx, sy, fx[:, np.newaxis] * fy[np.newaxis, :]
+
 
 class Circ(Shape):
     def __init__(self, mid_x: float, mid_y: float, radius: float):
@@ -133,6 +318,22 @@ class Circ(Shape):
         dy2 = (self.mid_y - y) ** 2
         return dx2 + dy2 <= self.radius ** 2
 
+    def raster(self, x, y):
+        sx, sy = self.bounding_slices(x, y)
+        dx2 = (self.mid_x - x[sx, np.newaxis]) ** 2
+        dy2 = (self.mid_y - y[np.newaxis, sy]) ** 2
+        return sx, sy, dx2 + dy2 <= self.radius ** 2
+
+    def coverage(self, xe, ye):
+        '''Exact area of the disk in each cell, from the signed quadrant
+        areas at the cell corners'''
+        sx, sy = self.cell_slices(xe, ye)
+        x = xe[sx.start:sx.stop + 1] - self.mid_x
+        y = ye[sy.start:sy.stop + 1] - self.mid_y
+        F = _disk_quadrant(x[:, np.newaxis], y[np.newaxis, :], self.radius)
+        area = F[1:, 1:] - F[:-1, 1:] - F[1:, :-1] + F[:-1, :-1]
+        return sx, sy, area / np.outer(np.diff(x), np.diff(y))
+
 
 if __name__ == '__main__':
     rectp = Rect(0.0, 4.0, 6.0, 6.0)
@@ -0,0 +1,286 @@
+#!/usr/bin/python3
+
+'''Geometry based on a sequence of primitives
+Primitives can be positive or negative shapes
+Intended for generation of grid cells for poisson_3d
+
+Grids are given by their axes x, y, z, or by ij indexed meshgrids of
+which only the axes are used, so voxelizing never builds full size
+coordinate arrays. Each child is evaluated over its bounding box only,
+in blocks of planes along x to bound the temporary arrays'''
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+
+def grid_axes(grid_x, grid_y, grid_z):
+    '''Axes x, y, z of a grid given as axes or as ij indexed meshgrids'''
+    x, y, z = (np.asarray(g) for g in (grid_x, grid_y, grid_z))
+    if x.ndim == 3:
+        return x[:, 0, 0], y[0, :, 0], z[0, 0, :]
+    return x, y, z
+
+
+def ascending(points):
+    '''Points in ascending order and the slice, reversing them or not,
+    that maps results on them back to the given order. Raises unless the
+    points are strictly monotonic'''
+    points = np.asarray(points)
+    step = np.diff(points)
+    if np.all(step > 0):
+        return points, slice(None)
+    if np.all(step < 0):
+        return points[::-1], slice(None, None, -1)
+    raise Exception('Grid points must be strictly monotonic')
+
+
+def label_dtype(n: int):
+    '''Smallest signed integer type for labels -1..n-1'''
+    return np.min_scalar_type(-max(n, 1))
+
+
+class Geometry():
+    def __init__(self):
+        self.children = []
+
+    def add_child(self, new_child):
+        self.children.append(new_child)
+
+    def hit(self, x, y, z):
+        child = self.child_at(x, y, z)
+        return child is not None and child.positive
+
+    def child_at(self, x, y, z):
+        for child in reversed(self.children):
+            if child.hit(x, y, z):
+                return child
+        return None
+
+    def bounds(self):
+        '''Bounding box (x0, x1, y0, y1, z0, z1) of all children'''
+        if len(self.children) == 0:
+            raise Exception('Geometry has no children')
+        boxes = np.array([c.bounds() for c in self.children])
+        return tuple(np.where(np.arange(6) % 2 == 0,
+                              boxes.min(axis=0), boxes.max(axis=0)))
+
+    def axes(self, Nx, Ny, Nz, edges=True):
+        x0, x1, y0, y1, z0, z1 = self.bounds()
+        x = np.linspace(x0, x1, Nx)
+        y = np.linspace(y0, y1, Ny)
+        z = np.linspace(z0, z1, Nz)
+        if edges:
+            return x, y, z
+        return tuple(0.5 * (a[1:] + a[:-1]) for a in (x, y, z))
+
+    def grid(self, Nx, Ny, Nz, edges=True):
+        return np.meshgrid(*self.axes(Nx, Ny, Nz, edges), indexing='ij')
+
+    def labels(self, grid_x, grid_y, grid_z, nodes=False, block=32):
+        '''Index of the child at each cell centre, or grid point if nodes,
+        -1 where there is none, in the smallest integer type that fits.
+        Children are painted in order, each over its bounding box in
+        blocks of planes along x, so later children cover earlier ones.
+        The axes of the grid may be ascending or descending'''
+        (x, fx), (y, fy), (z, fz) = (ascending(a) for a in grid_axes(
+            grid_x, grid_y, grid_z))
+        if not nodes:
+            x, y, z = (0.5 * (a[1:] + a[:-1]) for a in (x, y, z))
+        result = np.full((len(x), len(y), len(z)), -1,
+                         dtype=label_dtype(len(self.children)))
+        for index, child in enumerate(self.children):
+            sx = child.bounding_slices(x, y, z)[0]
+            for start in range(sx.start, sx.stop, block):
+                bx = slice(start, min(start + block, sx.stop))
+                bsx, sy, sz, hit = child.raster(x[bx], y, z)
+                result[bx][bsx, sy, sz][hit] = index
+        return np.ascontiguousarray(result[fx, fy, fz])
+
+    def mask(self, grid_x, grid_y, grid_z, nodes=False):
+        labels = self.labels(grid_x, grid_y, grid_z, nodes)
+        positive = np.array([c.positive for c in self.children] + [False])
+        return positive[labels]
+
+    def select(self, param, grid_x, grid_y, grid_z, nodes=False, dtype=float):
+        '''Parameter of the child at each cell, 0 where it is not defined.
+        A dtype of np.float32 halves the size of the result'''
+        labels = self.labels(grid_x, grid_y, grid_z, nodes)
+        values = np.array([c.params.get(param, 0) for c in self.children]
+                          + [0], dtype=dtype)
+        return values[labels]
+
+    def conductors(self, grid_x, grid_y, grid_z, param='voltage'):
+        '''Fixed potential boundary (bc_bool, bc_val) at the grid points
+        of positive children that have the param, for poisson_3d'''
+        labels = self.labels(grid_x, grid_y, grid_z, nodes=True)
+        fixed = np.array([c.positive and param in c.params
+                          for c in self.children] + [False])
+        values = np.array([c.params.get(param, 0) for c in self.children]
+                          + [0], dtype=float)
+        return fixed[labels], values[labels]
+
+    def conductor_labels(self, grid_x, grid_y, grid_z, param='voltage'):
+        '''Compact counterpart of conductors, (labels, voltages) with the
+        node labels and a voltage per child, NaN unless the child is a
+        positive one with the param'''
+        labels = self.labels(grid_x, grid_y, grid_z, nodes=True)
+        voltages = np.array([c.params[param]
+                             if c.positive and param in c.params else np.nan
+                             for c in self.children], dtype=float)
+        return labels, voltages
+
+
+class Shape():
+    def __init__(self):
+        self.positive = True
+        self.name = 'Shape'
+        self.params = {}
+
+    def hit(self, x, y, z) -> bool:
+        return False
+
+    def bounds(self):
+        return (0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+    def bounding_slices(self, x, y, z):
+        '''Slices of sorted coordinates x, y, z within the bounding box'''
+        b = self.bounds()
+        return tuple(slice(np.searchsorted(a, b[2 * n], 'left'),
+                           np.searchsorted(a, b[2 * n + 1], 'right'))
+                     for n, a in enumerate((x, y, z)))
+
+    def raster(self, x, y, z):
+        '''Slices of sorted coordinates x, y, z covering the shape and the
+        hits within them, evaluated by hit at every point of the bounding
+        box'''
+        sx, sy, sz = self.bounding_slices(x, y, z)
+        hit = np.vectorize(self.hit, otypes=[bool])
+        return sx, sy, sz, hit(x[sx, np.newaxis, np.newaxis],
+                               y[np.newaxis, sy, np.newaxis],
+                               z[np.newaxis, np.newaxis, sz])
+
+
+class Box(Shape):
+    '''Box from corner x, y, z with sizes dx, dy, dz'''
+    def __init__(self, x: float, y: float, z: float,
+                 dx: float, dy: float, dz: float):
+        super().__init__()
+        self.name = 'Box'
+        self.x = x
+        self.y = y
+        self.z = z
+        self.dx = dx
+        self.dy = dy
+        self.dz = dz
+
+    def bounds(self):
+        return (self.x, self.x + self.dx, self.y, self.y + self.dy,
+                self.z, self.z + self.dz)
+
+    def hit(self, x, y, z) -> bool:
+        x0, x1, y0, y1, z0, z1 = self.bounds()
+        return x0 <= x <= x1 and y0 <= y <= y1 and z0 <= z <= z1
+
+    def raster(self, x, y, z):
+        sx, sy, sz = self.bounding_slices(x, y, z)
+        shape = (len(x[sx]), len(y[sy]), len(z[sz]))
+        return sx, sy, sz, np.ones(shape, dtype=bool)
+
+
+class Sphere(Shape):
+    def __init__(self, mid_x: float, mid_y: float, mid_z: float,
+                 radius: float):
+        super().__init__()
+        self.name = 'Sphere'
+        self.mid_x = mid_x
+        self.mid_y = mid_y
+        self.mid_z = mid_z
+        self.radius = radius
+
+    def bounds(self):
+        r = self.radius
+        return (self.mid_x - r, self.mid_x + r, self.mid_y - r,
+                self.mid_y + r, self.mid_z - r, self.mid_z + r)
+
+    def hit(self, x, y, z) -> bool:
+        return ((x - self.mid_x)**2 + (y - self.mid_y)**2
+                + (z - self.mid_z)**2 <= self.radius**2)
+
+    def raster(self, x, y, z):
+        sx, sy, sz = self.bounding_slices(x, y, z)
+        dx2 = (x[sx, np.newaxis, np.newaxis] - self.mid_x)**2
+        dy2 = (y[np.newaxis, sy, np.newaxis] - self.mid_y)**2
+        dz2 = (z[np.newaxis, np.newaxis, sz] - self.mid_z)**2
+        return sx, sy, sz, dx2 + dy2 + dz2 <= self.radius**2
+
+
+class Cylinder(Shape):
+    '''Cylinder centred on mid_x, mid_y, mid_z with its axis along
+    'x', 'y' or 'z' '''
+    def __init__(self, mid_x: float, mid_y: float, mid_z: float,
+                 radius: float, length: float, axis: str = 'z'):
+        super().__init__()
+        if axis not in ('x', 'y', 'z'):
+            raise Exception(f'Invalid axis specified: {axis}')
+        self.name = 'Cylinder'
+        self.mid_x = mid_x
+        self.mid_y = mid_y
+        self.mid_z = mid_z
+        self.radius = radius
+        self.length = length
+        self.axis = axis
+
+    def _half_sizes(self):
+        half = [self.radius] * 3
+        half['xyz'.index(self.axis)] = 0.5 * self.length
+        return half
+
+    def bounds(self):
+        hx, hy, hz = self._half_sizes()
+        return (self.mid_x - hx, self.mid_x + hx, self.mid_y - hy,
+                self.mid_y + hy, self.mid_z - hz, self.mid_z + hz)
+
+    def _inside(self, dx, dy, dz):
+        d = [dx, dy, dz]
+        along = d.pop('xyz'.index(self.axis))
+        return ((d[0]**2 + d[1]**2 <= self.radius**2)
+                & (np.abs(along) <= 0.5 * self.length))
+
+    def hit(self, x, y, z) -> bool:
+        return bool(self._inside(x - self.mid_x, y - self.mid_y,
+                                 z - self.mid_z))
+
+    def raster(self, x, y, z):
+        sx, sy, sz = self.bounding_slices(x, y, z)
+        return sx, sy, sz, self._inside(
+            x[sx, np.newaxis, np.newaxis] - self.mid_x,
+            y[np.newaxis, sy, np.newaxis] - self.mid_y,
+            z[np.newaxis, np.newaxis, sz] - self.mid_z)
+
+
+if __name__ == '__main__':
+    # Sphere electrode with a hole beside a grounded rod in a dielectric
+    block = Box(-4.0, -4.0, -4.0, 8.0, 8.0, 8.0)
+    block.params['er'] = 4.0
+    sphere = Sphere(-1.0, 0.0, 0.0, 2.0)
+    sphere.params['voltage'] = 10.0
+    cut = Cylinder(-1.0, 0.0, 0.0, 0.5, 4.0, axis='x')
+    cut.positive = False
+    rod = Cylinder(2.5, 0.0, 0.0, 0.5, 6.0, axis='y')
+    rod.params['voltage'] = 0.0
+    geom = Geometry()
+    for child in (block, sphere, cut, rod):
+        geom.add_child(child)
+
+    x, y, z = geom.axes(81, 81, 81)
+    labels, voltages = geom.conductor_labels(x, y, z)
+    er = geom.select('er', x, y, z, dtype=np.float32)
+    mid = len(z) // 2
+    fig, (ax1, ax2) = plt.subplots(1, 2)
+    ax1.pcolor(x, y, labels[:, :, mid].T, shading='auto')
+    ax1.set_title('Labels')
+    ax2.pcolor(x[:-1], y[:-1], er[:, :, mid].T, shading='auto')
+    ax2.set_title('er')
+    for ax in (ax1, ax2):
+        ax.set_aspect('equal')
+    plt.show()
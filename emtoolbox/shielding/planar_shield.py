@@ -60,6 +60,105 @@ def shielding_effectiveness(f, medium, shield):
             multiple_reflection_loss(f, medium, shield))
 
 
+def stackup_layers(stackups) -> Material:
+    '''Pack stack-ups, lists of Material, into one Material whose properties
+    are (stack-ups, layers) arrays. Shorter stack-ups are padded with zero
+    thickness layers, which leave the transfer matrix unchanged'''
+    n_layers = max(len(stackup) for stackup in stackups)
+    padding = Material(thickness=0.0)
+    rows = [list(stackup) + [padding] * (n_layers - len(stackup))
+            for stackup in stackups]
+    er, ur, cond, thickness = (np.array([[getattr(mat, name) for mat in row]
+                                         for row in rows])
+                               for name in ('er', 'ur', 'cond', 'thickness'))
+    return Material(er, ur, cond, thickness, label='Stack-up')
+
+
+def _layer_list(layers) -> list:
+    '''Split the layers of a stack-up Material along its last axis, a
+    Material with scalar properties is a single layer'''
+    if np.ndim(layers.thickness) == 0:
+        return [layers]
+    values = [np.asarray(v) for v in
+              (layers.er, layers.ur, layers.cond, layers.thickness)]
+    return [Material(*(v[..., j] for v in values))
+            for j in range(values[-1].shape[-1])]
+
+
+def _wave_impedance(mat, f, kx, polarization):
+    '''Normal wave number and transverse wave impedance for a transverse
+    wave number kx, TE (E parallel to the surface) or TM'''
+    k = mat.wave_number(f)
+    kz = np.sqrt(k * k - kx * kx + 0.j)
+    # Evanescent waves decay along z, exp(-j kz z)
+    kz = np.where(kz.imag > 0, -kz, kz)
+    if polarization == 'TE':
+        return kz, mat.impedance(f) * k / kz
+    elif polarization == 'TM':
+        return kz, mat.impedance(f) * kz / k
+    else:
+        raise ValueError(f'Invalid polarization: {polarization}')
+
+
+def _shielding_db(f, sin_theta, medium, layers, polarization='TE'):
+    '''Chained ABCD matrices of the layers between two half spaces of
+    medium. Each layer matrix is scaled by exp(-j kz t), its attenuation,
+    and the scales are summed as a logarithm so that thick or highly
+    conductive layers do not overflow'''
+    kx = medium.wave_number(f) * sin_theta
+    _, Zo = _wave_impedance(medium, f, kx, polarization)
+    A, B, C, D = 1.0, 0.0, 0.0, 1.0
+    log_scale = 0.0
+    for layer in _layer_list(layers):
+        kz, Z = _wave_impedance(layer, f, kx, polarization)
+        kt = kz * layer.thickness
+        # [[cos kt, j Z sin kt], [j sin kt / Z, cos kt]] * exp(-j kt)
+        e2 = np.exp(-2.j * kt)
+        cos_kt = 0.5 * (1 + e2)
+        jsin_kt = 0.5 * (1 - e2)
+        A, B, C, D = (A * cos_kt + B * jsin_kt / Z,
+                      A * Z * jsin_kt + B * cos_kt,
+                      C * cos_kt + D * jsin_kt / Z,
+                      C * Z * jsin_kt + D * cos_kt)
+        log_scale = log_scale + np.real(1.j * kt)
+    se = 0.5 * np.abs(A + B / Zo + C * Zo + D)
+    return db(se) + 20 * log_scale / np.log(10)
+
+
+def multilayer_shielding_db(f, medium, layers):
+    '''Shielding effectiveness in dB of a multilayer planar shield in medium,
+    for a normally incident plane wave. The ABCD matrices of the layers are
+    chained along the last axis of the layers properties, see stackup_layers,
+    and all other axes broadcast against f: f (F,) and (S, L) layers
+    give (F, S)'''
+    f = np.reshape(f, np.shape(f) + (1,) * (np.ndim(layers.thickness) - 1))
+    return _shielding_db(f, 0.0, medium, layers)
+
+
+def oblique_shielding_db(f, theta, medium, layers, polarization='TE'):
+    '''Shielding effectiveness in dB for plane waves incident at angles
+    theta (radians from the normal, excluding grazing incidence at
+    +/-pi/2), TE or TM polarized, evaluated as one
+    (angle, frequency) grid. layers is a Material slab or stack-ups from
+    stackup_layers, whose stack-up axes follow: theta (A,), f (F,) and
+    (S, L) layers give (A, F, S)'''
+    extra = (1,) * max(np.ndim(layers.thickness) - 1, 0)
+    theta = np.reshape(theta, np.shape(theta) + (1,) * np.ndim(f) + extra)
+    f = np.reshape(f, np.shape(f) + extra)
+    return _shielding_db(f, np.sin(theta), medium, layers, polarization)
+
+
+def reduce_angles(se_db, method='worst', axis=0):
+    '''Reduce shielding effectiveness in dB over the angle axis, 'worst'
+    is the lowest value, 'average' the average transmitted power'''
+    if method == 'worst':
+        return np.min(se_db, axis=axis)
+    elif method == 'average':
+        return -10 * np.log10(np.mean(10**(-se_db / 10), axis=axis))
+    else:
+        raise ValueError(f'Invalid method: {method}')
+
+
 def plot_impedance(f, medium, *args):
     fig, ax = plt.subplots()
     for mat in args:
@@ -128,4 +227,26 @@ if __name__ == '__main__':
     plot_loss(f, air, lossy)
     plot_shielding(f, air, lossy)
 
+    laminates = [[copper], [copper, duranickel], [copper, ssteel, copper]]
+    se = multilayer_shielding_db(f, air, stackup_layers(laminates))
+    fig, ax = plt.subplots()
+    ax.semilogx(f, se)
+    ax.set_title('Multilayer Shielding Effectiveness')
+    ax.set_xlabel('Frequency (Hz)')
+    ax.set_ylabel('Shielding Effectiveness (dB)')
+    ax.legend(['Cu', 'Cu/Ni', 'Cu/SS/Cu'])
+    ax.grid()
+
+    theta = np.deg2rad(np.linspace(-89, 89, 179))
+    fig, ax = plt.subplots()
+    for pol in ('TE', 'TM'):
+        se = oblique_shielding_db(f, theta, air, copper, pol)
+        ax.semilogx(f, reduce_angles(se), label=f'{pol} worst case')
+        ax.semilogx(f, reduce_angles(se, 'average'), label=f'{pol} average')
+    ax.set_title('Oblique Incidence, Copper')
+    ax.set_xlabel('Frequency (Hz)')
+    ax.set_ylabel('Shielding Effectiveness (dB)')
+    ax.legend()
+    ax.grid()
+
     plt.show()
@@ -46,15 +46,18 @@ class WireMtl():
         elif method.lower() == 'fdm':
             if type(self.ref) is not Wire or len(self.wires) != 1:
                 raise Exception('FDM currently supports only two wires, no reference')
-            # Define simulation region
-            pad = 20  # Zero potential boundaries must be far away
-            w_list = np.array([[wi.x - pad * wi.radius for wi in self.wires],
-                               [wi.x + pad * wi.radius for wi in self.wires]])
-            h_list = np.array([[wi.y - pad * wi.radius for wi in self.wires],
-                               [wi.y + pad * wi.radius for wi in self.wires]])
-            # Grid based on wire size or user configured
+            # Define simulation region, with open boundaries a wire
+            # separation or five radii beyond the wires
             x0, y0, r0 = self.ref.x, self.ref.y, self.ref.radius
             x1, y1, r1 = self.wires[0].x, self.wires[0].y, self.wires[0].radius
+            pad = fdm_params.get('pad', max(np.hypot(x1 - x0, y1 - y0),
+                                            5 * max(r0, r1)))
+            wires = self.wires + [self.ref]
+            w_list = np.array([[wi.x - wi.radius - pad for wi in wires],
+                               [wi.x + wi.radius + pad for wi in wires]])
+            h_list = np.array([[wi.y - wi.radius - pad for wi in wires],
+                               [wi.y + wi.radius + pad for wi in wires]])
+            # Grid based on wire size or user configured
             dx = fdm_params.get('dx', min(r0, r1) / 6)
             x = np.arange(w_list.min(), w_list.max(), dx)
             y = np.arange(h_list.min(), h_list.max(), dx)
@@ -70,7 +73,8 @@ class WireMtl():
             bc_val[bc1] = 0.5 * V1
             bc_val[bc2] = -0.5 * V1
             bc_bool = bc_val != 0.0
-            V = fdm.poisson_2d(X, Y, bc=(bc_bool, bc_val), conv=1e-5)
+            V = fdm.poisson_2d(X, Y, bc=(bc_bool, bc_val), conv=1e-5,
+                               open_bc=1, center=(0.5 * (x0 + x1), 0.5 * (y0 + y1)))
             er = self.er * np.ones_like(X)[:-1, :-1]
             # Calculate charge and capacitances
             C = np.zeros((len(self.wires), len(self.wires)))
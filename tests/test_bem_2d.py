@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+
+import numpy as np
+import pytest
+from pytest import approx
+import emtoolbox.external.fastcap2d as fc
+import emtoolbox.fields.bem_2d as bem
+from emtoolbox.external.export_mtl import wire_mtl_to_fastcap2d
+from emtoolbox.fields.coaxcap import CoaxCapacitor
+from emtoolbox.tline.wire import Wire
+from emtoolbox.tline.wire_mtl import WireMtl, wire_capacitance
+
+
+@pytest.fixture
+def circles(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name, radius in (('ri', 1e-3), ('re', 2e-3), ('ro', 3e-3)):
+        fc.save_segments(f'{name}.txt',
+                         fc.generate_arc_segments(radius, 0, 360, N=65))
+    return tmp_path
+
+
+def test_coax(circles):
+    conductors = [fc.Conductor('ri.txt', 1.0, 0, 0),
+                  fc.Conductor('ro.txt', 1.0, 0, 0)]
+    C = bem.capacitance(conductors)
+    expected = CoaxCapacitor(1e-3, 1.0, 2e-3).capacitance()
+    assert C == approx(expected * np.array([[1, -1], [-1, 1]]), rel=1e-3)
+
+
+def test_coax_dielectric(circles):
+    conductors = [fc.Conductor('ri.txt', 4.0, 0, 0),
+                  fc.Conductor('ro.txt', 1.0, 0, 0)]
+    dielectrics = [fc.Dielectric('re.txt', 1.0, 4.0, 0, 0, 0, 0)]
+    C = bem.capacitance(conductors, dielectrics)
+    expected = CoaxCapacitor(1e-3, (4.0, 1.0), (1e-3, 1e-3)).capacitance()
+    assert C[0, 0] == approx(expected, rel=1e-3)
+
+
+def test_coax_dielectric_reversed(circles):
+    # Interface orientation is taken from the reference point
+    segments = [fc.Segment(s.name, s.x2, s.y2, s.x1, s.y1)
+                for s in fc.Segment.read_file('re.txt')]
+    fc.save_segments('re_cw.txt', segments)
+    conductors = [fc.Conductor('ri.txt', 4.0, 0, 0),
+                  fc.Conductor('ro.txt', 1.0, 0, 0)]
+    dielectrics = [fc.Dielectric('re_cw.txt', 1.0, 4.0, 0, 0, 0, 0)]
+    C = bem.capacitance(conductors, dielectrics)
+    expected = CoaxCapacitor(1e-3, (4.0, 1.0), (1e-3, 1e-3)).capacitance()
+    assert C[0, 0] == approx(expected, rel=1e-3)
+
+
+def test_two_wire(circles):
+    s = 5e-3
+    conductors = [fc.Conductor('ri.txt', 1.0, 0, 0),
+                  fc.Conductor('ri.txt', 1.0, s, 0)]
+    C = bem.capacitance(conductors)
+    assert C[0, 0] == approx(wire_capacitance(s, 1e-3), rel=2e-3)
+    assert C.sum(axis=1) == approx(0.0, abs=1e-20)
+
+
+def test_merged_conductor(circles):
+    fc.save_segments('top.txt', fc.generate_arc_segments(3e-3, 0, 180, N=33))
+    fc.save_segments('bot.txt', fc.generate_arc_segments(3e-3, 180, 360, N=33))
+    whole = bem.capacitance([fc.Conductor('ri.txt', 1.0, 0, 0),
+                             fc.Conductor('ro.txt', 1.0, 0, 0)])
+    split = bem.capacitance([fc.Conductor('ri.txt', 1.0, 0, 0),
+                             fc.Conductor('top.txt', 1.0, 0, 0, merge=True),
+                             fc.Conductor('bot.txt', 1.0, 0, 0)])
+    assert split.shape == (2, 2)
+    assert split == approx(whole, rel=1e-3)
+
+
+def test_no_conductors(circles):
+    with pytest.raises(ValueError):
+        bem.capacitance([], [fc.Dielectric('re.txt', 1.0, 4.0, 0, 0, 0, 0)])
+
+
+@pytest.mark.parametrize(
+    "ins_thk, ins_er, c11, c12, c22",
+    [
+        # CR Paul MTL Table 5.5, pF/m
+        (0.0, 1.0, 22.494, -11.247, 16.581),
+        (0.254e-3, 3.5, 37.432, -18.716, 24.982),
+    ],
+)
+def test_ribbon_list_file(tmp_path, monkeypatch, ins_thk, ins_er, c11, c12, c22):
+    monkeypatch.chdir(tmp_path)
+    pitch = 1.27e-3
+    rw = 0.1905e-3
+    ref = Wire(0, 0, rw, ins_thk, ins_er)
+    wires = [Wire(pitch, 0, rw, ins_thk, ins_er),
+             Wire(2 * pitch, 0, rw, ins_thk, ins_er)]
+    wire_mtl_to_fastcap2d(WireMtl(wires, ref), 'ribbon.lst')
+    C = bem.solve_list_file('ribbon.lst')
+    assert C.shape == (3, 3)
+    assert C[:2, :2] * 1e12 == approx(np.array([[c11, c12], [c12, c22]]),
+                                      rel=0.01)
+
+
+@pytest.fixture
+def cable(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fc.save_segments('wire.txt', fc.generate_arc_segments(0.2e-3, 0, 360, N=33))
+    fc.save_segments('ins.txt', fc.generate_arc_segments(0.4e-3, 0, 360, N=33))
+    conductors = []
+    dielectrics = []
+    for k in range(9):
+        x, y = (k % 3) * 1e-3, (k // 3) * 1e-3
+        conductors.append(fc.Conductor('wire.txt', 3.0, x, y))
+        dielectrics.append(fc.Dielectric('ins.txt', 1.0, 3.0, x, y, x, y))
+    return conductors, dielectrics
+
+
+def test_aca(cable):
+    panels = bem.Panels(*cable)
+    rows = np.arange(288, 320)    # Insulation of the first wire
+    cols = np.arange(224, 288)    # Last two wires
+    U, V = bem.aca(panels, rows, cols, tol=1e-8)
+    block = bem.panel_matrix(panels, rows, cols)
+    assert U.shape[1] < 32
+    assert U @ V == approx(block, rel=1e-6, abs=1e-6 * np.abs(block).max())
+
+
+def test_hmatrix_matvec(cable):
+    panels = bem.Panels(*cable)
+    H = bem.HMatrix(panels, leaf_size=16, tol=1e-8)
+    A = bem.panel_matrix(panels)
+    x = np.random.default_rng(0).standard_normal(len(panels))
+    assert H.size < A.size
+    assert H.matvec(x) == approx(A @ x, rel=1e-6, abs=1e-6 * np.abs(A @ x).max())
+
+
+def test_hmatrix_capacitance(cable):
+    dense = bem.capacitance(*cable)
+    hmat = bem.capacitance(*cable, method='hmatrix',
+                           hmatrix_params={'leaf_size': 16})
+    assert hmat == approx(dense, rel=1e-4, abs=1e-4 * np.abs(dense).max())
+
+
+def test_bad_method(cable):
+    with pytest.raises(Exception):
+        bem.capacitance(*cable, method='lu')
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+
+import os
+import stat
+import sys
+import numpy as np
+import pytest
+from pytest import approx
+import emtoolbox.external.fastcap2d as fc
+
+STUB = '''#!{python}
+import sys
+list_file = sys.argv[1].split()[1]
+with open('calls.log', 'a') as fn:
+    fn.write(list_file + '\\n')
+n = sum(1 for line in open(list_file) if line.startswith('C'))
+print('Iteration number #1')
+print('Dimension 1 x 1')
+print('g1_x  0.0')
+print('Iteration number #2')
+print(f'Dimension {{n}} x {{n}}')
+for i in range(n):
+    row = ' '.join(str(n * 1e-11 if i == j else -1e-11) for j in range(n))
+    print(f'g{{i+1}}_c{{i+1}}  {{row}}')
+'''
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    exe = tmp_path / 'fastercap_stub'
+    exe.write_text(STUB.format(python=sys.executable))
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    fc.save_segments('circle.txt', fc.generate_arc_segments(1e-3, 0, 360))
+    for n in (2, 3):
+        conductors = [fc.Conductor('circle.txt', 1.0, k * 3e-3, 0)
+                      for k in range(n)]
+        fc.save_list_file(f'wires{n}.lst', conductors)
+    return str(exe)
+
+
+def calls():
+    with open('calls.log') as fn:
+        return fn.read().split()
+
+
+def test_run_fastercap(stub):
+    C = fc.run_fastercap('wires2.lst', exe=stub)
+    assert C == approx(np.array([[2e-11, -1e-11], [-1e-11, 2e-11]]))
+
+
+def test_batch_cache(stub):
+    C = fc.run_fastercap_batch(['wires2.lst', 'wires3.lst', 'wires2.lst'],
+                               exe=stub, max_workers=2, cache_dir='cache')
+    assert [c.shape for c in C] == [(2, 2), (3, 3), (2, 2)]
+    assert sorted(calls()) == ['wires2.lst', 'wires3.lst']
+    assert len(os.listdir('cache')) == 2
+    assert all(f.endswith('.npy') for f in os.listdir('cache'))
+    C2 = fc.run_fastercap_batch(['wires3.lst'], exe=stub, cache_dir='cache')
+    assert C2[0] == approx(C[1])
+    assert len(calls()) == 2
+    # No cache by default
+    fc.run_fastercap_batch(['wires3.lst'], exe=stub)
+    assert len(calls()) == 3
+    assert sorted(os.listdir()) == sorted(
+        ['cache', 'calls.log', 'circle.txt', 'fastercap_stub', 'wires2.lst',
+         'wires3.lst'])
+
+
+def test_hash_executable(stub):
+    key = fc.list_file_hash('wires2.lst', stub)
+    other = stub + '_other'
+    with open(stub) as src, open(other, 'w') as dst:
+        dst.write(src.read())
+    os.chmod(other, os.stat(stub).st_mode)
+    assert fc.list_file_hash('wires2.lst', other) != key
+    fc.run_fastercap_batch(['wires2.lst'], exe=stub, cache_dir='cache')
+    fc.run_fastercap_batch(['wires2.lst'], exe=other, cache_dir='cache')
+    assert calls() == ['wires2.lst', 'wires2.lst']
+
+
+def test_hash_segment_file(stub):
+    key = fc.list_file_hash('wires2.lst')
+    fc.save_segments('circle.txt', fc.generate_arc_segments(2e-3, 0, 360))
+    assert fc.list_file_hash('wires2.lst') != key
+    fc.run_fastercap_batch(['wires2.lst', 'wires2.lst'], exe=stub, cache_dir=None)
+    assert calls() == ['wires2.lst']
+
+
+def test_segment_array_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fc.save_segments('box.txt', fc.generate_box_segments(1.0, 0.5))
+    array = fc.get_segment_array('box.txt')
+    assert array.shape == (4, 4)
+    assert fc.get_segment_array('box.txt') is array
+    c = fc.Conductor('box.txt', 1.0, 2.0, 3.0)
+    assert c.get_segment_array()[0] == approx([3.0, 3.0, 3.0, 3.5])
+    segments = c.get_segments()
+    assert segments[0].name == 'box'
+    assert fc.segment_array(segments) == approx(c.get_segment_array())
+    fc.save_segments('box.txt', fc.generate_box_segments(1.0, 0.5)[:2])
+    os.utime('box.txt', ns=(0, 0))
+    assert fc.get_segment_array('box.txt').shape == (2, 4)
@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+
+import numpy as np
+import pytest
+from pytest import approx
+import emtoolbox.fdtd.fdtd_2d as fdtd
+
+
+def test_periodic_plane_wave():
+    dx = 0.01
+    grid = fdtd.Grid2D(dx, 0.2, 1.0, periodic=True)
+    grid.init_pml(8)
+    grid.add_plane_source(fdtd.Gaussian(0.0, 'Gaussian', 1.0,
+                                        20 * grid.dt, 6 * grid.dt))
+    probe = fdtd.Probe((0.105, 0.5))
+    grid.add_probe(probe)
+    grid.solve(5e-9, n_frames=10)
+    # No edges along x, so the plane wave stays uniform across the cell
+    for ez in grid.data:
+        assert ez == approx(np.broadcast_to(ez[0], ez.shape), abs=1e-9)
+    assert probe.data.max() == approx(1.0, rel=0.05)
+
+
+def test_floquet_phase():
+    # A phase of pi is the antiperiodic field of a cell with a source, as
+    # in the first of two cells with opposite sources
+    dx = 0.01
+    grid = fdtd.Grid2D(dx, 0.2, 0.6, periodic=True, phase=np.pi)
+    double = fdtd.Grid2D(dx, 0.4, 0.6, periodic=True)
+    t0 = 20 * grid.dt
+    spread = 6 * grid.dt
+    for g in (grid, double):
+        g.init_pml(8)
+        g.add_source(fdtd.Gaussian((0.055, 0.3), 'Gaussian', 1.0, t0, spread))
+        g.add_probe(fdtd.Probe((0.105, 0.25)))
+    double.add_source(fdtd.Gaussian((0.255, 0.3), 'Gaussian', -1.0, t0,
+                                    spread))
+    double.add_probe(fdtd.Probe((0.305, 0.25)))
+    for g in (grid, double):
+        g.solve(2e-9, n_frames=2)
+    result = grid.probes[0].data
+    assert np.abs(result).max() > 0.01
+    assert result.real == approx(double.probes[0].data, abs=1e-9)
+    assert result.imag == approx(0.0, abs=1e-9)
+    assert double.probes[1].data == approx(-double.probes[0].data, abs=1e-9)
+    with pytest.raises(Exception):
+        grid.add_plane_source(fdtd.Gaussian(0.0, 'Gaussian', 1.0, t0, spread))
@@ -1,5 +1,6 @@
 #!#!/usr/bin/python3
 
+import numpy as np
 import pytest
 from pytest import approx
 import emtoolbox.geometry.geometry1d as gm
@@ -114,3 +115,30 @@ def test_geometry_select():
     geom.add_child(rectc)
     grid = geom.grid(6)
     assert geom.select('er', grid) == approx([2, 3, 4, 3, 2])
+
+
+def test_geometry_labels():
+    recta = gm.Rect(0.0, 4.0)
+    rectb = gm.Rect(1.0, 2.0)
+    rectb.positive = False
+    geom = gm.Geometry()
+    geom.add_child(recta)
+    geom.add_child(rectb)
+    grid = np.linspace(-1.0, 5.0, 7)
+    assert geom.labels(grid) == approx([-1, 0, 1, 1, 0, -1])
+    assert geom.labels(grid, nodes=True) == approx([-1, 0, 1, 1, 1, 0, -1])
+    assert geom.mask(grid, nodes=True) == approx([0, 1, 0, 0, 0, 1, 0])
+
+
+def test_geometry_labels_descending():
+    recta = gm.Rect(0.0, 4.0)
+    rectb = gm.Rect(1.0, 2.0)
+    geom = gm.Geometry()
+    geom.add_child(recta)
+    geom.add_child(rectb)
+    grid = np.linspace(-1.0, 5.0, 7)
+    assert geom.labels(grid[::-1]) == approx(geom.labels(grid)[::-1])
+    assert geom.labels(grid[::-1], nodes=True) == approx(
+        geom.labels(grid, nodes=True)[::-1])
+    with pytest.raises(Exception):
+        geom.labels(np.array([0.0, 2.0, 1.0, 3.0]))
@@ -1,5 +1,6 @@
 #!#!/usr/bin/python3
 
+import numpy as np
 import pytest
 from pytest import approx
 import emtoolbox.geometry.geometry2d as gm
@@ -50,3 +51,139 @@ def test_geometry_rect():
     assert not geom.hit(2.6, 0.75)
     assert not geom.hit(1.0, 1.1)
     assert not geom.hit(1.0, 0.4)
+
+
+@pytest.fixture
+def layered():
+    rectp = gm.Rect(0.0, 4.0, 6.0, 6.0)
+    rectn = gm.Rect(1.0, 2.0, 3.0, 2.0)
+    rectp2 = gm.Rect(1.5, 1.0, 4.0, 2.0)
+    circ = gm.Circ(3.0, 2.0, 0.5)
+    rectn.positive = False
+    rectp.params['er'] = 2.0
+    rectp2.params['er'] = 4.0
+    circ.params['er'] = 3.0
+    geom = gm.Geometry()
+    for child in (rectp, rectn, rectp2, circ):
+        geom.add_child(child)
+    return geom
+
+
+@pytest.mark.parametrize('nodes', [False, True])
+def test_geometry_raster(layered, nodes):
+    X, Y = layered.grid(41, 61)
+    if nodes:
+        x, y = X[:, 0], Y[0, :]
+    else:
+        x = 0.5 * (X[1:, 0] + X[:-1, 0])
+        y = 0.5 * (Y[0, 1:] + Y[0, :-1])
+    hit = [[layered.hit(xi, yi) for yi in y] for xi in x]
+    er = [[layered.child_at(xi, yi).params.get('er', 0) for yi in y]
+          for xi in x]
+    assert layered.mask(X, Y, nodes=nodes) == approx(np.array(hit, dtype=float))
+    assert layered.select('er', X, Y, nodes=nodes) == approx(np.array(er))
+
+
+def test_geometry_labels_outside():
+    geom = gm.Geometry()
+    geom.add_child(gm.Circ(1.0, 1.0, 1.0))
+    X, Y = geom.grid(5, 5, edges=True)
+    labels = geom.labels(X, Y, nodes=True)
+    assert labels[0, 0] == -1
+    assert labels[2, 2] == 0
+    assert geom.select('er', X, Y, nodes=True)[0, 0] == 0
+
+
+def test_shape_raster_fallback():
+    class Triangle(gm.Shape):
+        left, right, bottom, top = 0.0, 1.0, 0.0, 1.0
+
+        def hit(self, x, y):
+            return y <= x
+    geom = gm.Geometry()
+    geom.add_child(Triangle())
+    X, Y = geom.grid(3, 3)
+    assert geom.mask(X, Y, nodes=True) == approx(np.array([[1, 0, 0],
+                                                           [1, 1, 0],
+                                                           [1, 1, 1]]))
+
+
+def test_circ_coverage():
+    circ = gm.Circ(0.3, 0.2, 1.0)
+    edges = np.linspace(-2.0, 2.0, 17)
+    sx, sy, frac = circ.coverage(edges, edges)
+    assert frac.sum() * 0.25**2 == approx(np.pi)
+    _, _, sampled = gm.Shape.coverage(circ, edges, edges, samples=16)
+    assert frac == approx(sampled[sx, sy], abs=0.02)
+
+
+def test_geometry_coverage(layered):
+    X, Y = layered.grid(9, 13)
+    area = layered.coverage(X, Y) * 0.5**2
+    assert area.sum() == approx(21.0 + np.pi / 8)
+    er = layered.average('er', X, Y)
+    assert er[0, 0] == approx(2.0)
+    assert er[5, 3] == approx(3.0 * np.pi / 4)
+    assert layered.coverage(X, Y, nodes=True).shape == X.shape
+
+
+def test_average_harmonic_slab():
+    # Dielectric slab across a parallel plate capacitor, off the grid
+    from emtoolbox.fields.poisson_fdm import poisson_2d
+    geom = gm.Geometry()
+    air = gm.Rect(0.0, 0.4, 1.0, 1.0)
+    slab = gm.Rect(0.0, 0.4, 0.61, 0.38)
+    air.params['er'] = 1.0
+    slab.params['er'] = 4.0
+    geom.add_child(air)
+    geom.add_child(slab)
+    X, Y = geom.grid(5, 11)
+    def elastance(y):
+        return y - 0.75 * np.clip(y - 0.23, 0, 0.38)
+    V_exact = elastance(Y) / elastance(1.0)
+    bc = np.zeros(X.shape, dtype=bool)
+    bc[[0, -1], :] = True
+    er = geom.average('er', X, Y, background=1.0, mean='harmonic')
+    V = poisson_2d(X, Y, v_top=1.0, dielectric=er, bc=(bc, V_exact),
+                   conv=1e-10)
+    assert V == approx(V_exact, abs=1e-6)
+    V = poisson_2d(X, Y, v_top=1.0, dielectric=geom.select('er', X, Y),
+                   bc=(bc, V_exact), conv=1e-10)
+    assert abs(V - V_exact).max() > 0.01
+
+
+def test_bin_index():
+    rng = np.random.default_rng(1)
+    geom = gm.Geometry()
+    for k, (x, y) in enumerate(rng.uniform(0, 10, (500, 2))):
+        circ = gm.Circ(x, y, rng.uniform(0.05, 0.5))
+        circ.params['er'] = k
+        circ.positive = k % 3 > 0
+        geom.add_child(circ)
+    for x, y in rng.uniform(-1, 11, (500, 2)):
+        hits = [c for c in geom.children if c.hit(x, y)]
+        expected = hits[-1] if hits else None
+        assert geom.child_at(x, y) is expected
+        assert geom.hit(x, y) == (expected is not None and expected.positive)
+    geom.add_child(gm.Rect(-2.0, 14.0, 12.0, 14.0))
+    assert geom.child_at(11.5, 11.5) is geom.children[-1]
+
+
+def test_descending_axes():
+    geom = gm.Geometry()
+    rect = gm.Rect(0.0, 4.0, 6.0, 6.0)
+    circ = gm.Circ(3.0, 2.0, 0.7)
+    circ.params['er'] = 3.0
+    geom.add_child(rect)
+    geom.add_child(circ)
+    X, Y = geom.grid(9, 13)
+    Xd, Yd = X[:, ::-1], Y[:, ::-1]
+    assert geom.labels(Xd, Yd) == approx(geom.labels(X, Y)[:, ::-1])
+    assert geom.labels(Xd, Yd, nodes=True) == approx(
+        geom.labels(X, Y, nodes=True)[:, ::-1])
+    assert geom.coverage(Xd, Yd) == approx(geom.coverage(X, Y)[:, ::-1])
+    assert geom.average('er', X[::-1, ::-1], Y[::-1, ::-1]) == approx(
+        geom.average('er', X, Y)[::-1, ::-1])
+    Xs, Ys = np.meshgrid([0.0, 2.0, 1.0, 3.0], [0.0, 1.0], indexing='ij')
+    with pytest.raises(Exception):
+        geom.labels(Xs, Ys)
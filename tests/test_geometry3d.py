@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+
+import numpy as np
+import pytest
+from pytest import approx
+import emtoolbox.geometry.geometry3d as gm
+import emtoolbox.fields.poisson_fdm as fdm
+from emtoolbox.fields.spherecap import SphereCapacitor
+
+
+@pytest.fixture
+def shapes():
+    box = gm.Box(0.0, 0.0, 0.0, 4.0, 3.0, 2.0)
+    hole = gm.Cylinder(2.0, 1.5, 1.0, 0.6, 4.0, axis='x')
+    sphere = gm.Sphere(3.0, 1.0, 1.5, 0.8)
+    rod = gm.Cylinder(1.0, 1.5, 1.0, 0.3, 2.5, axis='y')
+    hole.positive = False
+    box.params['er'] = 2.0
+    sphere.params['er'] = 5.0
+    sphere.params['voltage'] = 1.0
+    rod.params['voltage'] = -1.0
+    geom = gm.Geometry()
+    for child in (box, hole, sphere, rod):
+        geom.add_child(child)
+    return geom
+
+
+@pytest.mark.parametrize('nodes', [False, True])
+def test_labels(shapes, nodes):
+    x, y, z = shapes.axes(17, 13, 9)
+    if not nodes:
+        x, y, z = (0.5 * (a[1:] + a[:-1]) for a in (x, y, z))
+    expected = [[[shapes.children.index(c) if c else -1
+                  for c in (shapes.child_at(xi, yi, zi) for zi in z)]
+                 for yi in y] for xi in x]
+    labels = shapes.labels(*shapes.axes(17, 13, 9), nodes=nodes, block=4)
+    assert labels.dtype == np.int8
+    assert np.array_equal(labels, expected)
+    assert np.array_equal(shapes.labels(*shapes.grid(17, 13, 9), nodes=nodes),
+                          labels)
+    x, y, z = shapes.axes(17, 13, 9)
+    assert np.array_equal(shapes.labels(x, y[::-1], z[::-1], nodes=nodes),
+                          labels[:, ::-1, ::-1])
+    with pytest.raises(Exception):
+        shapes.labels(x[[0, 2, 1, 3]], y, z, nodes=nodes)
+
+
+def test_select_conductors(shapes):
+    x, y, z = shapes.axes(17, 13, 9)
+    er = shapes.select('er', x, y, z, dtype=np.float32)
+    assert er.shape == (16, 12, 8)
+    assert er.dtype == np.float32
+    assert set(np.unique(er)) == {0.0, 2.0, 5.0}
+    bc_bool, bc_val = shapes.conductors(x, y, z)
+    assert bc_bool.dtype == bool
+    assert bc_val[bc_bool].min() == -1.0
+    assert bc_val[bc_bool].max() == 1.0
+    assert not bc_val[~bc_bool].any()
+
+
+def test_bounds():
+    geom = gm.Geometry()
+    with pytest.raises(Exception):
+        geom.bounds()
+    geom.add_child(gm.Cylinder(0.0, 0.0, 0.0, 1.0, 4.0, axis='y'))
+    geom.add_child(gm.Sphere(2.0, 0.0, 0.0, 0.5))
+    assert geom.bounds() == approx((-1.0, 2.5, -2.0, 2.0, -1.0, 1.0))
+    with pytest.raises(Exception):
+        gm.Cylinder(0.0, 0.0, 0.0, 1.0, 4.0, axis='r')
+
+
+def test_poisson_3d_sphere():
+    ri = 2.0e-3
+    ro = 4.0e-3
+    Va = 10.0
+    outer = gm.Box(-1.1 * ro, -1.1 * ro, -1.1 * ro, 2.2 * ro, 2.2 * ro, 2.2 * ro)
+    outer.params['voltage'] = 0.0
+    space = gm.Sphere(0.0, 0.0, 0.0, ro)
+    space.positive = False
+    inner = gm.Sphere(0.0, 0.0, 0.0, ri)
+    inner.params['voltage'] = Va
+    geom = gm.Geometry()
+    for child in (outer, space, inner):
+        geom.add_child(child)
+    X, Y, Z = geom.grid(61, 61, 61)
+    bc = geom.conductors(X, Y, Z)
+    R = np.sqrt(X**2 + Y**2 + Z**2)
+    assert np.array_equal(bc[0], (R <= ri) | (R > ro))
+    assert bc[1] == approx(np.where(R <= ri, Va, 0.0))
+    expected = SphereCapacitor(ri, 1.0, ro - ri).potential(X, Y, Z, Va=Va)
+    potential = fdm.poisson_3d(X, Y, Z, bc=bc, conv=1e-5)
+    assert potential == approx(expected, abs=0.9)
+
+
+def test_conductor_labels(shapes):
+    x, y, z = (np.linspace(0, n / 4, n + 1) for n in (16, 12, 10))
+    labels, voltages = shapes.conductor_labels(x, y, z)
+    assert labels.dtype == np.int8
+    assert voltages == approx([np.nan, np.nan, 1.0, -1.0], nan_ok=True)
+    er = shapes.select('er', x, y, z, dtype=np.float32) + 1
+    V = fdm.poisson_3d(x, y, z, dielectric=er, bc=(labels, voltages),
+                       conv=1e-6)
+    X, Y, Z = np.meshgrid(x, y, z, indexing='ij')
+    expected = fdm.poisson_3d(X, Y, Z, dielectric=er, conv=1e-6,
+                              bc=shapes.conductors(X, Y, Z))
+    assert V == approx(expected)
@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+
+import numpy as np
+import pytest
+from pytest import approx
+import emtoolbox.fields.scattering as sc
+import emtoolbox.fields.multi_scattering as ms
+
+
+@pytest.fixture
+def grid():
+    x = np.linspace(-3, 3, 31)
+    X, Y = np.meshgrid(x, x)
+    return X, Y, np.hypot(X, Y), np.arctan2(Y, X)
+
+
+def circle(cylinder, scale, n=24):
+    t = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    return (cylinder.x + scale * cylinder.radius * np.cos(t),
+            cylinder.y + scale * cylinder.radius * np.sin(t))
+
+
+@pytest.mark.parametrize('er', [None, 4.0 - 1.0j])
+def test_single_cylinder(grid, er):
+    X, Y, R, phi = grid
+    system = ms.MultipleScattering([ms.Cylinder(0.0, 0.0, 1.0, er=er)], 1.0)
+    Ei, Es, Et = system.field(X, Y, 0.0)
+    assert Ei[..., 0] == approx(sc.cyl_wave(R, phi, 1.0), abs=1e-5)
+    if er is None:
+        expected = sc.scatter_conducting_cylinder(R, phi, 1.0, 1.0)
+        assert Es[..., 0] == approx(expected, abs=1e-9)
+    else:
+        _, expected = sc.scatter_dielectric_cylinder(R, phi, 1.0, 1.0, er=er)
+        assert Es[R >= 1, 0] == approx(expected[R >= 1], abs=1e-9)
+        assert Et[R < 1, 0] == approx(expected[R < 1], abs=1e-9)
+
+
+def test_rotated_incidence(grid):
+    X, Y, R, phi = grid
+    system = ms.MultipleScattering([ms.Cylinder(0.3, -0.2, 1.0)], 1.0)
+    _, Es, _ = system.field(X + 0.3, Y - 0.2, [np.pi / 2])
+    expected = sc.scatter_conducting_cylinder(R, phi - np.pi / 2, 1.0, 1.0)
+    assert Es[..., 0] == approx(np.exp(0.4j * np.pi) * expected, abs=1e-9)
+
+
+@pytest.mark.parametrize('method', ['dense', 'gmres'])
+def test_boundary_conditions(method):
+    cylinders = [ms.Cylinder(0.0, 0.0, 0.5),
+                 ms.Cylinder(1.3, 0.4, 0.3),
+                 ms.Cylinder(-0.5, 1.4, 0.2, er=3.0)]
+    system = ms.MultipleScattering(cylinders, 1.0, N=15, method=method)
+    angles = [0.0, 1.0, 2.0]
+    for cylinder in cylinders[:2]:
+        _, _, Et = system.field(*circle(cylinder, 1 + 1e-9), angles)
+        assert Et == approx(0, abs=1e-6)
+    outside = system.field(*circle(cylinders[2], 1 + 1e-9), angles)[2]
+    inside = system.field(*circle(cylinders[2], 1 - 1e-9), angles)[2]
+    assert inside == approx(outside, abs=1e-6)
+
+
+def test_batched_angles():
+    cylinders = [ms.Cylinder(x, 0.0, 0.1) for x in np.arange(5) * 0.4]
+    system = ms.MultipleScattering(cylinders, 1.0)
+    angles = np.linspace(0, np.pi, 7)
+    b = system.solve(angles)
+    for k, angle in enumerate(angles):
+        assert b[:, k] == approx(system.solve(angle)[:, 0])
+    # Reciprocity of the far field, F(phi; theta) = F(theta + pi; phi + pi)
+    F = system.far_field(angles + np.pi, angles)
+    assert F == approx(F.T)
+
+
+def test_far_field():
+    cylinders = [ms.Cylinder(0.0, 0.0, 0.5), ms.Cylinder(1.0, 0.5, 0.2)]
+    system = ms.MultipleScattering(cylinders, 1.0)
+    phi = np.linspace(0, 2 * np.pi, 7)
+    rho = 1e6
+    _, Es, _ = system.field(rho * np.cos(phi), rho * np.sin(phi), 0.3)
+    k = system.k
+    F = Es[:, 0] / (np.sqrt(2j / (np.pi * k * rho)) * np.exp(-1j * k * rho))
+    assert system.far_field(phi, 0.3)[:, 0] == approx(F, rel=1e-4)
+    assert system.echo_width(phi, 0.3)[:, 0] == approx(4 / k * abs(F)**2,
+                                                       rel=1e-3)
+
+
+def test_overlap():
+    with pytest.raises(ValueError):
+        ms.MultipleScattering([ms.Cylinder(0.0, 0.0, 0.5),
+                               ms.Cylinder(0.8, 0.0, 0.5)], 1.0)
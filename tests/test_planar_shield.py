@@ -67,3 +67,91 @@ def test_absorption(ur, cond_r, result):
     shld = ps.Material(ur=ur, cond=(cond_r * COND_CU), thickness=t)
     se_db = ps.db(ps.absorption_loss(f, shld))
     assert se_db == approx(result, rel=0.01)
+
+
+@pytest.fixture
+def metals():
+    thk = 0.25e-3
+    return [ps.Material(cond=11.8e6, thickness=thk),
+            ps.Material(ur=10.58, cond=2.3e6, thickness=thk),
+            ps.Material(ur=95, cond=1.3e6, thickness=thk),
+            ps.Material(er=4.0, cond=0.04, thickness=0.5)]
+
+
+def test_multilayer_single_slab(metals):
+    f = np.logspace(4, 9, 20)
+    air = ps.Material()
+    layers = ps.stackup_layers([[mat] for mat in metals])
+    se = ps.multilayer_shielding_db(f, air, layers)
+    assert se.shape == (20, 4)
+    for k, mat in enumerate(metals):
+        expected = ps.db(ps.shielding_effectiveness(f, air, mat))
+        assert se[:, k] == approx(expected)
+
+
+def test_multilayer_split_layers(metals):
+    f = np.logspace(4, 9, 20)
+    air = ps.Material()
+    copper = metals[0]
+    half = ps.Material(cond=copper.cond, thickness=copper.thickness / 2)
+    layers = ps.stackup_layers([[copper], [half, half], metals[:3]])
+    assert layers.thickness.shape == (3, 3)
+    se = ps.multilayer_shielding_db(f, air, layers)
+    assert se[:, 1] == approx(se[:, 0])
+    assert np.all(se[:, 2] > se[:, 0])
+
+
+def test_multilayer_thick():
+    # Linear shielding effectiveness overflows, the dB result does not
+    steel = ps.Material(ur=95, cond=1.3e6, thickness=5e-3)
+    se = ps.multilayer_shielding_db(np.array([1e9]), ps.Material(),
+                                    ps.stackup_layers([[steel]]))
+    f = 1e9
+    expected = (ps.db(ps.reflection_loss(f, ps.Material(), steel))
+                + 20 * steel.thickness / steel.skin_depth(f) / np.log(10))
+    assert se[0, 0] == approx(expected, rel=1e-6)
+
+
+@pytest.mark.parametrize('polarization', ['TE', 'TM'])
+def test_oblique_normal_incidence(metals, polarization):
+    f = np.logspace(4, 9, 20)
+    air = ps.Material()
+    theta = np.deg2rad([-30, 0, 30])
+    se = ps.oblique_shielding_db(f, theta, air, metals[0], polarization)
+    assert se.shape == (3, 20)
+    expected = ps.db(ps.shielding_effectiveness(f, air, metals[0]))
+    assert se[1] == approx(expected)
+    assert se[0] == approx(se[2])
+
+
+@pytest.mark.parametrize('polarization', ['TE', 'TM'])
+def test_oblique_dielectric_slab(polarization):
+    # Lossless slab, Fresnel coefficients with multiple reflections
+    f = np.array([1e9, 3e9])
+    theta = np.deg2rad([0, 30, 60, 85])
+    n, thk = 2.0, 0.05
+    slab = ps.Material(er=n**2, thickness=thk)
+    se = ps.oblique_shielding_db(f, theta, ps.Material(), slab, polarization)
+    ci = np.cos(theta)[:, np.newaxis]
+    ct = np.sqrt(1 - (np.sin(theta)[:, np.newaxis] / n)**2)
+    if polarization == 'TE':
+        r = (ci - n * ct) / (ci + n * ct)
+    else:
+        r = (n * ci - ct) / (n * ci + ct)
+    phase = 2 * np.pi * f * np.sqrt(ps.MU0 * ps.EPS0) * n * ct * thk
+    t = (1 - r**2) * np.exp(-1j * phase) / (1 - r**2 * np.exp(-2j * phase))
+    assert se == approx(-ps.db(np.abs(t)))
+
+
+def test_oblique_stackups(metals):
+    f = np.logspace(4, 9, 5)
+    theta = np.deg2rad(np.linspace(-89, 89, 7))
+    layers = ps.stackup_layers([metals[:1], metals[:2], metals[:3]])
+    se = ps.oblique_shielding_db(f, theta, ps.Material(), layers, 'TM')
+    assert se.shape == (7, 5, 3)
+    worst = ps.reduce_angles(se)
+    average = ps.reduce_angles(se, 'average')
+    assert worst == approx(se.min(axis=0))
+    assert np.all(average >= worst)
+    with pytest.raises(ValueError):
+        ps.oblique_shielding_db(f, theta, ps.Material(), layers, 'TEM')
@@ -64,6 +64,47 @@ def test_poisson_1d_unity_dielectric():
     assert V == approx(Ver)
 
 
+def test_poisson_1d_batch():
+    X = np.linspace(0, 1, 41)
+    er = np.ones((3, 40))
+    er[1, 10:25] = 4.0
+    er[2, :] = np.linspace(1.0, 5.0, 40)
+    bc_bool = np.zeros(41, dtype=bool)
+    bc_bool[30] = True
+    bc = (bc_bool, np.full(41, 2.0))
+    V = fdm.poisson_1d(X, dielectric=er, v_left=[0.0, 1.0, 3.0], v_right=10.0,
+                       bc=bc)
+    assert V.shape == (3, 41)
+    for k, v0 in enumerate((0.0, 1.0, 3.0)):
+        Vsor = fdm.poisson_1d(X, dielectric=er[k], v_left=v0, v_right=10.0,
+                              bc=bc, method='sor', conv=1e-10)
+        assert V[k] == approx(Vsor, abs=1e-6)
+    assert V[:, 30] == approx(2.0)
+    with pytest.raises(Exception):
+        fdm.poisson_1d(X, method='multigrid')
+
+
+@pytest.mark.parametrize('method', ['direct', 'sor'])
+def test_poisson_1d_charge(method):
+    X = np.linspace(0, 1, 21)
+    charge = np.full(21, 4.0)
+    expected = 2.0 * X * (1 - X)
+    V = fdm.poisson_1d(X, charge=charge, method=method, conv=1e-9)
+    assert V == approx(expected, abs=1e-6)
+    # A stack of charge with a shared dielectric, then with one each
+    V = fdm.poisson_1d(X, charge=[charge, -2 * charge],
+                       dielectric=np.full(20, 2.0), method=method, conv=1e-9)
+    assert V.shape == (2, 21)
+    assert V[0] == approx(0.5 * expected, abs=1e-6)
+    assert V[1] == approx(-expected, abs=1e-6)
+    er = np.array([np.full(20, 1.0), np.full(20, 4.0)])
+    V = fdm.poisson_1d(X, charge=charge, dielectric=er, method=method,
+                       conv=1e-9)
+    assert V[1] == approx(0.25 * expected, abs=1e-6)
+    with pytest.raises(Exception):
+        fdm.poisson_1d(X, charge=np.ones((3, 21)), dielectric=er)
+
+
 def test_poisson_2d():
     w = 2.0
     h = 1.0
@@ -241,6 +282,24 @@ def test_poisson_2d_coax():
     assert potential == approx(expected, abs=0.4)
 
 
+def test_poisson_2d_axes_labels():
+    x = np.linspace(0, 1, 5)
+    labels = np.full((5, 5), -1, dtype=np.int8)
+    labels[2, 2] = 1
+    labels[1:4, 4] = 0
+    V = fdm.poisson_2d(x, x, bc=(labels, [3.0, 12.0]), conv=1e-6, sor=1)
+    bc_val = np.zeros((5, 5))
+    bc_val[2, 2] = 12.0
+    bc_val[1:4, 4] = 3.0
+    X, Y = np.meshgrid(x, x, indexing='ij')
+    expected = fdm.poisson_2d(X, Y, bc=(labels >= 0, bc_val), conv=1e-6, sor=1)
+    assert V == approx(expected)
+    with pytest.raises(Exception):
+        fdm.poisson_2d(x, np.linspace(0, 2, 5))
+    with pytest.raises(Exception):
+        fdm.poisson_2d(x, x, bc=(labels[1:], [3.0, 12.0]))
+
+
 def test_poisson_2d_coax_2layer():
     ri = 2.0e-3
     re = 2.8e-3
@@ -277,6 +336,164 @@ def test_poisson_2d_dielectric():
     assert V1 == approx(V2)
 
 
+@pytest.mark.parametrize('check', [1, 10])
+def test_poisson_sor_auto(check):
+    x = np.linspace(-1, 1, 81)
+    X, Y = np.meshgrid(x, x, indexing='ij')
+    R = np.sqrt(X**2 + Y**2)
+    er = np.where(R < 0.7, 3.0, 1.0)[:-1, :-1]
+    bc = (np.logical_or(R < 0.4, R > 0.95), np.where(R < 0.4, 1.0, 0.0))
+    V = fdm.poisson_2d(x, x, dielectric=er, bc=bc, conv=1e-9, sor='auto',
+                       check=check)
+    Vsor = fdm.poisson_2d(x, x, dielectric=er, bc=bc, conv=1e-9)
+    assert V == approx(Vsor, abs=1e-6)
+    x = np.linspace(-1, 1, 21)
+    V = fdm.poisson_3d(x, x, x, v_top=1.0, conv=1e-9, sor='auto', check=check)
+    assert V == approx(fdm.poisson_3d(x, x, x, v_top=1.0, method='dst'),
+                       abs=1e-6)
+    V = fdm.poisson_1d(x, v_right=1.0, method='sor', sor='auto', conv=1e-9,
+                       check=check)
+    assert V == approx(0.5 * (x + 1), abs=1e-6)
+    with pytest.raises(Exception):
+        fdm.poisson_2d(x, x, sor=2.0)
+    for bad in (0, -1, 2.5):
+        with pytest.raises(Exception):
+            fdm.poisson_2d(x, x, check=bad)
+        with pytest.raises(Exception):
+            fdm.poisson_axi(x, x, check=bad)
+
+
+def test_prolong():
+    x = np.linspace(0, 1, 9)
+    X, Y, Z = np.meshgrid(x, x, x, indexing='ij')
+    V = 1 + 2 * X - Y + 3 * Z
+    axes, er, bc = fdm.coarse_grid((X, Y, Z), np.ones((8, 8, 8)),
+                                   (V > 2, V))
+    assert axes[0].shape == (5, 5, 5)
+    assert er.shape == (4, 4, 4)
+    assert bc[0].shape == bc[1].shape == (5, 5, 5)
+    assert fdm.prolong(V[::2, ::2, ::2]) == approx(V)
+    with pytest.raises(Exception):
+        fdm.coarse_grid((x[:-1], x[:-1]))
+
+
+@pytest.mark.parametrize('method', ['sor', 'cg'])
+def test_poisson_2d_nested(method):
+    x = np.linspace(-1, 1, 81)
+    X, Y = np.meshgrid(x, x, indexing='ij')
+    R = np.sqrt(X**2 + Y**2)
+    er = np.where(R < 0.7, 3.0, 1.0)[:-1, :-1]
+    bc = (np.logical_or(R < 0.4, R > 0.95), np.where(R < 0.4, 1.0, 0.0))
+    V = fdm.poisson_2d(x, x, dielectric=er, bc=bc, conv=1e-9, method=method)
+    Vn = fdm.poisson_2d(x, x, dielectric=er, bc=bc, conv=1e-9, method=method,
+                        nested=2)
+    assert Vn == approx(V, abs=1e-6)
+    Vi = fdm.poisson_2d(x, x, dielectric=er, bc=bc, conv=1e-9, method=method,
+                        initial=V)
+    assert Vi == approx(V, abs=1e-6)
+    with pytest.raises(Exception):
+        fdm.poisson_2d(x, x, initial=V[1:])
+
+
+@pytest.mark.parametrize('sor', [1.8, 'auto'])
+def test_poisson_3d_tiled(sor):
+    x = np.linspace(-1, 1, 25)
+    X, Y, Z = np.meshgrid(x, x, x, indexing='ij')
+    R = np.sqrt(X**2 + Y**2 + Z**2)
+    er = np.where(R < 0.7, 3.0, 1.0)[:-1, :-1, :-1]
+    bc = (R < 0.4, np.ones_like(R))
+    V = fdm.poisson_3d(x, x, x, dielectric=er, bc=bc, v_top=-1.0, conv=1e-9,
+                       sor=sor, tiled=True, tile=5)
+    Vsor = fdm.poisson_3d(x, x, x, dielectric=er, bc=bc, v_top=-1.0,
+                          conv=1e-9)
+    assert V == approx(Vsor, abs=1e-6)
+    bc = (bc[0][12:], bc[1][12:])
+    V = fdm.poisson_3d(x[12:], x, x, bc=bc, v_top=-1.0, conv=1e-9, xsym=True,
+                       sor=sor, tiled=True)
+    Vsor = fdm.poisson_3d(x[12:], x, x, bc=bc, v_top=-1.0, conv=1e-9,
+                          xsym=True)
+    assert V == approx(Vsor, abs=1e-6)
+
+
+def test_poisson_3d_nested():
+    x = np.linspace(-1, 1, 21)
+    V = fdm.poisson_3d(x, x, x, v_top=1.0, v_left=-1.0, conv=1e-9, nested=1)
+    Vd = fdm.poisson_3d(x, x, x, v_top=1.0, v_left=-1.0, conv=1e-9)
+    assert V == approx(Vd, abs=1e-6)
+
+
+def test_poisson_2d_dst():
+    x = np.linspace(0, 2.0, 41)
+    y = np.linspace(0, 1.0, 21)
+    X, Y = np.meshgrid(x, y, indexing='ij')
+    bc = {'v_top': 10, 'v_left': 5, 'v_right': -2, 'v_bottom': -4}
+    V = fdm.poisson_2d(X, Y, **bc, method='dst')
+    assert V == approx(fdm.poisson_2d(X, Y, **bc, conv=1e-9), abs=1e-6)
+    V = fdm.poisson_2d(x, y, v_top=10, xsym=True, method='dst')
+    Vsor = fdm.poisson_2d(x, y, v_top=10, xsym=True, conv=1e-9)
+    assert V == approx(Vsor, abs=1e-6)
+    with pytest.raises(Exception):
+        fdm.poisson_2d(X, Y, bc=(X > 1, X), method='dst')
+
+
+@pytest.mark.parametrize('xsym', [False, True])
+def test_poisson_2d_cg(xsym):
+    ri, re, ro = 2.0e-3, 2.8e-3, 4.0e-3
+    w = 1.1 * ro
+    x = np.linspace(-w * (not xsym), w, 41 if xsym else 81)
+    y = np.linspace(-w, w, 81)
+    X, Y = np.meshgrid(x, y, indexing='ij')
+    R = np.sqrt(X**2 + Y**2)
+    er = np.where(R <= re, 4.0, 1.0)[:-1, :-1]
+    bc = (np.logical_or(R < ri, R > ro), np.where(R < ri, 10.0, 0))
+    V = fdm.poisson_2d(X, Y, dielectric=er, bc=bc, xsym=xsym, conv=1e-9,
+                       method='cg')
+    cc = CoaxCapacitor(ri, (4.0, 1.0), (re - ri, ro - re))
+    assert V == approx(cc.potential(X, Y, Va=10.0), abs=0.6)
+    if not xsym:
+        # The SOR symmetry plane ignores the dielectric
+        Vsor = fdm.poisson_2d(X, Y, dielectric=er, bc=bc, conv=1e-9)
+        assert V == approx(Vsor, abs=1e-5)
+
+
+@pytest.mark.parametrize('precond', ['dst', 'jacobi', 'ssor', 'chebyshev'])
+def test_poisson_3d_cg(precond):
+    x = np.linspace(-1, 1, 21)
+    X, Y, Z = np.meshgrid(x, x, x, indexing='ij')
+    R = np.sqrt(X**2 + Y**2 + Z**2)
+    er = np.where(R < 0.7, 3.0, 1.0)[:-1, :-1, :-1]
+    bc = (R < 0.4, np.ones_like(R))
+    V = fdm.poisson_3d(x, x, x, dielectric=er, bc=bc, v_top=-1.0, conv=1e-9,
+                       method='cg', precond=precond)
+    Vsor = fdm.poisson_3d(x, x, x, dielectric=er, bc=bc, v_top=-1.0, conv=1e-9)
+    assert V == approx(Vsor, abs=1e-5)
+    with pytest.raises(Exception):
+        fdm.poisson_3d(x, x, x, method='multigrid')
+
+
+def test_pcg_history():
+    from emtoolbox.fields.poisson_fast import face_weights, free_nodes, pcg
+    x = np.linspace(0, 1, 41)
+    X, Y = np.meshgrid(x, x, indexing='ij')
+    er = np.where(X < 0.5, 2.0, 5.0)[:-1, :-1]
+    counts = {}
+    for precond in ('jacobi', 'ssor', 'chebyshev', 'dst'):
+        V = np.where(Y == 1.0, 1.0, 0.0)
+        V[[0, -1], -1] = 0.5
+        free = free_nodes(V.shape)
+        V, history = pcg(V, free, face_weights(V.shape, er), precond,
+                         conv=1e-10, scale=3.5)
+        assert history[0] == approx(1.0)
+        assert history[-1] < 1e-10
+        assert V == approx(fdm.poisson_2d(x, x, v_top=1.0, dielectric=er,
+                                          conv=1e-10), abs=1e-7)
+        counts[precond] = len(history) - 1
+    assert counts['ssor'] < counts['jacobi']
+    assert counts['chebyshev'] < counts['jacobi']
+    with pytest.raises(Exception):
+        pcg(V, free, face_weights(V.shape, er), 'ilu')
+
+
 def test_gauss_2d_coax():
     ri = 1.0e-3
     ro = 4.0e-3
@@ -459,6 +676,189 @@ def test_poisson_3d_sphere():
     assert potential == approx(expected, abs=0.8)
 
 
+def test_poisson_3d_open():
+    ri = 1.0e-3
+    Va = 10.0
+    x = np.linspace(-4 * ri, 4 * ri, 41)
+    X, Y, Z = np.meshgrid(x, x, x, indexing='ij')
+    R = np.sqrt(X**2 + Y**2 + Z**2)
+    bc = (R <= ri, np.where(R <= ri, Va, 0.0))
+    V = fdm.poisson_3d(x, x, x, bc=bc, conv=1e-6, open_bc=1)
+    # Isolated sphere, V proportional to 1 / r, reduced by the staircase
+    assert V[-1, 20, 20] / V[30, 20, 20] == approx(0.5, rel=0.01)
+    assert V[-1, -1, -1] / V[30, 20, 20] == approx(2 / np.sqrt(48), rel=0.02)
+    assert V[30, 20, 20] == approx(Va / 2, rel=0.1)
+    with pytest.raises(Exception):
+        fdm.poisson_3d(x, x, x, bc=bc, method='cg', open_bc=1)
+
+
+def test_poisson_2d_open_dielectric():
+    # Wire pair on the face of a dielectric slab filling y < 0, meeting the
+    # open edges at x = -5 and 5. The field is that without the slab
+    x = np.linspace(-5, 5, 41)
+    X, Y = np.meshgrid(x, x, indexing='ij')
+    w1 = np.hypot(X - 1.5, Y) <= 0.5
+    w2 = np.hypot(X + 1.5, Y) <= 0.5
+    bc = (w1 | w2, np.where(w1, 1.0, -1.0))
+    er = np.where(Y[1:, 1:] <= 0, 4.0, 1.0)
+    V = fdm.poisson_2d(x, x, bc=bc, conv=1e-9, open_bc=1)
+    Ver = fdm.poisson_2d(x, x, bc=bc, dielectric=er, conv=1e-9, open_bc=1)
+    assert Ver == approx(V, abs=1e-6)
+    # Edge node on the face, the slab side taking 4 times the weight
+    labels, fixed = fdm.boundary_labels(bc, V)
+    index, neighbours, weights = fdm.open_boundary(
+        (x, x), labels, fixed, True, (False, False), 1, dielectric=er)
+    m = list(index).index(np.ravel_multi_index((40, 20), V.shape))
+    assert weights[m, 2] == approx(4 * weights[m, 3])
+    assert weights[m, 0] == approx(weights[m, 1])
+    _, _, uniform = fdm.open_boundary((x, x), labels, fixed, True,
+                                      (False, False), 1)
+    _, _, scaled = fdm.open_boundary((x, x), labels, fixed, True,
+                                     (False, False), 1,
+                                     dielectric=np.full_like(er, 3.0))
+    assert scaled == approx(uniform)
+
+
+@pytest.mark.parametrize('sor', [1.8, 'auto'])
+def test_poisson_2d_periodic(sor):
+    p = 1.0
+    h = 0.5
+    k = 2 * np.pi / p
+    x = np.linspace(0, p, 41)
+    y = np.linspace(0, h, 21)
+    X, Y = np.meshgrid(x, y, indexing='ij')
+    bc_bool = Y == 0
+    bc_val = np.where(bc_bool, np.sin(k * X + 0.3), 0)
+    expected = np.sin(k * X + 0.3) * np.sinh(k * (h - Y)) / np.sinh(k * h)
+    V = fdm.poisson_2d(x, y, bc=(bc_bool, bc_val), sor=sor, conv=1e-7,
+                       periodic='x')
+    assert V == approx(expected, abs=1e-3)
+    with pytest.raises(Exception):
+        fdm.poisson_2d(x, y, bc=(bc_bool, bc_val), periodic='x', xsym=True)
+
+
+@pytest.mark.parametrize('tiled', [False, True])
+def test_poisson_3d_periodic(tiled):
+    p = 1.0
+    h = 0.5
+    k = 2 * np.pi / p
+    x = np.linspace(0, p, 21)
+    z = np.linspace(0, h, 11)
+    X, Y, Z = np.meshgrid(x, x, z, indexing='ij')
+    bc_bool = Z == 0
+    bc_val = np.where(bc_bool, np.sin(k * X) * np.cos(k * Y), 0)
+    kz = np.sqrt(2) * k
+    expected = (np.sin(k * X) * np.cos(k * Y) * np.sinh(kz * (h - Z))
+                / np.sinh(kz * h))
+    V = fdm.poisson_3d(x, x, z, bc=(bc_bool, bc_val), conv=1e-7,
+                       periodic='xy', tiled=tiled)
+    assert V == approx(expected, abs=5e-3)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {}, {'sor': 'auto'}, {'xsym': True}, {'method': 'dst'},
+    {'method': 'cg'}, {'method': 'cg', 'xsym': True, 'precond': 'jacobi'}])
+def test_poisson_2d_charge(kwargs):
+    x = np.linspace(0, 1, 41)
+    X, Y = np.meshgrid(x, x, indexing='ij')
+    if kwargs.get('xsym'):
+        # Symmetry plane at x = 0
+        expected = np.cos(0.5 * np.pi * X) * np.sin(np.pi * Y)
+        k2 = 1.25 * np.pi**2
+    else:
+        expected = np.sin(np.pi * X) * np.sin(np.pi * Y)
+        k2 = 2 * np.pi**2
+    charge = k2 * expected
+    V = fdm.poisson_2d(x, x, charge=charge, conv=1e-9, **kwargs)
+    assert V == approx(expected, abs=1e-3)
+    V = fdm.poisson_2d(x, x, charge=[charge, -charge], conv=1e-9, **kwargs)
+    assert V.shape == (2, 41, 41)
+    assert V[0] == approx(expected, abs=1e-3)
+    assert V[1] == approx(-expected, abs=1e-3)
+
+
+def test_poisson_2d_charge_dielectric():
+    x = np.linspace(0, 1, 41)
+    X, Y = np.meshgrid(x, x, indexing='ij')
+    expected = np.sin(2 * np.pi * X) * np.sin(np.pi * Y)
+    charge = 10 * np.pi**2 * expected
+    er = np.full((40, 40), 2.0)
+    V = fdm.poisson_2d(x, x, charge=charge, dielectric=er, conv=1e-9,
+                       periodic='x')
+    assert V == approx(expected, abs=3e-3)
+    with pytest.raises(Exception):
+        fdm.poisson_2d(x, x, charge=charge[1:])
+
+
+@pytest.mark.parametrize('kwargs', [
+    {}, {'tiled': True}, {'tiled': True, 'zsym': True}, {'method': 'dst'},
+    {'method': 'cg'}])
+def test_poisson_3d_charge(kwargs):
+    x = np.linspace(0, 1, 21)
+    X, Y, Z = np.meshgrid(x, x, x, indexing='ij')
+    if kwargs.get('zsym'):
+        expected = (np.sin(np.pi * X) * np.sin(np.pi * Y)
+                    * np.cos(0.5 * np.pi * Z))
+        k2 = 2.25 * np.pi**2
+    else:
+        expected = np.sin(np.pi * X) * np.sin(np.pi * Y) * np.sin(np.pi * Z)
+        k2 = 3 * np.pi**2
+    charge = k2 * expected
+    V = fdm.poisson_3d(x, x, x, charge=[charge, 2 * charge], conv=1e-9,
+                       **kwargs)
+    assert V[0] == approx(expected, abs=3e-3)
+    assert V[1] == approx(2 * expected, abs=6e-3)
+
+
+def test_poisson_axi_sphere():
+    ri = 2.0e-3
+    ro = 4.0e-3
+    r = np.linspace(0, 1.1 * ro, 81)
+    R, Z = np.meshgrid(r, r, indexing='ij')
+    D = np.sqrt(R**2 + Z**2)
+    bc = (np.logical_or(D < ri, D > ro), np.where(D < ri, 10.0, 0.0))
+    V = fdm.poisson_axi(R, Z, bc=bc, zsym=True, conv=1e-9)
+    sc = SphereCapacitor(ri, 1.0, ro - ri)
+    assert V == approx(sc.potential(R, np.zeros_like(R), Z, Va=10.0), abs=0.3)
+    k = np.searchsorted(r, 2.6e-3)
+    Q = fdm.gauss_axi(R, Z, V, None, 0, k, 0, k, zsym=True)
+    assert Q == approx(sc.charge(10.0), rel=0.03)
+
+
+def test_poisson_axi_coax():
+    ri, re, ro = 1.0e-3, 2.0e-3, 3.0e-3
+    r = np.linspace(0, ro, 31)
+    z = np.linspace(-1.0e-3, 1.0e-3, 21)
+    R, Z = np.meshgrid(r, z, indexing='ij')
+    cc = CoaxCapacitor(ri, (4.0, 1.0), (re - ri, ro - re))
+    V_exact = cc.potential(R, np.zeros_like(R), Va=1.0)
+    er = np.where(R[1:, 1:] <= re, 4.0, 1.0)
+    bc = (np.logical_or(R <= ri, abs(Z) == Z.max()), V_exact)
+    V = fdm.poisson_axi(r, z, bc=bc, dielectric=er, conv=1e-10, sor='auto')
+    assert V == approx(V_exact, abs=1e-4)
+    Q = fdm.gauss_axi(r, z, V, er, 0, 15, 1, 19)
+    assert Q == approx(cc.capacitance() * (z[19] - z[0]), rel=1e-3)
+    Vs = fdm.poisson_axi(r, z[10:], bc=(bc[0][:, 10:], V_exact[:, 10:]),
+                         dielectric=er[:, 10:], conv=1e-10, zsym=True)
+    assert Vs == approx(V[:, 10:], abs=1e-6)
+
+
+def test_poisson_axi_charge():
+    # Uniform charge in a grounded cylinder, V = charge (R^2 - r^2) / 4
+    r = np.linspace(0, 1, 21)
+    z = np.linspace(0, 1, 21)
+    R, Z = np.meshgrid(r, z, indexing='ij')
+    expected = 1 - R**2
+    bc = (Z == 1, expected)
+    charge = np.full(R.shape, 4.0)
+    V = fdm.poisson_axi(r, z, charge=charge, bc=bc, zsym=True, conv=1e-10)
+    assert V == approx(expected, abs=1e-6)
+    er = np.full((20, 20), 2.0)
+    V = fdm.poisson_axi(r, z, charge=[charge, 2 * charge], bc=bc, zsym=True,
+                        dielectric=er, conv=1e-10, sor='auto')
+    assert V[1] == approx(expected, abs=1e-6)
+
+
 def test_poisson_3d_sphere_2layer():
     ri = 2.0e-3
     re = 2.8e-3
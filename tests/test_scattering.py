@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+
+import numpy as np
+import pytest
+from pytest import approx
+import emtoolbox.fields.scattering as sc
+
+
+@pytest.fixture
+def grid():
+    x = np.linspace(-4, 4, 41)
+    X, Y = np.meshgrid(x, x)
+    return X, Y, np.hypot(X, Y), np.arctan2(Y, X)
+
+
+def test_truncation_order():
+    assert sc.truncation_order(0) == 2
+    assert sc.truncation_order(27.0) == 41
+
+
+def test_cyl_wave(grid):
+    X, Y, R, phi = grid
+    Ez = sc.cyl_wave(R, phi, 1.0)
+    assert Ez.shape == R.shape
+    assert Ez == approx(np.exp(-2j * np.pi * X), abs=1e-5)
+
+
+def test_cyl_wave_near_origin():
+    r = np.array([0.0, 1e-6, 1e-3, 30.0])
+    expected = np.exp(-2j * np.pi * r * np.cos(0.5))
+    assert sc.cyl_wave(r, 0.5, 1.0) == approx(expected, abs=1e-5)
+
+
+def test_conducting_cylinder_boundary():
+    phi = np.linspace(-np.pi, np.pi, 37)
+    Ezs = sc.scatter_conducting_cylinder(np.full(37, 1.0), phi, 1.0, 1.0)
+    assert Ezs + sc.cyl_wave(1.0, phi, 1.0) == approx(0, abs=1e-9)
+
+
+@pytest.mark.parametrize('er', [4.0, 4.0 - 2.0j])
+def test_dielectric_cylinder_boundary(er):
+    phi = np.linspace(-np.pi, np.pi, 37)
+    a = 1.0
+    Ezint, _ = sc.scatter_dielectric_cylinder(np.full(37, a * (1 - 1e-9)), phi,
+                                              1.0, a, er=er)
+    _, Ezs = sc.scatter_dielectric_cylinder(np.full(37, a * (1 + 1e-9)), phi,
+                                            1.0, a, er=er)
+    assert Ezint == approx(Ezs + sc.cyl_wave(a, phi, 1.0), abs=1e-6)
+
+
+def test_dielectric_cylinder_vacuum(grid):
+    X, Y, R, phi = grid
+    Ezint, Ezs = sc.scatter_dielectric_cylinder(R, phi, 1.0, 1.0, er=1.0)
+    assert Ezs[R >= 1.0] == approx(0, abs=1e-12)
+    assert Ezint[R < 1.0] == approx(np.exp(-2j * np.pi * X[R < 1.0]), abs=1e-6)
+
+
+def test_dielectric_cylinder_internal(grid):
+    X, Y, R, phi = grid
+    Ezint, Ezs = sc.scatter_dielectric_cylinder(R, phi, 1.0, 1.5, er=4 - 1j)
+    inside = R < 1.5
+    assert np.all(Ezint[~inside] == 0)
+    assert np.all(Ezint[inside] != 0)
+    assert Ezs[inside] == approx(Ezint[inside])
+
+
+def test_polar_matches_cartesian():
+    r = np.linspace(0, 4, 21)
+    n_phi = 32
+    R, phi = np.meshgrid(r, sc.polar_angles(n_phi), indexing='ij')
+    assert sc.cyl_wave_polar(r, n_phi, 1.0) == approx(sc.cyl_wave(R, phi, 1.0))
+    Ezs = sc.scatter_conducting_cylinder_polar(r, n_phi, 1.0, 1.0)
+    assert Ezs == approx(sc.scatter_conducting_cylinder(R, phi, 1.0, 1.0))
+    polar = sc.scatter_dielectric_cylinder_polar(r, n_phi, 1.0, 1.0, er=4 - 1j)
+    cartesian = sc.scatter_dielectric_cylinder(R, phi, 1.0, 1.0, er=4 - 1j)
+    assert polar[0] == approx(cartesian[0])
+    assert polar[1] == approx(cartesian[1])
+
+
+def test_polar_to_cartesian(grid):
+    X, Y, R, phi = grid
+    r = np.linspace(0, 4 * np.sqrt(2), 400)
+    Ez = sc.polar_to_cartesian(r, sc.cyl_wave_polar(r, 2048, 1.0), X, Y)
+    assert Ez == approx(np.exp(-2j * np.pi * X), abs=5e-3)